@@ -25,13 +25,55 @@ app.conf.beat_schedule = {
             'expires': 60 * 50 
         }
     },
-    'cleanup-old-suspicious-ips': {
-        'task': 'ip_tracking.tasks.cleanup_old_suspicious_ips',
+    'update-traffic-rollups': {
+        'task': 'ip_tracking.tasks.update_traffic_rollups',
+        'schedule': 60.0,
+        'options': {
+            'expires': 50
+        }
+    },
+    'process-abuse-reports': {
+        'task': 'ip_tracking.tasks.process_abuse_reports',
+        'schedule': 30.0,
+        'options': {
+            'expires': 25
+        }
+    },
+    'refresh-public-stats': {
+        'task': 'ip_tracking.tasks.refresh_public_stats',
+        'schedule': 60.0,
+        'options': {
+            'expires': 50
+        }
+    },
+    'load-request-segments': {
+        'task': 'ip_tracking.tasks.load_request_segments',
+        'schedule': 15.0,
+        'options': {
+            'expires': 10
+        }
+    },
+    'purge-expired-records': {
+        'task': 'ip_tracking.tasks.purge_expired_records',
         'schedule': 60.0 * 60 * 24,
         'options': {
             'expires': 60 * 60 * 12 
         }
     },
+    'summarize-traffic-hours': {
+        'task': 'ip_tracking.tasks.summarize_traffic_hours',
+        'schedule': 60.0 * 60,
+        'options': {
+            'expires': 60 * 50
+        }
+    },
+    'maintain-requestlog-partitions': {
+        'task': 'ip_tracking.tasks.maintain_requestlog_partitions',
+        'schedule': 60.0 * 60 * 24,
+        'options': {
+            'expires': 60 * 60 * 12
+        }
+    },
     'generate-security-report': {
         'task': 'ip_tracking.tasks.generate_security_report',
         'schedule': 60.0 * 60 * 24,
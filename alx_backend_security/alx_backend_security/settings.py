@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'django_ratelimit',
+    'rest_framework',
     'ip_tracking'
 ]
 
@@ -71,15 +72,46 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'alx_backend_security.wsgi.application'
 
+# The live event feed (api/events/) only streams under ASGI, e.g.
+# uvicorn alx_backend_security.asgi:application; under WSGI it answers 501
+ASGI_APPLICATION = 'alx_backend_security.asgi.application'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuning for write-heavy databases: WAL lets readers run alongside the
+# writer, synchronous=NORMAL skips the fsync per commit (still safe in WAL mode)
+# and IMMEDIATE transactions wait for the lock instead of failing to upgrade
+# a read lock mid-transaction. 'timeout' is the one busy timeout (seconds); a
+# PRAGMA busy_timeout in init_command would silently replace it.
+SQLITE_WRITE_OPTIONS = {
+    'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 20,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_WRITE_OPTIONS,
+    },
+    # Uncomment to keep the ip_tracking tables in their own database
+    # (see ip_tracking.routers and TRACKING_DATABASE below)
+    # 'tracking': {
+    #     'ENGINE': 'django.db.backends.sqlite3',
+    #     'NAME': BASE_DIR / 'tracking.sqlite3',
+    #     'OPTIONS': SQLITE_WRITE_OPTIONS,
+    # },
+}
+
+DATABASE_ROUTERS = ['ip_tracking.routers.TrackingRouter']
+
+# Database aliases for the ip_tracking tables; unconfigured aliases fall back to 'default'
+TRACKING_DATABASE = {
+    'ALIAS': 'tracking',      # Primary for every ip_tracking table
+    'REPLICAS': [],           # Read replicas for logs, rollups, summaries and reports
 }
 
 
@@ -189,8 +221,15 @@ CELERY_RESULT_EXPIRES = 60 * 60 * 24
 # Task Routes (optional - route specific tasks to specific queues)
 CELERY_TASK_ROUTES = {
     'ip_tracking.tasks.detect_suspicious_ips': {'queue': 'security'},
+    'ip_tracking.tasks.process_abuse_reports': {'queue': 'security'},
     'ip_tracking.tasks.cleanup_old_suspicious_ips': {'queue': 'maintenance'},
+    'ip_tracking.tasks.purge_expired_records': {'queue': 'maintenance'},
+    'ip_tracking.tasks.maintain_requestlog_partitions': {'queue': 'maintenance'},
+    'ip_tracking.tasks.update_traffic_rollups': {'queue': 'reports'},
+    'ip_tracking.tasks.refresh_public_stats': {'queue': 'reports'},
+    'ip_tracking.tasks.load_request_segments': {'queue': 'maintenance'},
     'ip_tracking.tasks.generate_security_report': {'queue': 'reports'},
+    'ip_tracking.tasks.summarize_traffic_hours': {'queue': 'reports'},
 }
 
 # Queue Configuration
@@ -218,6 +257,9 @@ CELERY_TASK_QUEUES = {
 # Rate Limiting Configuration
 RATELIMIT_ENABLE = True
 RATELIMIT_USE_CACHE = 'default'
+# The 'ip' key, reputation tiers and abuse reporters use REMOTE_ADDR. Behind a reverse proxy,
+# point RATELIMIT_IP_META_KEY at a callable that takes the client address from
+# the hop the proxy appended, never from the client-supplied start of the header
 
 # Rate limit settings
 RATELIMIT_SETTINGS = {
@@ -225,7 +267,185 @@ RATELIMIT_SETTINGS = {
     'ANONYMOUS_USER_RATE': '5/m',       # 5 requests per minute for anonymous users
     'LOGIN_RATE': '5/m',                # 5 login attempts per minute
     'SENSITIVE_ACTION_RATE': '3/m',     # 3 requests per minute for sensitive actions
+    'API_RATE': '60/m',                 # Read API requests per minute per user
+}
+
+# Rate limits tightened by SuspiciousIP risk tier (ip_tracking.reputation)
+REPUTATION_SETTINGS = {
+    'TIER_FACTORS': {'LOW': 0.5, 'MEDIUM': 0.25, 'HIGH': 0.1},   # Share of the base rate each tier gets
+    'LOCAL_TTL': 30,   # Seconds a process serves its in-memory map before checking the cache for a newer one
+}
+
+# GCRA limiter behind the ip_tracking views (ip_tracking.ratelimit); rates come from RATELIMIT_SETTINGS
+IP_TRACKING_RATELIMIT = {
+    'KEY_PREFIX': 'ip_tracking:rl:',
+    'LOCAL_PRECHECK': True,    # Reject keys Redis already rejected, until their retry time, without a round trip
+    'LOCAL_MAX_KEYS': 10000,   # Rejected keys remembered per process
+    'FAIL_OPEN': True,         # Allow requests when Redis is unreachable
+}
+
+# Read API (ip_tracking.api)
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+}
+
+# Dashboard request log listing (ip_tracking.views.dashboard)
+DASHBOARD_SETTINGS = {
+    'PAGE_SIZE': 50,       # Logs per keyset page
+    'QUERY_BUDGET': 6,     # Queries the view may run; more is logged, and raises with DEBUG on
+}
+
+# RequestLog changelist in the admin (ip_tracking.admin.RequestLogAdmin)
+REQUEST_LOG_ADMIN = {
+    'COUNT_LIMIT': 10000,          # Filtered changelists count at most this many rows
+    'COUNT_CACHE_SECONDS': 300,    # How long a changelist count is reused
+    'FACET_LIMIT': 20,             # Choices per country / city / IP filter, busiest first
+    'FACET_DAYS': 7,               # Rollup window the filter choices are taken from
+    'FACET_CACHE_SECONDS': 600,
+    'SEARCH_PATH_REFS': 1000,      # Dictionary paths a prefix search matches compact rows against
+}
+
+# Streaming request log export (ip_tracking.export, api/export/ and export_request_logs)
+REQUEST_LOG_EXPORT = {
+    'CHUNK_SIZE': 2000,        # Rows fetched from the database and written out per chunk
+    'SETTLE_SECONDS': None,    # Rows younger than this are left for the next pull; None derives it from REQUEST_LOG_INGESTION
+    'SETTLE_MARGIN': 60,       # Added to the derived value for request time and commit lag
+}
+
+# Live block/unblock/detection feed (ip_tracking.events, api/events/)
+IP_TRACKING_EVENTS = {
+    'CHANNEL': 'ip_tracking:events',   # Redis pub/sub channel events are published on
+    'HISTORY_SIZE': 500,               # Recent events kept for clients reconnecting with Last-Event-ID
+    'HEARTBEAT_SECONDS': 15,           # Comment sent on idle streams so proxies keep them open
+    'QUEUE_SIZE': 100,                 # Events buffered per client before a slow one is disconnected
+    'SUBSCRIBE_TIMEOUT': 5,            # Seconds a new stream waits for Redis to confirm the subscription
+}
+
+# Queued abuse reports (ip_tracking.reports, api/report-abuse/ and process_abuse_reports)
+ABUSE_REPORT_SETTINGS = {
+    'STREAM_KEY': 'ip_tracking:abuse_reports',
+    'STREAM_MAXLEN': 100000,       # Approximate cap on queued reports; the oldest are dropped under a flood
+    'BATCH_SIZE': 1000,            # Reports folded and written per transaction
+    'MAX_BATCHES': 50,             # Batches per task run
+    'REPORT_THRESHOLD': 3,         # Distinct reporters that flag an IP as suspicious
+    'WINDOW_HOURS': 24,            # Only reports this recent count towards the threshold
+    'MAX_DESCRIPTION_LENGTH': 1000,
 }
 
 # Custom rate limit exceeded view
-RATELIMIT_VIEW = 'ip_tracking.views.rate_limit_exceeded'
\ No newline at end of file
+RATELIMIT_VIEW = 'ip_tracking.views.rate_limit_exceeded'
+
+# Anomaly detection thresholds (ip_tracking.tasks and the replay_detection command)
+ANOMALY_DETECTION_SETTINGS = {
+    'HIGH_FREQUENCY_THRESHOLD': 100,     # Requests per hour before an IP is flagged
+    'AUTO_BLOCK_DETECTIONS': 5,          # Detections needed to auto-block an IP
+    'AUTO_BLOCK_WINDOW_HOURS': 24,       # Only count IPs detected within this window
+    'SUSPICIOUS_IP_RETENTION_DAYS': 7,   # Suspicious IP records older than this are cleaned up
+}
+
+
+# Retention for the tracking tables, applied by ip_tracking.tasks.purge_expired_records
+RETENTION_SETTINGS = {
+    'CHUNK_SIZE': 5000,              # Rows deleted per short transaction
+    'SLEEP_BETWEEN_CHUNKS': 0.05,    # Seconds to pause between chunks to let other writers in
+    'TTL_DAYS': {
+        'RequestLog': 30,
+        'AbuseReport': 30,
+        'HourlyTrafficSummary': 90,
+        'SecurityReport': 365,
+        'IPTrafficRollup': 30,
+        'PathTrafficRollup': 90,
+        'GeoTrafficRollup': 365,
+        # SuspiciousIP defaults to ANOMALY_DETECTION_SETTINGS['SUSPICIOUS_IP_RETENTION_DAYS']
+    },
+}
+
+# Columnar archives of cold RequestLog days (archive_request_logs / archive_analytics)
+REQUEST_ARCHIVE = {
+    'DIRECTORY': BASE_DIR / 'request_archive',
+    'AFTER_DAYS': 7,               # Whole days older than this are archived; keep below the RequestLog TTL
+    'FORMAT': 'columnar',          # 'columnar' (built in) or 'parquet' (needs pyarrow)
+    'COMPRESSION': 'zlib',         # 'zlib' or 'none' (uncompressed columns are read straight from the memory map)
+    'DELETE_CHUNK_SIZE': 5000,     # Archived rows deleted per short transaction
+    'SLEEP_BETWEEN_CHUNKS': 0.05,  # Seconds to pause between delete chunks
+}
+
+# Native range partitioning of RequestLog on timestamp (PostgreSQL only, ignored elsewhere).
+# Opt-in: convert the table once with `manage.py requestlog_partitions --convert`
+REQUESTLOG_PARTITIONING = {
+    'INTERVAL': 'day',    # 'day' or 'week'
+    'PREMAKE': 7,         # Future partitions created ahead of time
+}
+
+# Snapshot served by the public_stats view (ip_tracking.stats), refreshed by refresh_public_stats
+PUBLIC_STATS = {
+    'MAX_AGE': 60,                  # Seconds a snapshot counts as fresh (Cache-Control max-age)
+    'STALE_WHILE_REVALIDATE': 300,  # Seconds clients and proxies may serve it stale while refetching
+}
+
+# Pre-aggregated traffic rollups read by analytics, stats and detection
+ROLLUP_SETTINGS = {
+    'ENABLED': True,
+    'BUCKETS': {'ip': 'minute', 'path': 'hour', 'geo': 'hour'},   # 'minute' or 'hour' per rollup
+    'BATCH_SIZE': 50000,       # RequestLog ids folded per transaction
+    'GAP_SECONDS': 600,        # Recheck ids passed before their rows committed for this long
+}
+
+# How the middleware writes RequestLog rows (ip_tracking.ingestion)
+REQUEST_LOG_INGESTION = {
+    'SINK': 'database',        # 'database', 'segments' (load_request_segments) or 'stream' (consume_request_stream)
+    'BACKEND': 'orm',          # 'orm' (bulk_create) or 'copy' (PostgreSQL COPY, ORM elsewhere)
+    'BATCH_SIZE': 1,           # Rows buffered per process before a write; 1 writes every request
+    'FLUSH_INTERVAL': 2.0,     # Seconds before a partly filled buffer is written
+    'COPY_MODE': 'direct',     # 'direct' into the table or 'staging' via a temp table
+    'SEGMENT_DIR': BASE_DIR / 'request_segments',
+    'SEGMENT_MAX_BYTES': 16 * 1024 * 1024,   # Rotate segments at this size
+    'SEGMENT_MAX_AGE': 10.0,                 # or after this many seconds
+    'LOADER_BATCH_SIZE': 5000,               # Records per loader transaction
+    'STREAM_KEY': 'ip_tracking:requests',
+    'STREAM_MAXLEN': 1000000,                # Approximate cap on stream length
+    'STREAM_BATCH_SIZE': 1000,               # Entries per XREADGROUP
+    'STREAM_BLOCK_MS': 5000,                 # How long an idle consumer waits for entries
+    'STREAM_CLAIM_IDLE_MS': 60000,           # Reclaim entries a dead consumer left pending
+    'STREAM_MAX_DELIVERIES': 5,              # Failed deliveries before an entry goes to '<stream>:dead'
+    'COLLAPSE_WINDOW': 0,                    # Seconds to merge repeated (ip, path) requests into one row; 0 = off
+    'COLLAPSE_MAX_KEYS': 10000,              # Open merge groups per process before the oldest is written early
+}
+
+# Redis used directly by ip_tracking (streams, live events); defaults to the cache's Redis
+IP_TRACKING_REDIS_URL = CACHES['default']['LOCATION']
+
+# Compact RequestLog rows: each distinct path is stored once in RequestPath and
+# rows reference it by id (request_log_format converts existing rows). IPs are
+# not compacted: they are binary only on PostgreSQL (inet), text on SQLite.
+# purge_expired_records deletes dictionary entries no row references any more.
+REQUEST_LOG_FORMAT = {
+    'COMPACT': False,
+    'PATH_CACHE_SIZE': 10000,    # path -> id entries cached per process
+    'PATH_CACHE_TTL': 3600,      # Seconds a cached id is trusted; keep well below the RequestLog TTL
+}
+
+# Normalized paths stored next to the raw path and used for path analytics
+PATH_NORMALIZATION = {
+    'ENABLED': True,
+    'QUERY_STRING': 'keys',      # 'strip', 'keys' (sorted parameter names), 'hash' or 'keep'
+    'PLACEHOLDERS': True,        # Numeric, UUID and long hex segments -> {id}, {uuid}, {hash}
+    'ROUTE_NAMES': False,        # Map paths to 'route:<url name>' through the URL resolver
+    'CACHE_SIZE': 10000,         # Memoized route lookups per process
+}
+
+# Which requests IPTrackingMiddleware logs. First matching rule wins; a rule may
+# set path_prefixes, methods and cidrs, and a rate: 0 skips, 1 logs everything,
+# 0.1 logs one request in 10 with sample_weight=10. sample_by is 'ip' (all or none
+# of a client's requests) or 'ip_path' (per path; per-IP counts are extrapolated).
+REQUEST_SAMPLING = {
+    'ENABLED': True,
+    'RULES': [
+        {'name': 'static', 'path_prefixes': ['/static/', '/media/', '/favicon.ico'], 'rate': 0},
+        {'name': 'health', 'path_prefixes': ['/health', '/ping'], 'methods': ['GET', 'HEAD'], 'rate': 0},
+    ],
+    'DEFAULT_RATE': 1.0,        # Rate for requests no rule matches
+}
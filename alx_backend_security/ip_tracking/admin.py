@@ -1,18 +1,110 @@
+import ipaddress
+
 from django.contrib import admin
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils import timezone
-from .models import RequestLog, BlockedIP, SuspiciousIP
-from alx_backend_security.ip_tracking import models
+from .events import make_event, publish_event, publish_events
+from .facets import get_facets, get_request_log_admin_settings
+from .models import RequestLog, RequestPath, BlockedIP, SuspiciousIP
+from .pagination import EstimatedCountPaginator
+from .reputation import refresh_reputation
+
+class RollupFacetFilter(admin.SimpleListFilter):
+    """Choices from the cached rollup facets (see facets.py), not a DISTINCT over RequestLog"""
+
+    def lookups(self, request, model_admin):
+        return get_facets().get(self.parameter_name, [])
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+
+
+class CountryFilter(RollupFacetFilter):
+    title = 'country'
+    parameter_name = 'country'
+
+
+class CityFilter(RollupFacetFilter):
+    title = 'city'
+    parameter_name = 'city'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            country, _, city = self.value().rpartition('|')
+            if country:
+                return queryset.filter(country=country, city=city)
+            return queryset.filter(city=city)
+
+
+class IPAddressFilter(RollupFacetFilter):
+    title = 'busiest IPs'
+    parameter_name = 'ip_address'
+
+    def queryset(self, request, queryset):
+        if self.value():
+            try:
+                ipaddress.ip_address(self.value())
+            except ValueError:
+                return queryset.none()
+        return super().queryset(request, queryset)
+
 
 @admin.register(RequestLog)
 class RequestLogAdmin(admin.ModelAdmin):
-    list_display = ['ip_address', 'country', 'city', 'path', 'timestamp']
-    list_filter = ['timestamp', 'country', 'city', 'ip_address']
-    search_fields = ['ip_address', 'path', 'country', 'city']
-    readonly_fields = ['ip_address', 'timestamp', 'path', 'country', 'city']
-    date_hierarchy = 'timestamp'
+    """
+    Changelist for a RequestLog table of any size: no COUNT(*) over the whole
+    table, no DISTINCT scans for the sidebar, and only indexed searches.
+    """
+    list_display = ['ip_address', 'country', 'city', 'full_path', 'timestamp']
+    list_filter = ['timestamp', CountryFilter, CityFilter, IPAddressFilter]
+    list_select_related = ['path_ref']
+    # Only exact IPs and path prefixes, see get_search_results
+    search_fields = ['=ip_address', '^path']
+    search_help_text = 'An exact IP address, or the start of a path beginning with /'
+    fields = ['ip_address', 'timestamp', 'last_seen', 'full_path', 'normalized_path',
+              'hit_count', 'sample_weight', 'ip_weight', 'country', 'city']
+    readonly_fields = fields
     list_per_page = 50
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+    
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        config = get_request_log_admin_settings()
+        return self.paginator(
+            queryset, per_page, count_limit=config['COUNT_LIMIT'],
+            cache_seconds=config['COUNT_CACHE_SECONDS'],
+            orphans=orphans, allow_empty_first_page=allow_empty_first_page
+        )
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Exact ip_address, or a prefix of the path on its index (and in the path dictionary)"""
+        config = get_request_log_admin_settings()
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        try:
+            ipaddress.ip_address(search_term)
+            return queryset.filter(ip_address=search_term), False
+        except ValueError:
+            pass
+        if search_term.startswith('/'):
+            # Resolved first: a literal id list lets the database OR two index scans
+            path_refs = list(RequestPath.objects
+                             .filter(path__startswith=search_term)
+                             .values_list('id', flat=True)[:config['SEARCH_PATH_REFS']])
+            return queryset.filter(Q(path__startswith=search_term) | Q(path_ref_id__in=path_refs)), False
+        self.message_user(request, 'Search by an exact IP address or a path starting with /.', level='warning')
+        return queryset.none(), False
+    
+    def full_path(self, obj):
+        return obj.full_path
+    full_path.short_description = 'Path'
     
     def has_add_permission(self, request):
         return False
@@ -36,23 +128,29 @@ class BlockedIPAdmin(admin.ModelAdmin):
     
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
-        from django.core.cache import cache
         cache.delete(f"blocked_ip_{obj.ip_address}")
+        if not change:
+            publish_event('blocked', obj.ip_address, reason=obj.reason, source='admin', user=str(request.user))
     
     def delete_model(self, request, obj):
-        from django.core.cache import cache
         cache.delete(f"blocked_ip_{obj.ip_address}")
         super().delete_model(request, obj)
+        publish_event('unblocked', obj.ip_address, source='admin', user=str(request.user))
+    
+    def delete_queryset(self, request, queryset):
+        ip_addresses = list(queryset.values_list('ip_address', flat=True))
+        cache.delete_many([f"blocked_ip_{ip_address}" for ip_address in ip_addresses])
+        super().delete_queryset(request, queryset)
+        publish_events([make_event('unblocked', ip_address, source='admin', user=str(request.user))
+                        for ip_address in ip_addresses])
     
     actions = ['clear_cache_for_selected']
     
     def clear_cache_for_selected(self, request, queryset):
         """Clear cache for selected blocked IPs"""
-        from django.core.cache import cache
-        count = 0
-        for blocked_ip in queryset:
-            cache.delete(f"blocked_ip_{blocked_ip.ip_address}")
-            count += 1
+        ip_addresses = list(queryset.values_list('ip_address', flat=True))
+        cache.delete_many([f"blocked_ip_{ip_address}" for ip_address in ip_addresses])
+        count = len(ip_addresses)
         self.message_user(request, f'Cleared cache for {count} blocked IPs.')
     clear_cache_for_selected.short_description = "Clear cache for selected blocked IPs"
 
@@ -70,7 +168,6 @@ class SuspiciousIPAdmin(admin.ModelAdmin):
     ]
     list_filter = [
         'is_investigated',
-        'detection_count',
         'last_detected',
         'first_detected'
     ]
@@ -98,23 +195,18 @@ class SuspiciousIPAdmin(admin.ModelAdmin):
             )
         
         def queryset(self, request, queryset):
-            if self.value() == 'HIGH':
-                return queryset.filter(
-                    models.Q(detection_count__gte=10) | models.Q(request_count__gte=500)
-                )
-            elif self.value() == 'MEDIUM':
-                return queryset.filter(
-                    models.Q(detection_count__gte=5, detection_count__lt=10) |
-                    models.Q(request_count__gte=200, request_count__lt=500)
-                )
-            elif self.value() == 'LOW':
-                return queryset.filter(
-                    detection_count__lt=5,
-                    request_count__lt=200
-                )
+            tiers = {label: rank for rank, label in SuspiciousIP.RISK_TIER_CHOICES}
+            if self.value() in tiers:
+                return queryset.filter(risk_tier=tiers[self.value()])
     
     list_filter = list_filter + [RiskLevelFilter]
     
+    def get_queryset(self, request):
+        # One EXISTS per row in the page query instead of a BlockedIP lookup per row
+        return super().get_queryset(request).annotate(
+            is_blocked=Exists(BlockedIP.objects.filter(ip_address=OuterRef('ip_address')))
+        )
+    
     def risk_level_colored(self, obj):
         """Display risk level with color coding"""
         colors = {
@@ -122,7 +214,7 @@ class SuspiciousIPAdmin(admin.ModelAdmin):
             'MEDIUM': '#ffc107',
             'LOW': '#28a745'     
         }
-        level = obj.risk_level
+        level = obj.get_risk_tier_display()
         color = colors.get(level, '#6c757d')
         return format_html(
             '<span style="color: {}; font-weight: bold;">{}</span>',
@@ -130,7 +222,7 @@ class SuspiciousIPAdmin(admin.ModelAdmin):
             level
         )
     risk_level_colored.short_description = 'Risk Level'
-    risk_level_colored.admin_order_field = 'detection_count'
+    risk_level_colored.admin_order_field = 'risk_tier'
     
     def days_since_detection(self, obj):
         """Display days since first detection"""
@@ -146,16 +238,14 @@ class SuspiciousIPAdmin(admin.ModelAdmin):
     
     def block_ip_link(self, obj):
         """Display link to block this IP"""
-        try:
-            BlockedIP.objects.get(ip_address=obj.ip_address)
+        if obj.is_blocked:
             return format_html('<span style="color: #dc3545;">Already Blocked</span>')
-        except BlockedIP.DoesNotExist:
-            url = reverse('admin:ip_tracking_blockedip_add')
-            return format_html(
-                '<a href="{}?ip_address={}" class="button" style="background: #dc3545; color: white; padding: 5px 10px; text-decoration: none; border-radius: 3px;">Block IP</a>',
-                url,
-                obj.ip_address
-            )
+        url = reverse('admin:ip_tracking_blockedip_add')
+        return format_html(
+            '<a href="{}?ip_address={}" class="button" style="background: #dc3545; color: white; padding: 5px 10px; text-decoration: none; border-radius: 3px;">Block IP</a>',
+            url,
+            obj.ip_address
+        )
     block_ip_link.short_description = 'Actions'
     
     def reason_short(self, obj):
@@ -202,22 +292,28 @@ class SuspiciousIPAdmin(admin.ModelAdmin):
     
     def block_selected_ips(self, request, queryset):
         """Block selected suspicious IPs"""
-        blocked_count = 0
-        for suspicious_ip in queryset:
-            blocked_ip, created = BlockedIP.objects.get_or_create(
-                ip_address=suspicious_ip.ip_address,
-                defaults={
-                    'reason': f'Blocked from admin: {suspicious_ip.reason[:200]}'
-                }
-            )
-            if created:
-                blocked_count += 1
-                from django.core.cache import cache
-                cache.delete(f"blocked_ip_{suspicious_ip.ip_address}")
+        selected = list(queryset.values_list('ip_address', 'reason', 'is_blocked'))
+        reasons = {}
+        for ip_address, reason, is_blocked in selected:
+            if not is_blocked:
+                reasons.setdefault(ip_address, f'Blocked from admin: {reason[:200]}')
+        
+        # ignore_conflicts: an IP blocked since the select above is skipped, not an error
+        BlockedIP.objects.bulk_create(
+            [BlockedIP(ip_address=ip_address, reason=reason) for ip_address, reason in reasons.items()],
+            batch_size=500,
+            ignore_conflicts=True
+        )
+        cache.delete_many([f"blocked_ip_{ip_address}" for ip_address in reasons])
+        publish_events([
+            make_event('blocked', ip_address, reason=reason, source='admin', user=str(request.user))
+            for ip_address, reason in reasons.items()
+        ])
         
+        blocked_count = len(reasons)
         self.message_user(
             request, 
-            f'Blocked {blocked_count} IPs. {queryset.count() - blocked_count} were already blocked.'
+            f'Blocked {blocked_count} IPs. {len(selected) - blocked_count} were already blocked.'
         )
     block_selected_ips.short_description = "Block selected IPs"
     
@@ -225,14 +321,22 @@ class SuspiciousIPAdmin(admin.ModelAdmin):
         """Delete low-risk suspicious IPs older than 3 days"""
         three_days_ago = timezone.now() - timezone.timedelta(days=3)
         low_risk_old = queryset.filter(
-            detection_count__lt=5,
-            request_count__lt=200,
+            risk_tier=SuspiciousIP.RISK_LOW,
             last_detected__lt=three_days_ago
         )
-        count = low_risk_old.count()
-        low_risk_old.delete()
+        count, _ = low_risk_old.delete()
+        if count:
+            transaction.on_commit(refresh_reputation)
         self.message_user(request, f'Deleted {count} low-risk old suspicious IP records.')
     delete_low_risk.short_description = "Delete old low-risk entries"
     
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        transaction.on_commit(refresh_reputation)
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        transaction.on_commit(refresh_reputation)
+    
     def has_add_permission(self, request):
         return False
\ No newline at end of file
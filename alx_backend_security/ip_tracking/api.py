@@ -0,0 +1,208 @@
+"""
+Read-only REST API for request logs, blocked IPs and suspicious IPs.
+
+Lists are paged with DRF cursor pagination over an indexed ordering, so every
+page is an index range scan. Rows are fetched with .values() for just the
+columns the client asked for (?fields=a,b) and returned as they are, without
+model instances or serializers. Each list answers If-None-Match from a
+single aggregate over the filtered rows, so a poller whose data has not
+changed gets a 304 without the page being fetched. There is no Last-Modified:
+no timestamp column moves on every change (a late request log keeps its old
+timestamp, an unblock or an investigation leaves none), so a date validator
+would answer 304 for data that did change.
+"""
+import hashlib
+import ipaddress
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django_ratelimit.exceptions import Ratelimited
+from rest_framework.exceptions import Throttled, ValidationError
+from rest_framework.generics import GenericAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import DjangoModelPermissions
+
+from .export import parse_export_time
+from .models import BlockedIP, RequestLog, SuspiciousIP, logged_path
+from .ratelimit import ratelimit
+
+
+class ViewModelPermissions(DjangoModelPermissions):
+    """Model permissions that also require the view permission for reads"""
+    perms_map = {
+        **DjangoModelPermissions.perms_map,
+        'GET': ['%(app_label)s.view_%(model_name)s'],
+        'HEAD': ['%(app_label)s.view_%(model_name)s'],
+    }
+
+
+class IndexedCursorPagination(CursorPagination):
+    """Cursor pagination over the view's `ordering`, which must lead with an indexed column"""
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_ordering(self, request, queryset, view):
+        return view.ordering
+
+
+@method_decorator(
+    ratelimit(key='user', rate=settings.RATELIMIT_SETTINGS['API_RATE'], method='GET', block=True),
+    name='get'
+)
+class ReadOnlyListAPIView(GenericAPIView):
+    """
+    Base list view. Subclasses set `model`, `ordering`, the selectable
+    `fields` (name -> column or expression) and `validators`, the aggregates
+    whose values change whenever the listed rows do.
+    """
+    model = None
+    ordering = None
+    fields = {}
+    validators = {}
+    pagination_class = IndexedCursorPagination
+    permission_classes = [ViewModelPermissions]
+
+    def get_queryset(self):
+        return self.filter_rows(self.model.objects.all())
+
+    def handle_exception(self, exc):
+        # Ratelimited is a PermissionDenied, which DRF would answer with a 403
+        if isinstance(exc, Ratelimited):
+            exc = Throttled(wait=getattr(exc, 'retry_after', None))
+        return super().handle_exception(exc)
+
+    def filter_rows(self, queryset):
+        ip_address = self.request.query_params.get('ip')
+        if ip_address:
+            try:
+                ipaddress.ip_address(ip_address)
+            except ValueError:
+                raise ValidationError({'ip': f"'{ip_address}' is not a valid IP address"})
+            queryset = queryset.filter(ip_address=ip_address)
+        return queryset
+
+    def selected_fields(self):
+        requested = self.request.query_params.get('fields')
+        if not requested:
+            return list(self.fields)
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in self.fields]
+        if unknown:
+            raise ValidationError({'fields': f"Unknown fields: {', '.join(unknown)}. "
+                                             f"Available: {', '.join(self.fields)}"})
+        return names
+
+    def values_queryset(self, queryset, names):
+        """.values() for the selected fields plus the ordering columns the cursor needs"""
+        ordering_columns = [field.lstrip('-') for field in self.ordering]
+        columns = []
+        expressions = {}
+        for name in dict.fromkeys([*names, *ordering_columns]):
+            source = self.fields.get(name, name)
+            if isinstance(source, str):
+                columns.append(source)
+            else:
+                # Aliased so it cannot clash with a model field of the same name
+                expressions[f'_{name}'] = source
+        return queryset.values(*columns, **expressions)
+
+    def get(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        names = self.selected_fields()
+
+        state = queryset.order_by().aggregate(**self.validators)
+        etag = quote_etag(hashlib.blake2b(
+            f'{sorted(state.items())}|{request.get_full_path()}'.encode(), digest_size=12
+        ).hexdigest())
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        page = self.paginate_queryset(self.values_queryset(queryset, names))
+        results = [{name: row.get(name, row.get(f'_{name}')) for name in names} for row in page]
+        response = self.get_paginated_response(results)
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class RequestLogList(ReadOnlyListAPIView):
+    """Request logs, newest first. Filters: ip, start, end (ISO 8601)."""
+    model = RequestLog
+    ordering = ('-timestamp', '-id')
+    fields = {
+        'id': 'id',
+        'timestamp': 'timestamp',
+        'last_seen': 'last_seen',
+        'ip_address': 'ip_address',
+        'path': logged_path(),
+        'normalized_path': 'normalized_path',
+        'hit_count': 'hit_count',
+        'sample_weight': 'sample_weight',
+        'ip_weight': 'ip_weight',
+        'country': 'country',
+        'city': 'city',
+    }
+    # Append-only apart from retention, which only removes the oldest rows
+    validators = {'max_id': Max('id'), 'last_timestamp': Max('timestamp')}
+
+    def filter_rows(self, queryset):
+        queryset = super().filter_rows(queryset)
+        for param, lookup in (('start', 'timestamp__gte'), ('end', 'timestamp__lt')):
+            value = self.request.query_params.get(param)
+            try:
+                parsed = parse_export_time(value, param)
+            except ValueError:
+                raise ValidationError({param: 'Must be an ISO 8601 datetime'})
+            if parsed:
+                queryset = queryset.filter(**{lookup: parsed})
+        return queryset
+
+
+class BlockedIPList(ReadOnlyListAPIView):
+    """Blocked IPs, most recently added first. Filter: ip."""
+    model = BlockedIP
+    ordering = ('-id',)
+    fields = {
+        'id': 'id',
+        'ip_address': 'ip_address',
+        'created_at': 'created_at',
+        'reason': 'reason',
+    }
+    validators = {'count': Count('id'), 'max_id': Max('id'), 'last_created': Max('created_at')}
+
+
+class SuspiciousIPList(ReadOnlyListAPIView):
+    """Suspicious IPs, most recently detected first. Filters: ip, is_investigated."""
+    model = SuspiciousIP
+    ordering = ('-last_detected', '-id')
+    fields = {
+        'id': 'id',
+        'ip_address': 'ip_address',
+        'reason': 'reason',
+        'request_count': 'request_count',
+        'first_detected': 'first_detected',
+        'last_detected': 'last_detected',
+        'detection_count': 'detection_count',
+        'is_investigated': 'is_investigated',
+    }
+    validators = {
+        'count': Count('id'),
+        'max_id': Max('id'),
+        'last_detected': Max('last_detected'),
+        'detections': Sum('detection_count'),
+        # A repeat detection within one window only refreshes the count
+        'requests': Sum('request_count'),
+        'investigated': Count('id', filter=Q(is_investigated=True)),
+    }
+
+    def filter_rows(self, queryset):
+        queryset = super().filter_rows(queryset)
+        investigated = self.request.query_params.get('is_investigated')
+        if investigated in ('true', 'false'):
+            queryset = queryset.filter(is_investigated=investigated == 'true')
+        return queryset
@@ -0,0 +1,715 @@
+"""
+Columnar archives of cold RequestLog data.
+
+Closed UTC days are exported to one file per day (plus a part number when a
+day is archived in several runs) and then deleted from RequestLog in small
+chunks. The native format stores every column as a fixed-width integer array:
+
+- ip_address is an index into a dictionary of integer addresses (IPv4 kept
+  as IPv4-mapped IPv6, split into two 64-bit halves),
+- path, normalized_path, country and city are indexes into string
+  dictionaries,
+- timestamp is delta-encoded in milliseconds from the previous row, and
+  last_seen is stored as the span after timestamp,
+- each array uses the narrowest unsigned type that fits, and blocks are
+  optionally zlib-compressed,
+- the archived RequestLog ids are kept, sorted and delta-encoded, so exactly
+  those rows are deleted afterwards.
+
+The reader memory-maps the files and aggregates whole columns at a time
+(Counter over code arrays, bisect over the reconstructed timestamps), so
+queries never build per-row Python objects. Readers hold the map open until
+close() (they are context managers). With pyarrow installed the same data
+can be written to Parquet instead, and the reader scans those as well.
+"""
+import bisect
+import ipaddress
+import json
+import logging
+import mmap
+import operator
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate, chain, compress
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Min
+
+from .models import RequestLog, logged_path
+
+try:
+    import pyarrow
+    import pyarrow.compute as pyarrow_compute
+    import pyarrow.parquet as pyarrow_parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_SETTINGS = {
+    'DIRECTORY': os.path.join(settings.BASE_DIR, 'request_archive'),
+    'AFTER_DAYS': 7,
+    'FORMAT': 'columnar',
+    'COMPRESSION': 'zlib',
+    'DELETE_CHUNK_SIZE': 5000,
+    'SLEEP_BETWEEN_CHUNKS': 0.0,
+}
+
+FORMATS = ('columnar', 'parquet')
+EXTENSIONS = {'columnar': '.ipta', 'parquet': '.parquet'}
+
+MAGIC = b'IPTA1\n'
+ALIGNMENT = 8
+IPV4_MAPPED = 0xFFFF << 32
+LOW_BITS = (1 << 64) - 1
+
+# Narrowest unsigned array type for a maximum value
+INTEGER_TYPES = [(0xFF, 'B'), (0xFFFF, 'H'), (0xFFFFFFFF, 'I'), (LOW_BITS, 'Q')]
+
+STRING_COLUMNS = ('path', 'normalized_path', 'country', 'city')
+
+
+def get_archive_settings():
+    archive_settings = {**DEFAULT_ARCHIVE_SETTINGS, **getattr(settings, 'REQUEST_ARCHIVE', {})}
+    if archive_settings['FORMAT'] not in FORMATS:
+        raise ValueError(f"REQUEST_ARCHIVE['FORMAT'] must be one of {', '.join(FORMATS)}")
+    if archive_settings['COMPRESSION'] not in ('zlib', 'none'):
+        raise ValueError("REQUEST_ARCHIVE['COMPRESSION'] must be 'zlib' or 'none'")
+    return archive_settings
+
+
+def parquet_available():
+    return pyarrow is not None
+
+
+def _integer_array(values):
+    values = list(values)
+    largest = max(values, default=0)
+    typecode = next(code for limit, code in INTEGER_TYPES if largest <= limit)
+    return array(typecode, values)
+
+
+def _ip_integer(ip_address):
+    """128-bit integer for an address, IPv4 mapped into IPv6 so both share one column"""
+    address = ipaddress.ip_address(ip_address)
+    if address.version == 4:
+        return IPV4_MAPPED | int(address)
+    return int(address)
+
+
+def _ip_string(value):
+    address = ipaddress.IPv6Address(value)
+    return str(address.ipv4_mapped or address)
+
+
+def _to_ms(value):
+    return int(value.timestamp() * 1000)
+
+
+def day_floor(value):
+    return value.astimezone(dt_timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class ColumnBuilder:
+    """Accumulates rows in dictionary- and delta-encoded form"""
+
+    def __init__(self):
+        self.rows = 0
+        self.max_id = 0
+        self.ids = []
+        self.base_ms = None
+        self._previous_ms = None
+        self.ips = {}
+        self.strings = {name: {} for name in STRING_COLUMNS}
+        self.columns = {
+            name: []
+            for name in ('ip', *STRING_COLUMNS, 'timestamp_delta', 'last_seen_span', 'hit_count', 'sample_weight',
+                         'ip_weight')
+        }
+
+    def _code(self, dictionary, value):
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(dictionary)
+        return code
+
+    def add(self, pk, ip_address, timestamp, path, normalized_path, hit_count, sample_weight, ip_weight,
+            last_seen, country, city):
+        """Rows must arrive in timestamp order"""
+        timestamp_ms = _to_ms(timestamp)
+        if self.base_ms is None:
+            self.base_ms = self._previous_ms = timestamp_ms
+        columns = self.columns
+        columns['ip'].append(self._code(self.ips, _ip_integer(ip_address)))
+        for name, value in zip(STRING_COLUMNS, (path, normalized_path, country or '', city or '')):
+            columns[name].append(self._code(self.strings[name], value))
+        columns['timestamp_delta'].append(timestamp_ms - self._previous_ms)
+        columns['last_seen_span'].append(max(_to_ms(last_seen) - timestamp_ms, 0) if last_seen else 0)
+        columns['hit_count'].append(hit_count)
+        columns['sample_weight'].append(sample_weight)
+        columns['ip_weight'].append(ip_weight)
+        self._previous_ms = timestamp_ms
+        self.max_id = max(self.max_id, pk)
+        self.ids.append(pk)
+        self.rows += 1
+
+
+def write_columnar(path, builder, metadata, compression='zlib'):
+    """Write a builder's columns to `path` atomically. Returns the file size."""
+    blocks = {}
+    for name, values in builder.columns.items():
+        blocks[name] = _integer_array(values)
+    ip_values = list(builder.ips)
+    blocks['ip_high'] = array('Q', (value >> 64 for value in ip_values))
+    blocks['ip_low'] = array('Q', (value & LOW_BITS for value in ip_values))
+    for name, dictionary in builder.strings.items():
+        blocks[f'{name}_values'] = json.dumps(list(dictionary), separators=(',', ':')).encode('utf-8')
+    ids = sorted(builder.ids)
+    blocks['id_delta'] = _integer_array(map(operator.sub, ids, [0, *ids[:-1]]))
+
+    header = {
+        **metadata,
+        'rows': builder.rows,
+        'max_id': builder.max_id,
+        'base_ms': builder.base_ms or 0,
+        'byteorder': sys.byteorder,
+        'blocks': {},
+    }
+    payloads = []
+    offset = 0
+    for name, block in blocks.items():
+        raw = block.tobytes() if isinstance(block, array) else block
+        data = zlib.compress(raw, 6) if compression == 'zlib' else raw
+        header['blocks'][name] = {
+            'type': block.typecode if isinstance(block, array) else 'json',
+            'codec': compression,
+            'offset': offset,
+            'length': len(data),
+        }
+        padding = -len(data) % ALIGNMENT
+        payloads.append(data + b'\0' * padding)
+        offset += len(data) + padding
+
+    encoded_header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    prefix = MAGIC + struct.pack('<I', len(encoded_header)) + encoded_header
+    prefix += b'\0' * (-len(prefix) % ALIGNMENT)
+
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as archive_file:
+        archive_file.write(prefix)
+        for payload in payloads:
+            archive_file.write(payload)
+        archive_file.flush()
+        os.fsync(archive_file.fileno())
+    os.replace(temporary, path)
+    return len(prefix) + offset
+
+
+def write_parquet(path, builder, metadata, compression='zlib'):
+    """Parquet counterpart of write_columnar: dictionary strings, binary IPs, delta-packed timestamps"""
+    if pyarrow is None:
+        raise RuntimeError('Parquet archives need pyarrow installed')
+
+    columns = builder.columns
+    ip_values = list(builder.ips)
+    strings = {name: list(dictionary) for name, dictionary in builder.strings.items()}
+    timestamps = list(accumulate(columns['timestamp_delta'], initial=builder.base_ms or 0))[1:]
+
+    arrays = {
+        'ip': pyarrow.DictionaryArray.from_arrays(
+            pyarrow.array(columns['ip'], pyarrow.uint32()),
+            pyarrow.array([value.to_bytes(16, 'big') for value in ip_values], pyarrow.binary(16)),
+        ),
+        'timestamp': pyarrow.array(timestamps, pyarrow.timestamp('ms', tz='UTC')),
+        'last_seen_span': pyarrow.array(columns['last_seen_span'], pyarrow.uint32()),
+        'hit_count': pyarrow.array(columns['hit_count'], pyarrow.uint32()),
+        'sample_weight': pyarrow.array(columns['sample_weight'], pyarrow.uint32()),
+        'ip_weight': pyarrow.array(columns['ip_weight'], pyarrow.uint32()),
+        'id': pyarrow.array(builder.ids, pyarrow.uint64()),
+    }
+    for name in STRING_COLUMNS:
+        arrays[name] = pyarrow.DictionaryArray.from_arrays(
+            pyarrow.array(columns[name], pyarrow.uint32()),
+            pyarrow.array(strings[name], pyarrow.string()),
+        )
+
+    table = pyarrow.table(arrays).replace_schema_metadata({
+        'ip_tracking': json.dumps({**metadata, 'rows': builder.rows, 'max_id': builder.max_id}),
+    })
+    temporary = f'{path}.tmp'
+    pyarrow_parquet.write_table(
+        table,
+        temporary,
+        compression='gzip' if compression == 'zlib' else 'none',
+        use_dictionary=['ip', *STRING_COLUMNS],
+        column_encoding={'timestamp': 'DELTA_BINARY_PACKED'},
+    )
+    os.replace(temporary, path)
+    return os.path.getsize(path)
+
+
+WRITERS = {'columnar': write_columnar, 'parquet': write_parquet}
+
+
+def archive_name(day, part, archive_format):
+    suffix = f'.{part}' if part else ''
+    return f"requestlog-{day:%Y%m%d}{suffix}{EXTENSIONS[archive_format]}"
+
+
+def archive_files(directory):
+    """Archive files in `directory`, oldest day first"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith('requestlog-') and name.endswith(tuple(EXTENSIONS.values()))
+    )
+
+
+def open_archive(path):
+    if path.endswith(EXTENSIONS['parquet']):
+        return ParquetArchive(path)
+    return ColumnarArchive(path)
+
+
+def export_day(day, directory, archive_format='columnar', compression='zlib', min_id=0):
+    """
+    Export RequestLog rows of one UTC day with an id above `min_id`.
+    Returns (path, rows, size), with path None when there was nothing to export.
+    """
+    start, end = day, day + timedelta(days=1)
+    using = router.db_for_write(RequestLog)
+    rows = (RequestLog.objects.using(using)
+            .filter(timestamp__gte=start, timestamp__lt=end, id__gt=min_id)
+            .order_by('timestamp', 'id')
+            .values_list('id', 'ip_address', 'timestamp', logged_path(), 'normalized_path',
+                         'hit_count', 'sample_weight', 'ip_weight', 'last_seen', 'country', 'city'))
+
+    builder = ColumnBuilder()
+    for row in rows.iterator(chunk_size=5000):
+        builder.add(*row)
+    if not builder.rows:
+        return None, 0, 0
+
+    part = len(day_archives(directory, day))
+    path = os.path.join(directory, archive_name(day, part, archive_format))
+    metadata = {'start': start.isoformat(), 'end': end.isoformat()}
+    size = WRITERS[archive_format](path, builder, metadata, compression=compression)
+    return path, builder.rows, size
+
+
+def day_archives(directory, day):
+    prefix = f"requestlog-{day:%Y%m%d}"
+    return [path for path in archive_files(directory) if os.path.basename(path).split('.')[0] == prefix]
+
+
+def archived_ids(day, archives):
+    """
+    Sorted ids of the rows of one day that `archives` hold. Archives written
+    before ids were stored only give an id range, which is trusted while the
+    day's rows in it are exactly as many as they archived; otherwise (rows
+    committed late below max_id, or already partly deleted) None.
+    """
+    ids = [archive.ids() for archive in archives]
+    if None not in ids:
+        return sorted(chain.from_iterable(ids))
+
+    max_id = max(archive.max_id for archive in archives)
+    in_range = list(RequestLog.objects.using(router.db_for_write(RequestLog))
+                    .filter(timestamp__gte=day, timestamp__lt=day + timedelta(days=1), id__lte=max_id)
+                    .order_by('pk')
+                    .values_list('pk', flat=True))
+    if len(in_range) != sum(archive.rows for archive in archives):
+        logger.warning(f"Not deleting {day:%Y-%m-%d}: its rows up to id {max_id} no longer match the archives")
+        return None
+    return in_range
+
+
+def delete_archived_rows(ids, chunk_size=5000, sleep=0.0):
+    """Delete archived rows by id in chunks, one short transaction per chunk"""
+    using = router.db_for_write(RequestLog)
+    deleted = 0
+    for first in range(0, len(ids), chunk_size):
+        with transaction.atomic(using=using):
+            deleted += RequestLog.objects.using(using).filter(pk__in=ids[first:first + chunk_size]).delete()[0]
+        if sleep and first + chunk_size < len(ids):
+            time.sleep(sleep)
+    return deleted
+
+
+def archive_before(cutoff, directory=None, archive_format=None, delete=True, progress=None):
+    """
+    Archive (and by default delete) every whole UTC day of RequestLog before
+    `cutoff`. A day already archived by an earlier, interrupted run first has
+    the rows its archives hold deleted; rows it does not hold go to a new part.
+    Only ids written to an archive are deleted, so a row committed late into
+    an archived day stays until the next run archives it.
+    `progress` is called with (day, path, rows, size, deleted). Returns the
+    number of archived rows.
+    """
+    archive_settings = get_archive_settings()
+    directory = str(directory or archive_settings['DIRECTORY'])
+    archive_format = archive_format or archive_settings['FORMAT']
+    if archive_format == 'parquet' and not parquet_available():
+        raise RuntimeError('Parquet archives need pyarrow installed')
+    os.makedirs(directory, exist_ok=True)
+
+    cutoff = day_floor(cutoff)
+    logs = RequestLog.objects.using(router.db_for_write(RequestLog)).order_by()
+    archived = 0
+    oldest = logs.filter(timestamp__lt=cutoff).aggregate(oldest=Min('timestamp'))['oldest']
+    while oldest is not None:
+        day = day_floor(oldest)
+        archives = [open_archive(path) for path in day_archives(directory, day)]
+        try:
+            max_id = max((archive.max_id for archive in archives), default=0)
+            ids = archived_ids(day, archives) if archives and delete else None
+        finally:
+            for archive in archives:
+                archive.close()
+        deleted = 0
+        if ids is not None and delete:
+            deleted += delete_archived_rows(
+                ids,
+                chunk_size=archive_settings['DELETE_CHUNK_SIZE'],
+                sleep=archive_settings['SLEEP_BETWEEN_CHUNKS'],
+            )
+            # Whatever is left of the day was never archived, whatever its id
+            max_id = 0
+
+        path, rows, size = export_day(
+            day, directory, archive_format, archive_settings['COMPRESSION'], min_id=max_id
+        )
+        if path and delete:
+            with open_archive(path) as archive:
+                ids = archive.ids()
+            deleted += delete_archived_rows(
+                ids,
+                chunk_size=archive_settings['DELETE_CHUNK_SIZE'],
+                sleep=archive_settings['SLEEP_BETWEEN_CHUNKS'],
+            )
+        archived += rows
+        logger.info(f"Archived {rows} RequestLog rows for {day:%Y-%m-%d}, deleted {deleted}")
+        if progress:
+            progress(day, path, rows, size, deleted)
+
+        next_day = day + timedelta(days=1)
+        oldest = logs.filter(timestamp__gte=next_day, timestamp__lt=cutoff).aggregate(
+            oldest=Min('timestamp')
+        )['oldest']
+    return archived
+
+
+class ColumnarArchive:
+    """Memory-mapped reader for one native archive file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as archive_file:
+            self._map = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a RequestLog archive')
+        header_length, = struct.unpack_from('<I', self._map, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(self._map[header_start:header_start + header_length])
+        self._data_start = header_start + header_length + (-(header_start + header_length) % ALIGNMENT)
+        self._cache = {}
+
+        self.start = datetime.fromisoformat(self.header['start'])
+        self.end = datetime.fromisoformat(self.header['end'])
+        self.rows = self.header['rows']
+        self.max_id = self.header['max_id']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Release the cached zero-copy views, then the map and its file descriptor"""
+        for value in self._cache.values():
+            if isinstance(value, memoryview):
+                value.release()
+        self._cache.clear()
+        self._map.close()
+
+    def ids(self):
+        """Sorted RequestLog ids of the archived rows, or None for archives written without them"""
+        if 'id_delta' not in self.header['blocks']:
+            return None
+        return list(accumulate(self.block('id_delta')))
+
+    def block(self, name):
+        """Column or dictionary block; uncompressed integer blocks are zero-copy views of the map"""
+        if name in self._cache:
+            return self._cache[name]
+        info = self.header['blocks'][name]
+        start = self._data_start + info['offset']
+        if info['codec'] == 'zlib':
+            data = zlib.decompress(self._map[start:start + info['length']])
+        else:
+            data = memoryview(self._map)[start:start + info['length']]
+
+        if info['type'] == 'json':
+            value = json.loads(bytes(data))
+        elif info['codec'] == 'none' and self.header['byteorder'] == sys.byteorder:
+            value = data.cast(info['type'])
+        else:
+            value = array(info['type'])
+            value.frombytes(data)
+            if self.header['byteorder'] != sys.byteorder:
+                value.byteswap()
+        self._cache[name] = value
+        return value
+
+    def timestamps_ms(self):
+        if 'timestamps' not in self._cache:
+            self._cache['timestamps'] = list(
+                accumulate(self.block('timestamp_delta'), initial=self.header['base_ms'])
+            )[1:]
+        return self._cache['timestamps']
+
+    def row_range(self, start=None, end=None):
+        """Slice of rows with start <= timestamp < end; rows are stored in timestamp order"""
+        timestamps = self.timestamps_ms()
+        first = bisect.bisect_left(timestamps, _to_ms(start)) if start else 0
+        last = bisect.bisect_left(timestamps, _to_ms(end)) if end else len(timestamps)
+        return slice(first, last)
+
+    def strings(self, name):
+        return self.block(f'{name}_values')
+
+    def ips(self):
+        return [_ip_string(high << 64 | low) for high, low in zip(self.block('ip_high'), self.block('ip_low'))]
+
+    def weighted_counts(self, keys, rows, weight='sample_weight'):
+        """
+        Requests per key over a row slice. Rows standing for one request are
+        counted with a single Counter pass; only heavier rows are summed one by one.
+        Per-IP counts pass weight='ip_weight' (or None for archives written
+        before that column) instead of the sample weight.
+        """
+        weights = self.block('hit_count')[rows]
+        if weight:
+            weights = list(map(operator.mul, weights, self.block(weight)[rows]))
+        counts = Counter(compress(keys, map((1).__eq__, weights)))
+        for key, weight in zip(compress(keys, map((1).__lt__, weights)), filter((1).__lt__, weights)):
+            counts[key] += weight
+        return counts
+
+    def aggregate(self, dimension, start=None, end=None):
+        """Requests per dimension value in [start, end) as a Counter keyed by display values"""
+        rows = self.row_range(start, end)
+        if rows.start >= rows.stop:
+            return Counter()
+
+        if dimension == 'total':
+            return Counter({None: sum(map(operator.mul, self.block('hit_count')[rows],
+                                          self.block('sample_weight')[rows]))})
+        if dimension == 'country':
+            counts = self.weighted_counts(self.block('country')[rows], rows)
+            countries = self.strings('country')
+            return Counter({countries[code] or None: count for code, count in counts.items()})
+        if dimension == 'city':
+            counts = self.weighted_counts(list(zip(self.block('city')[rows], self.block('country')[rows])), rows)
+            cities, countries = self.strings('city'), self.strings('country')
+            return Counter({
+                (cities[city] or None, countries[country] or None): count
+                for (city, country), count in counts.items()
+            })
+        if dimension == 'path':
+            counts = self.weighted_counts(
+                list(zip(self.block('normalized_path')[rows], self.block('path')[rows])), rows
+            )
+            normalized, raw = self.strings('normalized_path'), self.strings('path')
+            by_path = Counter()
+            for (normalized_code, raw_code), count in counts.items():
+                by_path[normalized[normalized_code] or raw[raw_code]] += count
+            return by_path
+        if dimension == 'ip':
+            ip_codes = self.block('ip')[rows]
+            weight = 'ip_weight' if 'ip_weight' in self.header['blocks'] else None
+            counts = self.weighted_counts(ip_codes, rows, weight=weight)
+            # Latest location seen for each IP in the slice
+            locations = dict(zip(ip_codes, zip(self.block('country')[rows], self.block('city')[rows])))
+            ips, countries, cities = self.ips(), self.strings('country'), self.strings('city')
+            return Counter({
+                (ips[code], countries[locations[code][0]] or None, cities[locations[code][1]] or None): count
+                for code, count in counts.items()
+            })
+        raise ValueError(f'Unknown archive dimension: {dimension}')
+
+
+class ParquetArchive:
+    """Reader for Parquet archives; scans are done by pyarrow compute kernels"""
+    DIMENSION_COLUMNS = {
+        'total': [],
+        'country': ['country'],
+        'city': ['city', 'country'],
+        'path': ['normalized_path', 'path'],
+        'ip': ['ip', 'country', 'city'],
+    }
+
+    def __init__(self, path):
+        if pyarrow is None:
+            raise RuntimeError('Reading Parquet archives needs pyarrow installed')
+        self.path = path
+        metadata = pyarrow_parquet.read_schema(path).metadata or {}
+        self.header = json.loads(metadata.get(b'ip_tracking', b'{}'))
+        self.start = datetime.fromisoformat(self.header['start'])
+        self.end = datetime.fromisoformat(self.header['end'])
+        self.rows = self.header['rows']
+        self.max_id = self.header['max_id']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Nothing is held open between scans"""
+
+    def ids(self):
+        """Sorted RequestLog ids of the archived rows, or None for archives written without them"""
+        if 'id' not in pyarrow_parquet.read_schema(self.path).names:
+            return None
+        return sorted(pyarrow_parquet.read_table(self.path, columns=['id'])['id'].to_pylist())
+
+    def aggregate(self, dimension, start=None, end=None):
+        if dimension not in self.DIMENSION_COLUMNS:
+            raise ValueError(f'Unknown archive dimension: {dimension}')
+        keys = self.DIMENSION_COLUMNS[dimension]
+        weight = 'sample_weight'
+        if dimension == 'ip':
+            # Archives written before ip_weight count an IP's rows as they are
+            weight = 'ip_weight' if 'ip_weight' in pyarrow_parquet.read_schema(self.path).names else None
+        table = pyarrow_parquet.read_table(
+            self.path,
+            columns=['timestamp', 'hit_count', *([weight] if weight else []), *keys],
+            memory_map=True,
+        )
+        mask = None
+        if start:
+            mask = pyarrow_compute.greater_equal(table['timestamp'], pyarrow.scalar(start, pyarrow.timestamp('ms', tz='UTC')))
+        if end:
+            before = pyarrow_compute.less(table['timestamp'], pyarrow.scalar(end, pyarrow.timestamp('ms', tz='UTC')))
+            mask = before if mask is None else pyarrow_compute.and_(mask, before)
+        if mask is not None:
+            table = table.filter(mask)
+        requests = table['hit_count'].cast(pyarrow.uint64())
+        if weight:
+            requests = pyarrow_compute.multiply(requests, table[weight])
+        table = table.append_column('requests', requests)
+
+        if not keys:
+            return Counter({None: pyarrow_compute.sum(table['requests']).as_py() or 0})
+        grouped = table.group_by(keys).aggregate([('requests', 'sum')]).to_pylist()
+        counts = Counter()
+        for group in grouped:
+            values = [group[key] for key in keys]
+            if dimension == 'path':
+                key = values[0] or values[1]
+            elif dimension == 'ip':
+                key = (_ip_string(int.from_bytes(values[0], 'big')), values[1] or None, values[2] or None)
+            elif dimension == 'city':
+                key = (values[0] or None, values[1] or None)
+            else:
+                key = values[0] or None
+            counts[key] += group['requests_sum']
+        return counts
+
+
+class ArchiveAnalytics:
+    """
+    geo_analytics-style queries over a directory of archives; the methods
+    mirror the rollups read helpers so the same report code can run on both.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = str(directory or get_archive_settings()['DIRECTORY'])
+        self._open = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for _, archive in self._open.values():
+            archive.close()
+        self._open.clear()
+
+    def _archive(self, path):
+        """Archives stay open across queries; a file rewritten since is reopened"""
+        modified = os.stat(path).st_mtime_ns
+        cached = self._open.get(path)
+        if cached is None or cached[0] != modified:
+            if cached is not None:
+                cached[1].close()
+            cached = self._open[path] = (modified, open_archive(path))
+        return cached[1]
+
+    def archives(self, start, end):
+        for path in archive_files(self.directory):
+            archive = self._archive(path)
+            if (end is None or archive.start < end) and (start is None or archive.end > start):
+                yield archive
+
+    def aggregate(self, dimension, start, end):
+        counts = Counter()
+        for archive in self.archives(start, end):
+            counts.update(archive.aggregate(dimension, start, end))
+        return counts
+
+    def span(self):
+        """(first, last) archived day boundaries, or (None, None) without archives"""
+        archives = list(self.archives(None, None))
+        if not archives:
+            return None, None
+        return min(archive.start for archive in archives), max(archive.end for archive in archives)
+
+    def total_requests(self, start=None, end=None):
+        return self.aggregate('total', start, end).get(None, 0)
+
+    def top_countries(self, start, end, top):
+        return [
+            {'country': country, 'count': count}
+            for country, count in self.aggregate('country', start, end).most_common(top)
+        ]
+
+    def top_cities(self, start, end, top):
+        return [
+            {'city': city, 'country': country, 'count': count}
+            for (city, country), count in self.aggregate('city', start, end).most_common(top)
+        ]
+
+    def top_paths(self, start, end, top):
+        return [
+            {'path': path, 'count': count}
+            for path, count in self.aggregate('path', start, end).most_common(top)
+        ]
+
+    def top_ips(self, start, end, top):
+        """Busiest IPs with the latest location archived for them"""
+        counts = Counter()
+        locations = {}
+        for archive in self.archives(start, end):
+            for (ip_address, country, city), count in archive.aggregate('ip', start, end).items():
+                counts[ip_address] += count
+                locations[ip_address] = (country, city)
+        return [
+            {'ip_address': ip_address, 'country': locations[ip_address][0],
+             'city': locations[ip_address][1], 'count': count}
+            for ip_address, count in counts.most_common(top)
+        ]
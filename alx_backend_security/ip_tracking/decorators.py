@@ -0,0 +1,49 @@
+import functools
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """execute_wrapper that counts the queries run on a connection"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget(max_queries):
+    """
+    Count the database queries a view runs, on every connection, including
+    template rendering. Going over `max_queries` is logged as a warning and,
+    with DEBUG on, raises QueryBudgetExceeded so regressions such as N+1
+    lookups fail loudly in development.
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            counter = QueryCounter()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(counter))
+                response = view_func(request, *args, **kwargs)
+
+            if counter.count > max_queries:
+                message = f"{view_func.__name__} ran {counter.count} queries, budget is {max_queries}"
+                logger.warning(message)
+                if settings.DEBUG:
+                    raise QueryBudgetExceeded(message)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,217 @@
+"""
+Live feed of block, unblock and detection events.
+
+Publishers call publish_event(), which numbers the event, keeps it in a short
+capped history list and PUBLISHes it on a Redis channel once the surrounding
+transaction commits. The event_stream view relays the channel to browsers as
+server-sent events.
+
+Each server process holds one Redis subscription, shared by every open
+stream through an EventHub: a listener task fans messages out to per-client
+asyncio queues, so an idle client costs a queue and a suspended coroutine,
+not a connection to Redis or a thread. A client that reconnects with
+Last-Event-ID is first sent the events it missed from the history list; the
+history is read only once Redis has confirmed the subscription, so an event
+published in between is relayed live rather than lost.
+
+The feed needs an ASGI server (ASGI_APPLICATION); under WSGI every open stream
+would pin a worker thread, so event_stream refuses it there.
+"""
+import asyncio
+import json
+import logging
+from functools import partial
+
+import redis
+import redis.asyncio as aioredis
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .redis_client import get_redis, get_redis_url
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EVENT_SETTINGS = {
+    'CHANNEL': 'ip_tracking:events',
+    'SEQUENCE_KEY': 'ip_tracking:events:seq',
+    'HISTORY_KEY': 'ip_tracking:events:history',
+    'HISTORY_SIZE': 500,
+    'HEARTBEAT_SECONDS': 15,
+    'RETRY_MS': 5000,
+    'QUEUE_SIZE': 100,
+    'SUBSCRIBE_TIMEOUT': 5,
+}
+
+EVENT_TYPES = ('blocked', 'unblocked', 'detected')
+
+
+def get_event_settings():
+    return {**DEFAULT_EVENT_SETTINGS, **getattr(settings, 'IP_TRACKING_EVENTS', {})}
+
+
+def make_event(event_type, ip_address, **data):
+    return {
+        'type': event_type,
+        'ip_address': ip_address,
+        'time': timezone.now().isoformat(),
+        **data,
+    }
+
+
+def publish_event(event_type, ip_address, **data):
+    """
+    Publish an event after the current transaction commits (immediately
+    outside one). Failures are logged, never raised: the feed is best effort
+    and must not undo a block.
+    """
+    publish_events([make_event(event_type, ip_address, **data)])
+
+
+def publish_events(events):
+    """publish_event() for a batch of make_event() dicts: one INCRBY and one pipeline"""
+    if events:
+        transaction.on_commit(partial(_publish, list(events)))
+
+
+def _publish(events):
+    config = get_event_settings()
+    try:
+        client = get_redis()
+        last_id = client.incrby(config['SEQUENCE_KEY'], len(events))
+        pipe = client.pipeline(transaction=False)
+        for event_id, event in enumerate(events, start=last_id - len(events) + 1):
+            event['id'] = event_id
+            message = json.dumps(event, separators=(',', ':'), default=str)
+            pipe.lpush(config['HISTORY_KEY'], message)
+            pipe.publish(config['CHANNEL'], message)
+        pipe.ltrim(config['HISTORY_KEY'], 0, config['HISTORY_SIZE'] - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        target = events[0]['ip_address'] if len(events) == 1 else f"{len(events)} IPs"
+        logger.error(f"Error publishing {events[0]['type']} event for {target}: {e}")
+
+
+def format_event(event):
+    """One SSE frame for an event dict"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+
+class EventHub:
+    """Shares one Redis subscription between every stream of this process"""
+
+    def __init__(self):
+        self.queues = set()
+        self.listener = None
+        self.subscribed = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=get_event_settings()['QUEUE_SIZE'])
+        self.queues.add(queue)
+        if self.listener is None or self.listener.done():
+            self.subscribed = asyncio.Event()
+            self.listener = asyncio.get_running_loop().create_task(self.listen())
+        return queue
+
+    async def ready(self):
+        """
+        Wait until Redis has confirmed the channel subscription. Sending
+        SUBSCRIBE does not wait for the reply, and an event published before
+        the reply would be neither in the history read nor delivered live.
+        Gives up after SUBSCRIBE_TIMEOUT while Redis is unreachable.
+        """
+        timeout = get_event_settings()['SUBSCRIBE_TIMEOUT']
+        try:
+            await asyncio.wait_for(self.subscribed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Event subscription not confirmed after {timeout}s, live events may be missed")
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+        if not self.queues and self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+
+    def dispatch(self, event):
+        for queue in list(self.queues):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow to keep up: end its stream, the browser reconnects
+                # with Last-Event-ID and catches up from the history
+                self.queues.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def listen(self):
+        config = get_event_settings()
+        while self.queues:
+            client = aioredis.Redis.from_url(get_redis_url(), decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(config['CHANNEL'])
+                async for message in pubsub.listen():
+                    if message['type'] == 'subscribe':
+                        self.subscribed.set()
+                        continue
+                    if message['type'] != 'message':
+                        continue
+                    try:
+                        event = json.loads(message['data'])
+                    except ValueError:
+                        continue
+                    self.dispatch(event)
+            except redis.RedisError as e:
+                logger.error(f"Event subscription lost, retrying: {e}")
+                await asyncio.sleep(config['RETRY_MS'] / 1000)
+            finally:
+                self.subscribed.clear()
+                await pubsub.aclose()
+                await client.aclose()
+
+
+hub = EventHub()
+
+
+async def missed_events(last_event_id):
+    """Events newer than last_event_id still in the history list, oldest first"""
+    config = get_event_settings()
+    client = aioredis.Redis.from_url(get_redis_url(), decode_responses=True)
+    try:
+        messages = await client.lrange(config['HISTORY_KEY'], 0, -1)
+    except redis.RedisError as e:
+        logger.error(f"Error reading event history: {e}")
+        return []
+    finally:
+        await client.aclose()
+    events = [json.loads(message) for message in reversed(messages)]
+    return [event for event in events if event['id'] > last_event_id]
+
+
+async def event_frames(last_event_id=None, event_types=None):
+    """SSE frames for one client: missed events, then live ones, with heartbeats"""
+    config = get_event_settings()
+    queue = hub.subscribe()
+    try:
+        await hub.ready()
+        yield f"retry: {config['RETRY_MS']}\n\n"
+        sent = last_event_id or 0
+        if last_event_id is not None:
+            for event in await missed_events(last_event_id):
+                if not event_types or event['type'] in event_types:
+                    yield format_event(event)
+                sent = event['id']
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=config['HEARTBEAT_SECONDS'])
+            except asyncio.TimeoutError:
+                yield ': heartbeat\n\n'
+                continue
+            if event is None:
+                return
+            # Subscribed before reading the history, so skip the overlap
+            if event['id'] <= sent or (event_types and event['type'] not in event_types):
+                continue
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(queue)
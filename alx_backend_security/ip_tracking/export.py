@@ -0,0 +1,134 @@
+"""
+Streaming bulk export of RequestLog as CSV or NDJSON.
+
+Rows are read in (timestamp, id) order with .iterator(), so the database
+hands them over in chunks (a server-side cursor on PostgreSQL) and only one
+chunk is in memory at a time, however many rows are exported. Every row
+carries a cursor; passing the last one received as `after` resumes the
+export right behind it. Rows younger than SETTLE_SECONDS are left out so a
+request written late by a batching sink cannot land behind a cursor that
+was already handed out. By default that is the sink's own worst case
+(ingestion.ingestion_delay) plus SETTLE_MARGIN; a row that arrives later
+still, from a consumer that was down or a replayed dead-letter entry, is
+behind the cursor and only picked up by exporting its window again.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import timedelta
+
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .ingestion import ingestion_delay
+from .models import RequestLog, logged_path
+from .pagination import decode_cursor, encode_position
+
+DEFAULT_EXPORT_SETTINGS = {
+    'CHUNK_SIZE': 2000,
+    'SETTLE_SECONDS': None,
+    'SETTLE_MARGIN': 60,
+}
+
+FORMATS = ('csv', 'ndjson')
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+EXPORT_FIELDS = (
+    'cursor', 'id', 'timestamp', 'last_seen', 'ip_address', 'path', 'normalized_path',
+    'hit_count', 'sample_weight', 'ip_weight', 'country', 'city',
+)
+
+
+def get_export_settings():
+    return {**DEFAULT_EXPORT_SETTINGS, **getattr(settings, 'REQUEST_LOG_EXPORT', {})}
+
+
+def settle_seconds():
+    """How far behind now exports stop: SETTLE_SECONDS, or derived from the sink settings"""
+    export_settings = get_export_settings()
+    if export_settings['SETTLE_SECONDS'] is not None:
+        return export_settings['SETTLE_SECONDS']
+    return ingestion_delay() + export_settings['SETTLE_MARGIN']
+
+
+def parse_export_time(value, name):
+    """ISO 8601 value as an aware datetime; naive values are taken as UTC"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'{name} must be an ISO 8601 datetime')
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=dt_timezone.utc)
+
+
+def export_rows(start=None, end=None, ips=None, after=None):
+    """
+    Values rows to export, oldest first. Raises ValueError for a malformed
+    `after` cursor rather than silently starting over.
+    """
+    settled = timezone.now() - timedelta(seconds=settle_seconds())
+    logs = RequestLog.objects.filter(timestamp__lt=min(end, settled) if end else settled)
+    if start:
+        logs = logs.filter(timestamp__gte=start)
+    if ips:
+        logs = logs.filter(ip_address__in=ips)
+    if after:
+        position = decode_cursor(after)
+        if position is None:
+            raise ValueError(f'Invalid export cursor: {after}')
+        timestamp, pk = position
+        logs = logs.filter(Q(timestamp__gte=timestamp),
+                           Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+    return (logs
+            .order_by('timestamp', 'pk')
+            .values_list('id', 'timestamp', 'last_seen', 'ip_address', logged_path(), 'normalized_path',
+                         'hit_count', 'sample_weight', 'ip_weight', 'country', 'city'))
+
+
+def _records(rows, chunk_size, limit=None):
+    for count, row in enumerate(rows.iterator(chunk_size=chunk_size)):
+        if limit is not None and count >= limit:
+            return
+        pk, timestamp, last_seen = row[:3]
+        yield (
+            encode_position(timestamp, pk), pk, timestamp.isoformat(),
+            last_seen.isoformat() if last_seen else None, *row[3:],
+        )
+
+
+def iter_export(rows, export_format='csv', chunk_size=None, limit=None):
+    """Text chunks of the export, about one database chunk each"""
+    chunk_size = chunk_size or get_export_settings()['CHUNK_SIZE']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if export_format == 'csv' else None
+    if writer:
+        writer.writerow(EXPORT_FIELDS)
+
+    for count, record in enumerate(_records(rows, chunk_size, limit), start=1):
+        if writer:
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps(dict(zip(EXPORT_FIELDS, record)), separators=(',', ':')))
+            buffer.write('\n')
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Compress a stream of text chunks into one gzip member"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
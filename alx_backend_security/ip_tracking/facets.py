@@ -0,0 +1,72 @@
+"""
+Filter choices for the RequestLog admin changelist.
+
+The country, city and IP filters list the busiest values of the last
+FACET_DAYS according to the traffic rollups instead of a DISTINCT over every
+RequestLog row. The choices are computed together and cached; the
+update_traffic_rollups task recomputes them once they are FACET_CACHE_SECONDS
+old, so the admin only computes them itself when nothing is cached at all.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from . import rollups
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REQUEST_LOG_ADMIN_SETTINGS = {
+    'COUNT_LIMIT': 10000,
+    'COUNT_CACHE_SECONDS': 300,
+    'FACET_LIMIT': 20,
+    'FACET_DAYS': 7,
+    'FACET_CACHE_SECONDS': 600,
+    'SEARCH_PATH_REFS': 1000,
+}
+
+FACETS_KEY = 'ip_tracking:request_log_facets'
+
+
+def get_request_log_admin_settings():
+    return {**DEFAULT_REQUEST_LOG_ADMIN_SETTINGS, **getattr(settings, 'REQUEST_LOG_ADMIN', {})}
+
+
+def compute_facets():
+    """(value, label) choices per filter parameter, busiest first"""
+    config = get_request_log_admin_settings()
+    end = timezone.now()
+    start = end - timedelta(days=config['FACET_DAYS'])
+    top = config['FACET_LIMIT']
+    return {
+        'country': [(row['country'], row['country'])
+                    for row in rollups.top_countries(start, end, top) if row['country']],
+        # 'country|city', so the city filter can lead with country on the location index
+        'city': [(f"{row['country']}|{row['city']}", f"{row['city']}, {row['country']}")
+                 for row in rollups.top_cities(start, end, top) if row['city']],
+        'ip_address': [(row['ip_address'], f"{row['ip_address']} ({row['count']})")
+                       for row in rollups.top_ips(start, end, top)],
+    }
+
+
+def refresh_facets(force=False):
+    """Recompute the cached choices if they are older than FACET_CACHE_SECONDS; returns True if it did"""
+    config = get_request_log_admin_settings()
+    cached = cache.get(FACETS_KEY)
+    if not force and cached and time.time() - cached['computed_at'] < config['FACET_CACHE_SECONDS']:
+        return False
+    facets = compute_facets()
+    # Kept past their refresh age so readers never wait on a recompute while the task runs
+    cache.set(FACETS_KEY, {'computed_at': time.time(), 'facets': facets}, config['FACET_CACHE_SECONDS'] * 3)
+    return True
+
+
+def get_facets():
+    cached = cache.get(FACETS_KEY)
+    if cached is None:
+        refresh_facets(force=True)
+        cached = cache.get(FACETS_KEY) or {'facets': {}}
+    return cached['facets']
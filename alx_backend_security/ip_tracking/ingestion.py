@@ -0,0 +1,441 @@
+"""
+Write path for RequestLog rows.
+
+The middleware turns each request into a plain record dict and hands it to a
+sink. The database sink buffers records per process and writes them in
+batches through a backend: the ORM backend (bulk_create, works everywhere)
+or the COPY backend, which streams rows through PostgreSQL COPY FROM STDIN
+and falls back to the ORM backend on other databases. The segment sink
+(see segments.py) appends to local files instead and leaves the database
+write and the geolocation lookup to a loader; the stream sink (see
+streams.py) does the same through a Redis Stream and consumer groups.
+With COLLAPSE_WINDOW set, any of them is wrapped in a collapsing sink that
+merges repeated identical requests into one counted row first.
+"""
+import atexit
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from .models import RequestLog
+from .normalization import normalize_path
+from .paths import compact_enabled, path_ids
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INGESTION_SETTINGS = {
+    'SINK': 'database',
+    'BACKEND': 'orm',
+    'BATCH_SIZE': 1,
+    'FLUSH_INTERVAL': 2.0,
+    'COPY_MODE': 'direct',
+    'SEGMENT_DIR': os.path.join(settings.BASE_DIR, 'request_segments'),
+    'SEGMENT_MAX_BYTES': 16 * 1024 * 1024,
+    'SEGMENT_MAX_AGE': 10.0,
+    'LOADER_BATCH_SIZE': 5000,
+    'STREAM_KEY': 'ip_tracking:requests',
+    'STREAM_MAXLEN': 1000000,
+    'STREAM_BATCH_SIZE': 1000,
+    'STREAM_BLOCK_MS': 5000,
+    'STREAM_CLAIM_IDLE_MS': 60000,
+    'STREAM_MAX_DELIVERIES': 5,
+    'COLLAPSE_WINDOW': 0,
+    'COLLAPSE_MAX_KEYS': 10000,
+}
+
+# Columns written for every record, in COPY column order
+RECORD_FIELDS = (
+    'ip_address', 'timestamp', 'path', 'path_ref_id', 'normalized_path',
+    'sample_weight', 'ip_weight', 'hit_count', 'last_seen', 'country', 'city',
+)
+
+
+# Seconds between runs of the load-request-segments beat entry (celery.py)
+SEGMENT_LOAD_INTERVAL = 15.0
+
+
+def get_ingestion_settings():
+    return {**DEFAULT_INGESTION_SETTINGS, **getattr(settings, 'REQUEST_LOG_INGESTION', {})}
+
+
+def ingestion_delay(ingestion_settings=None):
+    """
+    Seconds the configured sink can take, with its workers running, between a
+    request's timestamp and its RequestLog row: the collapse window plus the
+    buffer flush interval, the segment age and loader interval, or the stream
+    block time and every redelivery of a failing entry. A stopped or
+    backlogged consumer can exceed it.
+    """
+    ingestion_settings = ingestion_settings or get_ingestion_settings()
+    delay = ingestion_settings['COLLAPSE_WINDOW']
+    sink = ingestion_settings['SINK']
+    if sink == 'database' and ingestion_settings['BATCH_SIZE'] > 1:
+        delay += ingestion_settings['FLUSH_INTERVAL']
+    elif sink == 'segments':
+        delay += ingestion_settings['SEGMENT_MAX_AGE'] + SEGMENT_LOAD_INTERVAL
+    elif sink == 'stream':
+        delay += (ingestion_settings['STREAM_BLOCK_MS']
+                  + ingestion_settings['STREAM_CLAIM_IDLE_MS'] * ingestion_settings['STREAM_MAX_DELIVERIES']) / 1000
+    return delay
+
+
+def prepare_rows(records):
+    """
+    Turn sink records into RequestLog column values: the path is normalized
+    and, in compact format, replaced by a reference to its RequestPath entry.
+    """
+    references = path_ids([record['path'] for record in records]) if compact_enabled() else {}
+    rows = []
+    for record in records:
+        row = {field: record.get(field) for field in RECORD_FIELDS}
+        row['normalized_path'] = normalize_path(record['path'])
+        row['sample_weight'] = record.get('sample_weight') or 1
+        row['ip_weight'] = record.get('ip_weight') or 1
+        row['hit_count'] = record.get('hit_count') or 1
+        path_id = references.get(record['path'])
+        if path_id is not None:
+            row['path'] = ''
+            row['path_ref_id'] = path_id
+        rows.append(row)
+    return rows
+
+
+class ORMBackend:
+    """bulk_create in batches; the portable path and the fallback for SQLite"""
+    name = 'orm'
+
+    def __init__(self, model=None):
+        # Another model with RequestLog's columns, e.g. the benchmark's scratch copy
+        self.model = model or RequestLog
+
+    def write(self, records):
+        return self.write_rows(prepare_rows(records))
+
+    def write_rows(self, rows):
+        using = router.db_for_write(self.model)
+        self.model.objects.using(using).bulk_create(
+            [self.model(**row) for row in rows],
+            batch_size=1000
+        )
+        return len(rows)
+
+
+def _copy_value(value):
+    """Encode one value for COPY text format"""
+    if value is None:
+        return '\\N'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def _copy_payload(rows):
+    payload = io.StringIO()
+    for row in rows:
+        payload.write('\t'.join(_copy_value(row[field]) for field in RECORD_FIELDS))
+        payload.write('\n')
+    payload.seek(0)
+    return payload
+
+
+def _copy_from(cursor, sql, payload):
+    raw_cursor = cursor.cursor
+    if hasattr(raw_cursor, 'copy_expert'):
+        raw_cursor.copy_expert(sql, payload)
+    else:
+        # psycopg 3
+        with raw_cursor.copy(sql) as copy:
+            copy.write(payload.getvalue())
+
+
+class CopyBackend:
+    """
+    Stream records into RequestLog with COPY FROM STDIN.
+
+    In 'direct' mode rows are copied straight into the table. In 'staging'
+    mode they are copied into a session-local temp table and merged with one
+    INSERT ... SELECT, which keeps the COPY itself clear of the table's
+    indexes and triggers and lets a failed batch leave RequestLog untouched.
+    """
+    name = 'copy'
+
+    def __init__(self, mode='direct', model=None):
+        if mode not in ('direct', 'staging'):
+            raise ValueError("COPY_MODE must be 'direct' or 'staging'")
+        self.mode = mode
+        self.model = model or RequestLog
+        self.fallback = ORMBackend(self.model)
+
+    def write(self, records):
+        rows = prepare_rows(records)
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        if connection.vendor != 'postgresql':
+            return self.fallback.write_rows(rows)
+
+        quote_name = connection.ops.quote_name
+        table = quote_name(self.model._meta.db_table)
+        columns = ', '.join(quote_name(self.model._meta.get_field(field).column) for field in RECORD_FIELDS)
+        payload = _copy_payload(rows)
+
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            if self.mode == 'staging':
+                staging = quote_name(f"{self.model._meta.db_table}_staging")
+                cursor.execute(
+                    f'CREATE TEMP TABLE IF NOT EXISTS {staging} '
+                    f'AS SELECT {columns} FROM {table} WITH NO DATA'
+                )
+                # Cleared per batch: the write may be nested in an outer transaction
+                cursor.execute(f'TRUNCATE {staging}')
+                _copy_from(cursor, f'COPY {staging} ({columns}) FROM STDIN', payload)
+                cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging}')
+            else:
+                _copy_from(cursor, f'COPY {table} ({columns}) FROM STDIN', payload)
+        return len(rows)
+
+
+def get_backend(name=None):
+    ingestion_settings = get_ingestion_settings()
+    name = name or ingestion_settings['BACKEND']
+    if name == 'copy':
+        return CopyBackend(mode=ingestion_settings['COPY_MODE'])
+    if name == 'orm':
+        return ORMBackend()
+    raise ValueError(f"Unknown REQUEST_LOG_INGESTION backend: {name}")
+
+
+class DatabaseSink:
+    """
+    Buffers records in-process and writes them through a backend.
+
+    A batch is written once BATCH_SIZE records are waiting, or once the
+    oldest buffered record is FLUSH_INTERVAL seconds old: by the next request
+    or, on an idle worker, by a timer started with the buffer. Whatever is
+    left is flushed when the process exits.
+    """
+    defers_enrichment = False
+
+    def __init__(self, backend, batch_size=1, flush_interval=2.0):
+        self.backend = backend
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = flush_interval
+        self._records = []
+        self._oldest = None
+        self._timer = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def emit(self, record):
+        batch = None
+        with self._lock:
+            self._records.append(record)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if (len(self._records) >= self.batch_size
+                    or time.monotonic() - self._oldest >= self.flush_interval):
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch:
+            self._write(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take()
+        if batch:
+            self._write(batch)
+
+    def _flush_on_timer(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connection; don't leave it behind
+            connections.close_all()
+
+    def _take(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._records, self._oldest = self._records, [], None
+        return batch
+
+    def _write(self, records):
+        try:
+            self.backend.write(records)
+        except Exception as e:
+            logger.error(f"Error logging {len(records)} request(s): {e}")
+
+
+class CollapsingSink:
+    """
+    Merges repeated identical requests before they reach another sink.
+
+    Records with the same IP, path and sample weight that arrive within
+    `window` seconds of the first one become a single record whose hit_count
+    is the number of requests and whose last_seen is the latest timestamp.
+    A group is passed on once its window has passed: by the next emit or, on
+    an idle worker, by a timer set for the oldest open group. Groups are also
+    passed on when more than `max_keys` are open, and on flush.
+    """
+
+    def __init__(self, inner, window, max_keys=10000):
+        self.inner = inner
+        self.window = window
+        self.max_keys = max(max_keys, 1)
+        self.defers_enrichment = inner.defers_enrichment
+        self._groups = OrderedDict()
+        self._timer = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def emit(self, record):
+        now = time.monotonic()
+        key = (record['ip_address'], record['path'], record.get('sample_weight'), record.get('ip_weight'))
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                self._groups[key] = (now, {**record, 'hit_count': record.get('hit_count') or 1})
+            else:
+                group[1]['hit_count'] += record.get('hit_count') or 1
+                group[1]['last_seen'] = record['timestamp']
+            ready = self._take_expired(now)
+            self._schedule(now)
+        for record in ready:
+            self.inner.emit(record)
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            ready = [record for _, record in self._groups.values()]
+            self._groups.clear()
+        for record in ready:
+            self.inner.emit(record)
+        self.inner.flush()
+
+    def _schedule(self, now):
+        # Called with the lock held: one timer at a time, due when the oldest group expires
+        if self._timer is None and self._groups:
+            started, _ = next(iter(self._groups.values()))
+            self._timer = threading.Timer(max(self.window - (now - started), 0), self._emit_on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _emit_on_timer(self):
+        now = time.monotonic()
+        with self._lock:
+            self._timer = None
+            ready = self._take_expired(now)
+            self._schedule(now)
+        try:
+            for record in ready:
+                self.inner.emit(record)
+        finally:
+            # The timer thread opened its own connection if the inner sink wrote; don't leave it behind
+            connections.close_all()
+
+    def _take_expired(self, now):
+        # Groups are kept in arrival order, so expired ones are at the front
+        ready = []
+        while self._groups:
+            started, record = next(iter(self._groups.values()))
+            if now - started < self.window and len(self._groups) <= self.max_keys:
+                break
+            self._groups.popitem(last=False)
+            ready.append(record)
+        return ready
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def build_sink(ingestion_settings):
+    sink = _build_inner_sink(ingestion_settings)
+    if ingestion_settings['COLLAPSE_WINDOW'] > 0:
+        return CollapsingSink(
+            sink,
+            window=ingestion_settings['COLLAPSE_WINDOW'],
+            max_keys=ingestion_settings['COLLAPSE_MAX_KEYS'],
+        )
+    return sink
+
+
+def _build_inner_sink(ingestion_settings):
+    if ingestion_settings['SINK'] == 'database':
+        return DatabaseSink(
+            get_backend(ingestion_settings['BACKEND']),
+            batch_size=ingestion_settings['BATCH_SIZE'],
+            flush_interval=ingestion_settings['FLUSH_INTERVAL'],
+        )
+    if ingestion_settings['SINK'] == 'segments':
+        from .segments import SegmentSink
+        return SegmentSink(
+            ingestion_settings['SEGMENT_DIR'],
+            max_bytes=ingestion_settings['SEGMENT_MAX_BYTES'],
+            max_age=ingestion_settings['SEGMENT_MAX_AGE'],
+        )
+    if ingestion_settings['SINK'] == 'stream':
+        from .streams import RedisStreamSink
+        return RedisStreamSink(
+            ingestion_settings['STREAM_KEY'],
+            maxlen=ingestion_settings['STREAM_MAXLEN'],
+        )
+    raise ValueError(f"Unknown REQUEST_LOG_INGESTION sink: {ingestion_settings['SINK']}")
+
+
+def get_sink():
+    """Process-wide sink built from REQUEST_LOG_INGESTION"""
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = build_sink(get_ingestion_settings())
+    return _sink
+
+
+def enrich_records(records):
+    """Fill in country and city for records whose sink deferred the lookup"""
+    from .middleware import IPTrackingMiddleware
+
+    middleware = IPTrackingMiddleware(lambda request: None)
+    locations = {}
+    for record in records:
+        if record.get('country') is not None:
+            continue
+        ip_address = record['ip_address']
+        if ip_address not in locations:
+            locations[ip_address] = middleware.get_geolocation(ip_address)
+        record['country'] = locations[ip_address].get('country')
+        record['city'] = locations[ip_address].get('city')
+    return records
+
+
+def load_pending_segments(max_segments=None):
+    """Load sealed request segments into RequestLog. Returns (segments, records)."""
+    from .segments import load_segments
+
+    ingestion_settings = get_ingestion_settings()
+    return load_segments(
+        str(ingestion_settings['SEGMENT_DIR']),
+        get_backend(ingestion_settings['BACKEND']),
+        batch_size=ingestion_settings['LOADER_BATCH_SIZE'],
+        enrich=enrich_records,
+        orphan_after=ingestion_settings['SEGMENT_MAX_AGE'] * 6,
+        max_segments=max_segments,
+    )
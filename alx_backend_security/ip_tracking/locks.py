@@ -0,0 +1,189 @@
+import functools
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY_PREFIX = 'task_lock'
+LOCK_METRICS = ('acquired', 'skipped', 'coalesced', 'waited_ms', 'lease_lost')
+
+# Compare-and-set on the owner token, so a run whose lease already expired
+# cannot extend or free a lock another run has taken since
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def record_lock_metric(name, metric, amount=1):
+    """Increment a lock counter in the cache, creating it on first use"""
+    key = f"{LOCK_KEY_PREFIX}:{name}:{metric}"
+    if not cache.add(key, amount, None):
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            cache.set(key, amount, None)
+
+
+def get_lock_stats(name):
+    """Return the recorded counters for a lock name"""
+    keys = {f"{LOCK_KEY_PREFIX}:{name}:{metric}": metric for metric in LOCK_METRICS}
+    values = cache.get_many(list(keys))
+    return {metric: values.get(key, 0) for key, metric in keys.items()}
+
+
+class TaskLock:
+    """
+    Distributed lock stored in Redis, held for a lease that a background
+    heartbeat keeps extending while the owner is alive.
+
+    If the worker dies the heartbeat stops and the lease expires, so a crashed
+    run can block the next one for at most `lease` seconds.
+    """
+
+    def __init__(self, name, lease=300, heartbeat=None):
+        self.name = name
+        self.key = f"{LOCK_KEY_PREFIX}:{name}"
+        self.lease = lease
+        self.heartbeat_interval = heartbeat or lease / 3
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+        self._stop = threading.Event()
+        self._heartbeat_thread = None
+
+    def acquire(self, wait=0, poll_interval=0.5):
+        """Try to take the lock, waiting up to `wait` seconds. Returns True on success."""
+        started = time.monotonic()
+        deadline = started + wait
+        while True:
+            if get_redis().set(self.key, self.token, nx=True, px=int(self.lease * 1000)):
+                self.acquired = True
+                break
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(poll_interval)
+
+        waited_ms = int((time.monotonic() - started) * 1000)
+        if waited_ms:
+            record_lock_metric(self.name, 'waited_ms', waited_ms)
+
+        if self.acquired:
+            record_lock_metric(self.name, 'acquired')
+            self._start_heartbeat()
+        return self.acquired
+
+    def is_owner(self):
+        return get_redis().get(self.key) == self.token
+
+    def extend(self):
+        """Push the lease out again. Returns False if the lock was lost."""
+        extend = get_redis().register_script(EXTEND_SCRIPT)
+        return bool(extend(keys=[self.key], args=[self.token, int(self.lease * 1000)]))
+
+    def release(self):
+        self._stop.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join(timeout=self.heartbeat_interval)
+            self._heartbeat_thread = None
+
+        if self.acquired:
+            get_redis().register_script(RELEASE_SCRIPT)(keys=[self.key], args=[self.token])
+        self.acquired = False
+
+    def _start_heartbeat(self):
+        self._stop.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat,
+            name=f'task-lock-heartbeat-{self.name}',
+            daemon=True,
+        )
+        self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                if not self.extend():
+                    record_lock_metric(self.name, 'lease_lost')
+                    logger.warning(f"Lost lease on task lock {self.name}")
+                    return
+            except Exception as e:
+                logger.warning(f"Task lock heartbeat failed for {self.name}: {e}")
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def single_flight(name=None, lease=300, wait=0, coalesce=False, max_reruns=3):
+    """
+    Decorator that lets only one run of a task execute at a time.
+
+    Runs that find the lock held either skip (default) or, with coalesce=True,
+    leave a pending marker so the run holding the lock executes once more when
+    it finishes, folding every overlapping trigger into a single rerun. The
+    marker is checked again after the lock is released, and a trigger retries
+    the lock after leaving it, so one arriving as the holder finishes is not lost.
+    """
+    def decorator(func):
+        lock_name = name or f"{func.__module__}.{func.__name__}"
+        pending_key = f"{LOCK_KEY_PREFIX}:{lock_name}:pending"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            lock = TaskLock(lock_name, lease=lease)
+            if not lock.acquire(wait=wait):
+                if not coalesce:
+                    record_lock_metric(lock_name, 'skipped')
+                    logger.info(f"{lock_name} already running, skipping this run")
+                    return {'status': 'skipped', 'lock': lock_name}
+
+                cache.set(pending_key, True, lease)
+                # The holder may have checked for the marker and released the
+                # lock since: then nobody else will see it, so run it here
+                if not lock.acquire():
+                    record_lock_metric(lock_name, 'coalesced')
+                    logger.info(f"{lock_name} already running, coalesced into the active run")
+                    return {'status': 'coalesced', 'lock': lock_name}
+
+            reruns = 0
+            while True:
+                try:
+                    if coalesce:
+                        # This run covers every trigger coalesced before it starts
+                        cache.delete(pending_key)
+                    result = func(*args, **kwargs)
+                    while coalesce and reruns < max_reruns and cache.delete(pending_key):
+                        reruns += 1
+                        logger.info(f"Rerunning {lock_name} for coalesced trigger #{reruns}")
+                        result = func(*args, **kwargs)
+                finally:
+                    lock.release()
+
+                # A trigger that coalesced after the last check but before the
+                # release is only seen now; rerun for it unless another run took the lock
+                if not (coalesce and reruns < max_reruns and cache.get(pending_key) and lock.acquire()):
+                    return result
+                reruns += 1
+                logger.info(f"Rerunning {lock_name} for coalesced trigger #{reruns}")
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,51 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import CommandError
+from ip_tracking.archive import ArchiveAnalytics
+from ip_tracking.management.commands.geo_analytics import Command as GeoAnalyticsCommand
+
+
+class Command(GeoAnalyticsCommand):
+    help = 'Run geo_analytics reports over archived request logs'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--start',
+            help='First UTC date to analyze, YYYY-MM-DD (default: the oldest archive)'
+        )
+        parser.add_argument(
+            '--end',
+            help='UTC date to stop before, YYYY-MM-DD (default: after the newest archive)'
+        )
+        parser.add_argument(
+            '--directory',
+            help="Archive directory (default: REQUEST_ARCHIVE['DIRECTORY'])"
+        )
+
+    def get_source(self, options):
+        return ArchiveAnalytics(options['directory'])
+
+    def handle(self, *args, **options):
+        try:
+            super().handle(*args, **options)
+        finally:
+            # Unmap the archives the reports opened
+            if getattr(self, 'source', None) is not None:
+                self.source.close()
+
+    def get_period(self, options):
+        first, last = self.source.span()
+        if first is None:
+            raise CommandError(f'No archives found in {self.source.directory}')
+        start_date = self.parse_date(options['start'], '--start') or first
+        end_date = self.parse_date(options['end'], '--end') or last
+        return start_date, end_date, f'Archived Request Analytics - {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}'
+
+    def parse_date(self, value, option):
+        if not value:
+            return None
+        try:
+            return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            raise CommandError(f'{option} must be a date in YYYY-MM-DD format')
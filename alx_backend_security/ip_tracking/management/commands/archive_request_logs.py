@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ip_tracking.archive import FORMATS, archive_before, get_archive_settings, parquet_available
+
+
+class Command(BaseCommand):
+    help = 'Export whole days of RequestLog to columnar archive files, then delete the archived rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            help="Archive days before this UTC date, YYYY-MM-DD (default: REQUEST_ARCHIVE['AFTER_DAYS'] days ago)"
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help="Archive format (default: REQUEST_ARCHIVE['FORMAT']); parquet needs pyarrow"
+        )
+        parser.add_argument(
+            '--directory',
+            help="Where archives are written (default: REQUEST_ARCHIVE['DIRECTORY'])"
+        )
+        parser.add_argument(
+            '--keep-rows',
+            action='store_true',
+            help='Write the archives but leave the rows in RequestLog'
+        )
+
+    def handle(self, *args, **options):
+        archive_settings = get_archive_settings()
+        if options['format'] == 'parquet' and not parquet_available():
+            raise CommandError('The parquet format needs pyarrow installed')
+
+        if options['before']:
+            try:
+                cutoff = datetime.strptime(options['before'], '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError('--before must be a date in YYYY-MM-DD format')
+        else:
+            cutoff = timezone.now() - timedelta(days=archive_settings['AFTER_DAYS'])
+
+        def progress(day, path, rows, size, deleted):
+            if path:
+                self.stdout.write(f'{day:%Y-%m-%d}: {rows} rows -> {path} ({size / 1024:.1f} KB), {deleted} deleted')
+            else:
+                self.stdout.write(f'{day:%Y-%m-%d}: nothing new to archive, {deleted} deleted')
+
+        archived = archive_before(
+            cutoff,
+            directory=options['directory'],
+            archive_format=options['format'],
+            delete=not options['keep_rows'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} rows logged before {cutoff:%Y-%m-%d}.'))
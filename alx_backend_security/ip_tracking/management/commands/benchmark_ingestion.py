@@ -0,0 +1,99 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.utils import timezone
+from ip_tracking.ingestion import CopyBackend, ORMBackend
+from ip_tracking.management.commands.benchmark_tracking_db import BENCHMARK_TABLE, benchmark_model
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare RequestLog write throughput of create(), bulk_create() and COPY. '
+        'Rows go to a scratch copy of the RequestLog table that is dropped after each method.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=10000,
+            help='Synthetic rows written per method (default: 10000)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per bulk_create/COPY batch (default: 1000)'
+        )
+        parser.add_argument(
+            '--methods',
+            type=str,
+            default='create,bulk_create,copy,copy_staging',
+            help='Comma separated methods to run (default: all)'
+        )
+
+    def handle(self, *args, **options):
+        records = self.make_records(options['rows'])
+        batch_size = options['batch_size']
+        model = benchmark_model()
+        using = router.db_for_write(model)
+        is_postgresql = connections[using].vendor == 'postgresql'
+        if BENCHMARK_TABLE in connections[using].introspection.table_names():
+            raise CommandError(f'{BENCHMARK_TABLE} already exists on {using}; drop it or let a running benchmark finish')
+
+        writers = {
+            'create': lambda: [model.objects.using(using).create(**record) for record in records],
+            'bulk_create': lambda: self.write_batches(ORMBackend(model), records, batch_size),
+            'copy': lambda: self.write_batches(CopyBackend('direct', model), records, batch_size),
+            'copy_staging': lambda: self.write_batches(CopyBackend('staging', model), records, batch_size),
+        }
+
+        self.stdout.write(
+            f'Writing {len(records)} rows per method to {connections[using].vendor} '
+            f'(each run starts from an empty scratch table and commits its writes)'
+        )
+        self.stdout.write('-' * 50)
+
+        for method in options['methods'].split(','):
+            method = method.strip()
+            if method not in writers:
+                self.stdout.write(self.style.WARNING(f'Unknown method: {method}'))
+                continue
+            if method.startswith('copy') and not is_postgresql:
+                self.stdout.write(self.style.WARNING(f'{method:<14} skipped (PostgreSQL only)'))
+                continue
+
+            elapsed = self.timed(writers[method], model, using)
+            self.stdout.write(f'{method:<14} {elapsed:8.3f}s {len(records) / elapsed:12,.0f} rows/s')
+
+    def make_records(self, count):
+        now = timezone.now()
+        rng = random.Random(0)
+        return [
+            {
+                'ip_address': f'198.51.100.{rng.randint(1, 254)}',
+                'timestamp': now - timedelta(seconds=rng.randint(0, 3600)),
+                'path': f'/benchmark/{rng.randint(1, 500)}?page={rng.randint(1, 20)}',
+                'country': rng.choice(['Kenya', 'Ghana', 'Nigeria', None]),
+                'city': rng.choice(['Nairobi', 'Accra', 'Lagos', None]),
+            }
+            for _ in range(count)
+        ]
+
+    def write_batches(self, backend, records, batch_size):
+        for start in range(0, len(records), batch_size):
+            backend.write(records[start:start + batch_size])
+
+    def timed(self, writer, model, using):
+        with connections[using].schema_editor() as editor:
+            editor.create_model(model)
+        try:
+            started = time.perf_counter()
+            writer()
+            return time.perf_counter() - started
+        finally:
+            with connections[using].schema_editor() as editor:
+                editor.delete_model(model)
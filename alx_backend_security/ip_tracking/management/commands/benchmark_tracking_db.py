@@ -0,0 +1,163 @@
+import statistics
+import threading
+import time
+from datetime import timedelta
+
+from django.apps.registry import Apps
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from ip_tracking.models import RequestLog
+from ip_tracking.routers import tracking_alias
+
+BENCHMARK_PATH = '/__tracking_db_benchmark__'
+BENCHMARK_TABLE = 'ip_tracking_requestlog_benchmark'
+
+
+def benchmark_model():
+    """
+    A scratch copy of RequestLog (same columns and indexes, in an isolated app
+    registry) so the benchmark never writes to or deletes from the real table.
+    path_ref becomes a plain indexed column, and the copy is never partitioned.
+    """
+    indexes = []
+    for number, index in enumerate(RequestLog._meta.indexes):
+        index = index.clone()
+        index.name = f'ip_tracking_bench_{number}_idx'
+        indexes.append(index)
+    meta = type('Meta', (), {
+        'apps': Apps(),
+        'app_label': 'ip_tracking',
+        'db_table': BENCHMARK_TABLE,
+        'indexes': indexes,
+    })
+    attrs = {'__module__': __name__, 'Meta': meta}
+    for field in RequestLog._meta.local_fields:
+        if field.primary_key:
+            continue
+        if field.is_relation:
+            attrs[field.attname] = models.BigIntegerField(null=True, blank=True, db_index=True)
+        else:
+            attrs[field.name] = field.clone()
+    return type('RequestLogBenchmark', (models.Model,), attrs)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure concurrent RequestLog write throughput and session write latency '
+        'with the logs on the default database and on the tracking database. '
+        'Rows go to a scratch copy of the RequestLog table that is dropped afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--writers',
+            type=int,
+            default=4,
+            help='Threads writing RequestLog rows, one row per transaction (default: 4)'
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=500,
+            help='Rows written by each writer thread (default: 500)'
+        )
+        parser.add_argument(
+            '--session-ops',
+            type=int,
+            default=200,
+            help='Session writes timed on the default database meanwhile (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        aliases = ['default']
+        if tracking_alias() != 'default':
+            aliases.append(tracking_alias())
+        else:
+            self.stdout.write(self.style.WARNING(
+                'No tracking database is configured; only the shared layout can be measured.'
+            ))
+
+        self.stdout.write(
+            f'{options["writers"]} writer(s) x {options["rows"]} rows, '
+            f'{options["session_ops"]} session writes on default'
+        )
+        self.stdout.write('-' * 72)
+
+        model = benchmark_model()
+        for alias in aliases:
+            if BENCHMARK_TABLE in connections[alias].introspection.table_names():
+                raise CommandError(f'{BENCHMARK_TABLE} already exists on {alias}; drop it or let a running benchmark finish')
+            with connections[alias].schema_editor() as editor:
+                editor.create_model(model)
+            try:
+                rows_per_second, latencies = self.run_layout(model, alias, options)
+            finally:
+                with connections[alias].schema_editor() as editor:
+                    editor.delete_model(model)
+
+            layout = 'shared' if alias == 'default' else 'separate'
+            self.stdout.write(
+                f'{layout:<9} logs on {alias:<10} {rows_per_second:10,.0f} log rows/s   '
+                f'session p50 {statistics.median(latencies) * 1000:6.1f} ms   '
+                f'p95 {self.percentile(latencies, 95) * 1000:6.1f} ms'
+            )
+
+    def run_layout(self, model, alias, options):
+        errors = []
+        latencies = []
+        session_keys = []
+        start_barrier = threading.Barrier(options['writers'] + 1)
+
+        def write_logs(worker):
+            try:
+                start_barrier.wait()
+                for i in range(options['rows']):
+                    model.objects.using(alias).create(
+                        ip_address=f'198.51.100.{worker + 1}',
+                        path=f'{BENCHMARK_PATH}/{i}',
+                    )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        def write_sessions():
+            try:
+                start_barrier.wait()
+                expire_date = timezone.now() + timedelta(minutes=5)
+                for _ in range(options['session_ops']):
+                    session_keys.append(f'bench{get_random_string(35)}')
+                    started = time.perf_counter()
+                    Session.objects.using('default').create(
+                        session_key=session_keys[-1],
+                        session_data='',
+                        expire_date=expire_date,
+                    )
+                    latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        writers = [threading.Thread(target=write_logs, args=(worker,)) for worker in range(options['writers'])]
+        session_writer = threading.Thread(target=write_sessions)
+        for thread in [*writers, session_writer]:
+            thread.start()
+        started = time.perf_counter()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        session_writer.join()
+
+        Session.objects.using('default').filter(session_key__in=session_keys).delete()
+
+        if errors:
+            raise CommandError(f'Benchmark failed on {alias}: {errors[0]}')
+        return options['writers'] * options['rows'] / elapsed, latencies
+
+    def percentile(self, values, percent):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_ipv4_address, validate_ipv6_address
+from ip_tracking.events import publish_event
 from ip_tracking.models import BlockedIP
 import ipaddress
 
@@ -52,6 +53,7 @@ class Command(BaseCommand):
             )
             
             if created:
+                publish_event('blocked', ip_address, reason=reason, source='command')
                 self.stdout.write(
                     self.style.SUCCESS(f'Successfully blocked IP: {ip_address}')
                 )
@@ -79,6 +81,7 @@ class Command(BaseCommand):
             blocked_ip.delete()
 
             cache.delete(f"blocked_ip_{ip_address}")
+            publish_event('unblocked', ip_address, source='command')
             
             self.stdout.write(
                 self.style.SUCCESS(f'Successfully unblocked IP: {ip_address}')
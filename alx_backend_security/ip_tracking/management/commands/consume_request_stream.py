@@ -0,0 +1,61 @@
+import os
+import socket
+
+from django.core.management.base import BaseCommand
+from ip_tracking.ingestion import enrich_records, get_backend, get_ingestion_settings
+from ip_tracking.streams import StreamDetector, StreamWriter
+from ip_tracking.tasks import get_detection_settings
+
+
+class Command(BaseCommand):
+    help = 'Run a consumer-group worker on the request stream (RequestLog writer or real-time detector)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--role',
+            choices=['writer', 'detector'],
+            default='writer',
+            help='writer inserts entries into RequestLog, detector flags high frequency IPs (default: writer)'
+        )
+        parser.add_argument(
+            '--consumer',
+            type=str,
+            help='Consumer name within the group (default: hostname-pid)'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Stop after this many reads (default: run forever)'
+        )
+
+    def handle(self, *args, **options):
+        ingestion_settings = get_ingestion_settings()
+        stream = ingestion_settings['STREAM_KEY']
+        consumer = options['consumer'] or f'{socket.gethostname()}-{os.getpid()}'
+        consumer_options = {
+            'batch_size': ingestion_settings['STREAM_BATCH_SIZE'],
+            'block_ms': ingestion_settings['STREAM_BLOCK_MS'],
+            'claim_idle_ms': ingestion_settings['STREAM_CLAIM_IDLE_MS'],
+            'max_deliveries': ingestion_settings['STREAM_MAX_DELIVERIES'],
+        }
+
+        if options['role'] == 'writer':
+            worker = StreamWriter(
+                stream, consumer,
+                backend=get_backend(),
+                enrich=enrich_records,
+                **consumer_options
+            )
+        else:
+            worker = StreamDetector(
+                stream, consumer,
+                threshold=get_detection_settings()['HIGH_FREQUENCY_THRESHOLD'],
+                **consumer_options
+            )
+
+        self.stdout.write(f'Consuming {stream} as {consumer} in group {worker.group}')
+        try:
+            worker.run(max_batches=options['max_batches'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('Stream consumer stopped.'))
@@ -38,9 +38,14 @@ class Command(BaseCommand):
                 
                 if options['report']:
                     report_result = generate_security_report()
-                    self.stdout.write(
-                        self.style.SUCCESS(f'Security report generated: {report_result["summary"]}')
-                    )
+                    if 'summary' in report_result:
+                        self.stdout.write(
+                            self.style.SUCCESS(f'Security report generated: {report_result["summary"]}')
+                        )
+                    else:
+                        self.stdout.write(
+                            self.style.WARNING(f'Security report not generated: {report_result}')
+                        )
             else:
                 # Run as Celery task
                 task = detect_suspicious_ips.delay()
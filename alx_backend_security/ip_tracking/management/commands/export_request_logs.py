@@ -0,0 +1,80 @@
+import gzip
+import ipaddress
+
+from django.core.management.base import BaseCommand, CommandError
+from ip_tracking.export import FORMATS, export_rows, iter_export, parse_export_time
+
+
+class Command(BaseCommand):
+    help = 'Stream RequestLog rows as CSV or NDJSON, oldest first, resumable from a row cursor'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            default='csv',
+            help='Output format (default: csv)'
+        )
+        parser.add_argument(
+            '--start',
+            help='Export rows logged at or after this ISO 8601 datetime (UTC if naive)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Export rows logged before this ISO 8601 datetime (UTC if naive)'
+        )
+        parser.add_argument(
+            '--ip',
+            action='append',
+            default=[],
+            help='Only export rows from this IP; repeat for several'
+        )
+        parser.add_argument(
+            '--after',
+            help='Resume behind this cursor (the cursor column of the last row received)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after this many rows'
+        )
+        parser.add_argument(
+            '--output',
+            help='File to write instead of stdout'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Gzip the output file'
+        )
+
+    def handle(self, *args, **options):
+        if options['gzip'] and not options['output']:
+            raise CommandError('--gzip needs --output')
+        for ip in options['ip']:
+            try:
+                ipaddress.ip_address(ip)
+            except ValueError:
+                raise CommandError(f"'{ip}' is not a valid IP address")
+
+        try:
+            rows = export_rows(
+                start=parse_export_time(options['start'], '--start'),
+                end=parse_export_time(options['end'], '--end'),
+                ips=options['ip'],
+                after=options['after'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = iter_export(rows, options['format'], limit=options['limit'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        opener = gzip.open if options['gzip'] else open
+        with opener(options['output'], 'wt', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported request logs to {options['output']}"))
@@ -1,8 +1,7 @@
 from django.core.management.base import BaseCommand
-from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
-from ip_tracking.models import RequestLog
+from ip_tracking import rollups
 
 class Command(BaseCommand):
     help = 'Analyze geolocation data from request logs'
@@ -27,25 +26,31 @@ class Command(BaseCommand):
             help='Type of analysis to perform'
         )
 
+    def get_source(self, options):
+        """Object providing the rollups read helpers the analyses call"""
+        # The analyses read the rollups, so fold in anything logged since the last run
+        rollups.update_rollups()
+        return rollups
+
+    def get_period(self, options):
+        """(start_date, end_date, title) of the analyzed window"""
+        end_date = timezone.now()
+        start_date = end_date - timedelta(days=options['days'])
+        return start_date, end_date, f"Geolocation Analytics - Last {options['days']} days"
+
     def handle(self, *args, **options):
-        days = options['days']
         top = options['top']
         analysis_type = options['type']
         
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        logs = RequestLog.objects.filter(
-            timestamp__gte=start_date,
-            timestamp__lte=end_date
-        )
+        self.source = self.get_source(options)
+        start_date, end_date, title = self.get_period(options)
         
         self.stdout.write(
-            self.style.SUCCESS(f'\nGeolocation Analytics - Last {days} days')
+            self.style.SUCCESS(f'\n{title}')
         )
         self.stdout.write('=' * 50)
         
-        total_requests = logs.count()
+        total_requests = self.source.total_requests(start_date, end_date)
         self.stdout.write(f'Total requests analyzed: {total_requests}')
         
         if total_requests == 0:
@@ -53,54 +58,48 @@ class Command(BaseCommand):
             return
         
         if analysis_type == 'country':
-            self.analyze_countries(logs, top)
+            self.analyze_countries(start_date, end_date, top, total_requests)
         elif analysis_type == 'city':
-            self.analyze_cities(logs, top)
+            self.analyze_cities(start_date, end_date, top, total_requests)
         elif analysis_type == 'ip':
-            self.analyze_ips(logs, top)
+            self.analyze_ips(start_date, end_date, top)
         elif analysis_type == 'path':
-            self.analyze_paths(logs, top)
+            self.analyze_paths(start_date, end_date, top, total_requests)
 
-    def analyze_countries(self, logs, top):
+    def analyze_countries(self, start_date, end_date, top, total_requests):
         """Analyze requests by country"""
         self.stdout.write(f'\nTop {top} Countries:')
         self.stdout.write('-' * 30)
         
-        country_stats = logs.values('country').annotate(
-            count=Count('id')
-        ).order_by('-count')[:top]
+        country_stats = self.source.top_countries(start_date, end_date, top)
         
         for stat in country_stats:
             country = stat['country'] or 'Unknown'
             count = stat['count']
-            percentage = (count / logs.count()) * 100
+            percentage = (count / total_requests) * 100
             self.stdout.write(f'{country:<20} {count:>6} ({percentage:.1f}%)')
 
-    def analyze_cities(self, logs, top):
+    def analyze_cities(self, start_date, end_date, top, total_requests):
         """Analyze requests by city"""
         self.stdout.write(f'\nTop {top} Cities:')
         self.stdout.write('-' * 30)
         
-        city_stats = logs.values('city', 'country').annotate(
-            count=Count('id')
-        ).order_by('-count')[:top]
+        city_stats = self.source.top_cities(start_date, end_date, top)
         
         for stat in city_stats:
             city = stat['city'] or 'Unknown'
             country = stat['country'] or 'Unknown'
             count = stat['count']
-            percentage = (count / logs.count()) * 100
+            percentage = (count / total_requests) * 100
             location = f"{city}, {country}"
             self.stdout.write(f'{location:<30} {count:>6} ({percentage:.1f}%)')
 
-    def analyze_ips(self, logs, top):
+    def analyze_ips(self, start_date, end_date, top):
         """Analyze requests by IP address"""
         self.stdout.write(f'\nTop {top} IP Addresses:')
         self.stdout.write('-' * 40)
         
-        ip_stats = logs.values('ip_address', 'country', 'city').annotate(
-            count=Count('id')
-        ).order_by('-count')[:top]
+        ip_stats = self.source.top_ips(start_date, end_date, top)
         
         for stat in ip_stats:
             ip = stat['ip_address']
@@ -110,17 +109,15 @@ class Command(BaseCommand):
             location = f"{city}, {country}"
             self.stdout.write(f'{ip:<15} {location:<25} {count:>6}')
 
-    def analyze_paths(self, logs, top):
+    def analyze_paths(self, start_date, end_date, top, total_requests):
         """Analyze requests by path"""
         self.stdout.write(f'\nTop {top} Requested Paths:')
         self.stdout.write('-' * 40)
         
-        path_stats = logs.values('path').annotate(
-            count=Count('id')
-        ).order_by('-count')[:top]
+        path_stats = self.source.top_paths(start_date, end_date, top)
         
         for stat in path_stats:
             path = stat['path']
             count = stat['count']
-            percentage = (count / logs.count()) * 100
+            percentage = (count / total_requests) * 100
             self.stdout.write(f'{path:<50} {count:>6} ({percentage:.1f}%)')
\ No newline at end of file
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from ip_tracking.ingestion import get_ingestion_settings, load_pending_segments
+
+
+class Command(BaseCommand):
+    help = 'Load request segment files written by the segment sink into RequestLog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--follow',
+            action='store_true',
+            help='Keep running and load new segments as they are sealed'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds between passes with --follow (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Loading segments from {get_ingestion_settings()["SEGMENT_DIR"]}')
+
+        while True:
+            segments, records = load_pending_segments()
+            if segments or not options['follow']:
+                self.stdout.write(
+                    self.style.SUCCESS(f'Loaded {records} requests from {segments} segment(s).')
+                )
+            if not options['follow']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,60 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import router, transaction
+from ip_tracking.models import RequestLog, logged_path
+from ip_tracking.normalization import get_normalizer
+
+
+class Command(BaseCommand):
+    help = 'Fill in RequestLog.normalized_path for rows logged before normalization (or recompute it)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recompute every row, e.g. after changing PATH_NORMALIZATION'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows updated per transaction (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        normalizer = get_normalizer()
+        if normalizer is None:
+            raise CommandError("PATH_NORMALIZATION['ENABLED'] is off")
+
+        using = router.db_for_write(RequestLog)
+        logs = RequestLog.objects.using(using).order_by('id')
+        if not options['all']:
+            logs = logs.filter(normalized_path='')
+
+        updated = 0
+        last_id = 0
+        while True:
+            batch = list(logs.filter(id__gt=last_id)
+                         .values_list('id', logged_path())[:options['batch_size']])
+            if not batch:
+                break
+
+            ids_by_path = defaultdict(list)
+            for log_id, path in batch:
+                ids_by_path[normalizer.normalize(path or '')[:500]].append(log_id)
+
+            with transaction.atomic(using=using):
+                for normalized_path, ids in ids_by_path.items():
+                    updated += (RequestLog.objects.using(using)
+                                .filter(id__in=ids)
+                                .update(normalized_path=normalized_path))
+
+            last_id = batch[-1][0]
+            self.stdout.write(f'{updated} rows normalized (up to id {last_id})')
+
+        self.stdout.write(self.style.SUCCESS(f'Normalized {updated} rows.'))
+        self.stdout.write(
+            'Path rollups already built keep their old keys until those buckets age out; '
+            'new rows roll up under the normalized paths.'
+        )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from ip_tracking.retention import RETENTION_FIELDS, get_retention_settings, purge_all, purge_model
+
+
+class Command(BaseCommand):
+    help = 'Delete tracking records older than their RETENTION_SETTINGS TTL, in small chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            choices=[model.__name__ for model in RETENTION_FIELDS],
+            help='Only purge this model'
+        )
+
+    def handle(self, *args, **options):
+        ttl_days = get_retention_settings()['TTL_DAYS']
+
+        def progress(model_name, deleted, last_pk):
+            self.stdout.write(f'{model_name}: {deleted} deleted (up to id {last_pk})')
+
+        if options['model']:
+            model = next(m for m in RETENTION_FIELDS if m.__name__ == options['model'])
+            if not ttl_days.get(model.__name__):
+                raise CommandError(f'No TTL configured for {model.__name__}')
+            results = {
+                model.__name__: purge_model(
+                    model,
+                    progress=lambda deleted, last_pk: progress(model.__name__, deleted, last_pk)
+                )
+            }
+        else:
+            results = purge_all(progress=progress)
+
+        # Path dictionary entries have no TTL of their own; they go once no row references them
+        unreferenced_paths = results.pop('RequestPath', None)
+        for model_name, deleted in results.items():
+            ttl = ttl_days.get(model_name)
+            self.stdout.write(
+                self.style.SUCCESS(f'{model_name}: removed {deleted} rows older than {ttl} days')
+                if ttl else f'{model_name}: no TTL configured, skipped'
+            )
+        if unreferenced_paths is not None:
+            self.stdout.write(self.style.SUCCESS(f'RequestPath: removed {unreferenced_paths} unreferenced path entries'))
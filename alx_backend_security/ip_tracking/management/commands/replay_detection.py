@@ -0,0 +1,154 @@
+import json
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ip_tracking.replay import DetectionReplayer, iter_database_rows, iter_file_rows, run_replay
+
+
+class Command(BaseCommand):
+    help = 'Replay historical request logs through anomaly detection without touching real tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            type=str,
+            help='Start of the replay range (ISO 8601 date or datetime)'
+        )
+        parser.add_argument(
+            '--end',
+            type=str,
+            help='End of the replay range, exclusive (default: now)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help='Number of days to replay when --start is not given (default: 7)'
+        )
+        parser.add_argument(
+            '--file',
+            type=str,
+            help='Replay an exported .csv or .ndjson file instead of the database'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows fetched per database round trip (default: 5000)'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            help='Override the high frequency threshold (requests per window)'
+        )
+        parser.add_argument(
+            '--block-after',
+            type=int,
+            help='Override the number of detections needed to auto-block'
+        )
+        parser.add_argument(
+            '--window-minutes',
+            type=int,
+            default=60,
+            help='Simulated detection interval in minutes (default: 60)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Number of flagged IPs to show (default: 10)'
+        )
+        parser.add_argument(
+            '--json',
+            type=str,
+            help='Write the full replay report to this JSON file'
+        )
+
+    def handle(self, *args, **options):
+        end = self.parse_datetime(options['end']) if options['end'] else timezone.now()
+        if options['start']:
+            start = self.parse_datetime(options['start'])
+        elif options['file']:
+            start = None
+        else:
+            start = end - timedelta(days=options['days'])
+
+        if start is not None and start >= end:
+            raise CommandError('--start must be before --end')
+
+        replayer = DetectionReplayer(
+            start=start,
+            window=timedelta(minutes=options['window_minutes']),
+            high_frequency_threshold=options['threshold'],
+            auto_block_detections=options['block_after'],
+        )
+
+        if options['file']:
+            source = options['file']
+            rows = iter_file_rows(options['file'], start=start, end=end if options['end'] else None)
+        else:
+            source = f'RequestLog {start} -> {end}'
+            rows = iter_database_rows(start, end, chunk_size=options['chunk_size'])
+
+        self.stdout.write(self.style.SUCCESS(f'Replaying {source}'))
+
+        try:
+            elapsed = run_replay(rows, replayer)
+        except (OSError, KeyError, ValueError) as e:
+            raise CommandError(f'Error reading replay source: {e}')
+
+        report = replayer.report(elapsed, top=options['top'])
+        self.print_report(report, options['top'])
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+            self.stdout.write(f'Full report written to {options["json"]}')
+
+    def parse_datetime(self, value):
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Invalid date: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def print_report(self, report, top):
+        thresholds = report['thresholds']
+        self.stdout.write('=' * 60)
+        self.stdout.write(
+            f'Thresholds: >{thresholds["high_frequency_threshold"]} requests per '
+            f'{thresholds["window_minutes"]:.0f} min, block after '
+            f'{thresholds["auto_block_detections"]} detections'
+        )
+        self.stdout.write(f'Rows replayed:        {report["rows"]}')
+        self.stdout.write(f'Detection runs:       {report["detection_runs"]}')
+        self.stdout.write(f'Total detections:     {report["total_detections"]}')
+        self.stdout.write(f'IPs flagged:          {report["flagged_ips"]}')
+        self.stdout.write(f'IPs would be blocked: {report["blocked_ips"]}')
+        if report['out_of_order_rows']:
+            self.stdout.write(
+                self.style.WARNING(f'Out-of-order rows:    {report["out_of_order_rows"]}')
+            )
+        self.stdout.write(
+            f'Elapsed: {report["elapsed_seconds"]}s ({report["rows_per_second"] or 0} rows/sec)'
+        )
+
+        if report['top_flagged']:
+            self.stdout.write(f'\nTop {len(report["top_flagged"])} flagged IPs:')
+            self.stdout.write('-' * 60)
+            for entry in report['top_flagged']:
+                self.stdout.write(
+                    f'{entry["ip_address"]:<40} {entry["detection_count"]:>4} detections '
+                    f'{entry["request_count"]:>7} requests'
+                )
+
+        if report['blocked']:
+            self.stdout.write('\nWould have been blocked:')
+            self.stdout.write('-' * 60)
+            for entry in report['blocked'][:top]:
+                self.stdout.write(f'{entry["ip_address"]:<40} at {entry["blocked_at"]}')
+            if len(report['blocked']) > top:
+                self.stdout.write(f'(and {len(report["blocked"]) - top} more, see --json)')
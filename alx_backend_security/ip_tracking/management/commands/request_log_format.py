@@ -0,0 +1,120 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+from ip_tracking.models import RequestLog, RequestPath
+from ip_tracking.paths import compact_enabled, compact_rows, expand_rows, top_logged_paths
+
+# Bytes a compact row spends on its path: the 8 byte reference plus its index entry
+REFERENCE_BYTES = 16
+
+
+class Command(BaseCommand):
+    help = 'Convert RequestLog rows between the full and compact (dictionary-encoded path) formats'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compact',
+            action='store_true',
+            help='Move the paths of full-format rows into the RequestPath dictionary'
+        )
+        parser.add_argument(
+            '--expand',
+            action='store_true',
+            help='Copy dictionary paths back onto compact rows'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Distinct paths converted per transaction (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        if options['compact'] and options['expand']:
+            raise CommandError('Use either --compact or --expand')
+
+        using = router.db_for_write(RequestLog)
+        if options['compact']:
+            if not compact_enabled():
+                self.stdout.write(self.style.WARNING(
+                    "REQUEST_LOG_FORMAT['COMPACT'] is off: new rows will still be written in full format."
+                ))
+            converted = compact_rows(
+                RequestLog, RequestPath, using,
+                batch_size=options['batch_size'],
+                progress=lambda converted: self.stdout.write(f'{converted} rows compacted...')
+            )
+            self.stdout.write(self.style.SUCCESS(f'Compacted {converted} rows.'))
+        elif options['expand']:
+            expanded = expand_rows(RequestLog, RequestPath, using)
+            self.stdout.write(self.style.SUCCESS(f'Expanded {expanded} rows.'))
+
+        if (options['compact'] or options['expand']) and connections[using].vendor == 'postgresql':
+            self.stdout.write('Rewritten rows leave dead tuples; VACUUM FULL (or pg_repack) RequestLog to reclaim them.')
+
+        self.report(using)
+
+    def report(self, using):
+        logs = RequestLog.objects.using(using).order_by()
+        stats = logs.aggregate(
+            rows=Count('id'),
+            compact_rows=Count('id', filter=Q(path_ref__isnull=False)),
+            inline_path_bytes=Sum(Length('path')),
+        )
+        dictionary = RequestPath.objects.using(using).aggregate(
+            entries=Count('id'),
+            path_bytes=Sum(Length('path')),
+        )
+        inline_bytes = stats['inline_path_bytes'] or 0
+        dictionary_bytes = dictionary['path_bytes'] or 0
+        full_rows = stats['rows'] - stats['compact_rows']
+
+        self.stdout.write('\nRequestLog format')
+        self.stdout.write('-' * 50)
+        self.stdout.write(f'Rows:               {stats["rows"]:>12,}')
+        self.stdout.write(f'  full format:      {full_rows:>12,}')
+        self.stdout.write(f'  compact format:   {stats["compact_rows"]:>12,}')
+        self.stdout.write(f'Dictionary paths:   {dictionary["entries"]:>12,}')
+
+        # Path text is paid twice per row: once in the heap and once in the path index
+        average_path = (inline_bytes + self.expanded_bytes(logs)) / stats['rows'] if stats['rows'] else 0
+        full_estimate = 2 * average_path * stats['rows']
+        compact_estimate = REFERENCE_BYTES * stats['rows'] + 2 * dictionary_bytes
+        self.stdout.write(f'Average path:       {average_path:>12.1f} bytes')
+        self.stdout.write(f'Path storage, all rows full:     {self.size(full_estimate):>10}')
+        self.stdout.write(f'Path storage, all rows compact:  {self.size(compact_estimate):>10}')
+
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT COALESCE(SUM(pg_table_size(relid)), 0), COALESCE(SUM(pg_indexes_size(relid)), 0) '
+                    'FROM pg_partition_tree(to_regclass(%s))',
+                    [RequestLog._meta.db_table]
+                )
+                table_bytes, index_bytes = cursor.fetchone()
+            self.stdout.write(f'Table on disk:      {self.size(table_bytes):>12}')
+            self.stdout.write(f'Indexes on disk:    {self.size(index_bytes):>12}')
+
+        since = timezone.now() - timedelta(days=1)
+        started = time.perf_counter()
+        top_paths = top_logged_paths(logs.filter(timestamp__gte=since), 10)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Top 10 paths, last 24h: {elapsed * 1000:.1f} ms ({len(top_paths)} paths)')
+
+    def expanded_bytes(self, logs):
+        return logs.filter(path_ref__isnull=False).aggregate(
+            total=Sum(Length('path_ref__path'))
+        )['total'] or 0
+
+    def size(self, value):
+        for unit in ('B', 'KB', 'MB', 'GB'):
+            if value < 1024:
+                return f'{value:.1f} {unit}'
+            value /= 1024
+        return f'{value:.1f} TB'
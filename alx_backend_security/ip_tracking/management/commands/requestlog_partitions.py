@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ip_tracking.partitioning import (
+    convert_to_partitioned,
+    drop_partitions_before,
+    ensure_partitions,
+    get_partitioning_settings,
+    is_partitioned,
+    list_partitions,
+    partitioning_supported,
+)
+
+
+class Command(BaseCommand):
+    help = 'Manage PostgreSQL range partitions of the RequestLog table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert',
+            action='store_true',
+            help='Convert an existing unpartitioned RequestLog table (one-time, locks the table)'
+        )
+        parser.add_argument(
+            '--ensure',
+            action='store_true',
+            help='Create the current and upcoming partitions'
+        )
+        parser.add_argument(
+            '--drop-before',
+            type=str,
+            help='Drop partitions that end on or before this date (ISO 8601)'
+        )
+
+    def handle(self, *args, **options):
+        if not partitioning_supported():
+            self.stdout.write(
+                self.style.WARNING('RequestLog partitioning is only available on PostgreSQL.')
+            )
+            return
+
+        if options['convert']:
+            if convert_to_partitioned():
+                self.stdout.write(self.style.SUCCESS('Converted RequestLog to a partitioned table.'))
+            else:
+                self.stdout.write(self.style.WARNING('RequestLog is already partitioned.'))
+
+        if not is_partitioned():
+            self.stdout.write(
+                self.style.WARNING('RequestLog is not partitioned. Use --convert to partition it.')
+            )
+            return
+
+        if options['ensure']:
+            created = ensure_partitions()
+            self.stdout.write(self.style.SUCCESS(f'Created {len(created)} partition(s).'))
+
+        if options['drop_before']:
+            try:
+                cutoff = datetime.fromisoformat(options['drop_before'])
+            except ValueError:
+                raise CommandError(f'Invalid date: {options["drop_before"]}')
+            if timezone.is_naive(cutoff):
+                cutoff = timezone.make_aware(cutoff)
+            for name, estimated_rows in drop_partitions_before(cutoff):
+                self.stdout.write(f'Dropped {name} (~{estimated_rows} rows)')
+
+        partitions = list_partitions()
+        self.stdout.write(
+            f'\n{len(partitions)} {get_partitioning_settings()["INTERVAL"]} partition(s):'
+        )
+        self.stdout.write('-' * 40)
+        for name, start in partitions:
+            self.stdout.write(f'{name:<40} from {start:%Y-%m-%d}')
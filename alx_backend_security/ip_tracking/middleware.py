@@ -4,36 +4,46 @@ from django.utils.deprecation import MiddlewareMixin
 from django.http import HttpResponseForbidden
 from django.core.cache import cache
 from django.conf import settings
-from .models import RequestLog, BlockedIP
+from django.utils import timezone
+from .ingestion import get_sink
+from .models import BlockedIP
+from .sampling import get_sampler
 
 logger = logging.getLogger(__name__)
 
 class IPTrackingMiddleware(MiddlewareMixin):
     def process_request(self, request):
         ip_address = self.get_client_ip(request)
-        
+        # The address detection sees, for lookups further down (reputation rates)
+        request.client_ip = ip_address
 
         if self.is_ip_blocked(ip_address):
             logger.warning(f"Blocked request from {ip_address} - {request.get_full_path()}")
             return HttpResponseForbidden("Access denied: Your IP address is blocked.")
 
         path = request.get_full_path()
-        
-        geolocation_data = self.get_geolocation(ip_address)
-        
-        try:
-            RequestLog.objects.create(
-                ip_address=ip_address,
-                path=path,
-                country=geolocation_data.get('country'),
-                city=geolocation_data.get('city')
-            )
-            
-            location_info = f"{geolocation_data.get('city', 'Unknown')}, {geolocation_data.get('country', 'Unknown')}"
-            logger.info(f"Request logged: {ip_address} ({location_info}) - {path}")
-            
-        except Exception as e:
-            logger.error(f"Error logging request: {e}")
+
+        sampler = get_sampler()
+        weight, ip_weight = sampler.decision(request.method, ip_address, path) if sampler else (1, 1)
+        if not weight:
+            return None
+        
+        sink = get_sink()
+        # Sinks that defer enrichment keep the geolocation lookup off the request path
+        geolocation_data = {} if sink.defers_enrichment else self.get_geolocation(ip_address)
+        
+        sink.emit({
+            'ip_address': ip_address,
+            'timestamp': timezone.now(),
+            'path': path,
+            'sample_weight': weight,
+            'ip_weight': ip_weight,
+            'country': geolocation_data.get('country'),
+            'city': geolocation_data.get('city')
+        })
+
+        location_info = f"{geolocation_data.get('city', 'Unknown')}, {geolocation_data.get('country', 'Unknown')}"
+        logger.info(f"Request logged: {ip_address} ({location_info}) - {path}")
         
         return None
     
@@ -63,9 +73,6 @@ class IPTrackingMiddleware(MiddlewareMixin):
         """
         services = [
             self.get_geolocation_ipapi,
-            self.get_geolocation_ipgeolocation,
-            self.get_geolocation_ipstack,
-            self.get_geolocation_freeipapi
         ]
         
         for service in services:
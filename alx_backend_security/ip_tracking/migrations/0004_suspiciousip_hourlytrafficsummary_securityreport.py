@@ -0,0 +1,151 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0003_requestlog_city_requestlog_country"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HourlyTrafficSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField(unique=True)),
+                ("total_requests", models.PositiveBigIntegerField(default=0)),
+                ("unique_ips", models.PositiveIntegerField(default=0)),
+                ("ip_sketch", models.BinaryField()),
+                (
+                    "computed_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "verbose_name": "Hourly traffic summary",
+                "verbose_name_plural": "Hourly traffic summaries",
+                "ordering": ["-hour"],
+            },
+        ),
+        migrations.CreateModel(
+            name="SecurityReport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "generated_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("period_start", models.DateTimeField()),
+                ("period_end", models.DateTimeField()),
+                ("total_requests", models.PositiveBigIntegerField(default=0)),
+                ("unique_ips", models.PositiveIntegerField(default=0)),
+                ("new_suspicious_ips", models.PositiveIntegerField(default=0)),
+                ("total_blocked_ips", models.PositiveIntegerField(default=0)),
+                ("top_suspicious_ips", models.JSONField(default=list)),
+            ],
+            options={
+                "verbose_name": "Security report",
+                "verbose_name_plural": "Security reports",
+                "ordering": ["-period_end"],
+            },
+        ),
+        migrations.CreateModel(
+            name="SuspiciousIP",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ip_address", models.GenericIPAddressField()),
+                ("reason", models.TextField()),
+                ("request_count", models.PositiveIntegerField(default=0)),
+                (
+                    "first_detected",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "last_detected",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("detection_count", models.PositiveIntegerField(default=1)),
+                ("is_investigated", models.BooleanField(default=False)),
+            ],
+            options={
+                "verbose_name": "Suspicious IP",
+                "verbose_name_plural": "Suspicious IPs",
+                "ordering": ["-last_detected", "-detection_count"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="blockedip",
+            index=models.Index(
+                fields=["ip_address"], name="ip_tracking_ip_addr_49578b_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="requestlog",
+            index=models.Index(
+                fields=["ip_address", "timestamp"],
+                name="ip_tracking_ip_addr_d89fd9_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="requestlog",
+            index=models.Index(
+                fields=["timestamp"], name="ip_tracking_timesta_b1bb90_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="requestlog",
+            index=models.Index(fields=["path"], name="ip_tracking_path_65894f_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="securityreport",
+            index=models.Index(
+                fields=["period_end"], name="ip_tracking_period__b9b7a7_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="suspiciousip",
+            index=models.Index(
+                fields=["ip_address", "last_detected"],
+                name="ip_tracking_ip_addr_36c7f8_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="suspiciousip",
+            index=models.Index(
+                fields=["last_detected"], name="ip_tracking_last_de_b03dd6_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="suspiciousip",
+            index=models.Index(
+                fields=["detection_count"], name="ip_tracking_detecti_60b1d3_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Formerly converted RequestLog to a partitioned table during migrate,
+    which rewrote the whole table under one lock. The conversion is now
+    opt-in and runs from `manage.py requestlog_partitions --convert`; this
+    migration is kept, empty, so existing migration histories still apply.
+    """
+
+    dependencies = [
+        ("ip_tracking", "0004_suspiciousip_hourlytrafficsummary_securityreport"),
+    ]
+
+    operations = []
@@ -0,0 +1,116 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0005_partition_requestlog"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                ("last_id", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="GeoTrafficRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("country", models.CharField(blank=True, default="", max_length=100)),
+                ("city", models.CharField(blank=True, default="", max_length=100)),
+                ("request_count", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-bucket"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("bucket", "country", "city"),
+                        name="ip_tracking_georollup_bucket_location",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="IPTrafficRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("ip_address", models.GenericIPAddressField()),
+                ("request_count", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-bucket"],
+                "indexes": [
+                    models.Index(
+                        fields=["ip_address", "bucket"],
+                        name="ip_tracking_ip_addr_64f72c_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("bucket", "ip_address"),
+                        name="ip_tracking_iprollup_bucket_ip",
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="PathTrafficRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.DateTimeField()),
+                ("path", models.CharField(max_length=500)),
+                ("request_count", models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["-bucket"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("bucket", "path"),
+                        name="ip_tracking_pathrollup_bucket_path",
+                    )
+                ],
+            },
+        ),
+    ]
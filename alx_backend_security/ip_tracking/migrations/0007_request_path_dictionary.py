@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0006_traffic_rollups"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestPath",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("path_hash", models.BigIntegerField(unique=True)),
+                ("path", models.CharField(max_length=500)),
+                ("first_seen", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="requestlog",
+            name="path",
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name="requestlog",
+            name="path_ref",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="ip_tracking.requestpath",
+            ),
+        ),
+    ]
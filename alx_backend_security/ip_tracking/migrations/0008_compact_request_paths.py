@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def compact_request_paths(apps, schema_editor):
+    from ip_tracking.paths import compact_rows, get_format_settings
+
+    if get_format_settings()["COMPACT"]:
+        compact_rows(
+            apps.get_model("ip_tracking", "RequestLog"),
+            apps.get_model("ip_tracking", "RequestPath"),
+            schema_editor.connection.alias,
+        )
+
+
+def expand_request_paths(apps, schema_editor):
+    from ip_tracking.paths import expand_rows
+
+    expand_rows(
+        apps.get_model("ip_tracking", "RequestLog"),
+        apps.get_model("ip_tracking", "RequestPath"),
+        schema_editor.connection.alias,
+    )
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("ip_tracking", "0007_request_path_dictionary"),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_request_paths, expand_request_paths),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0008_compact_request_paths"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="requestlog",
+            name="normalized_path",
+            field=models.CharField(blank=True, default="", max_length=500),
+        ),
+        migrations.AddIndex(
+            model_name="requestlog",
+            index=models.Index(
+                fields=["normalized_path"], name="ip_tracking_normali_0ca7d6_idx"
+            ),
+        ),
+    ]
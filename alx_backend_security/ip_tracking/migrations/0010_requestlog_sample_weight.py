@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0009_requestlog_normalized_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="requestlog",
+            name="sample_weight",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
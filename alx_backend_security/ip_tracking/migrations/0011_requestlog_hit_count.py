@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0010_requestlog_sample_weight"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="requestlog",
+            name="hit_count",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="requestlog",
+            name="last_seen",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
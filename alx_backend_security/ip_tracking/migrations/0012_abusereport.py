@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:46
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0011_requestlog_hit_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AbuseReport",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("ip_address", models.GenericIPAddressField()),
+                ("reporter_ip", models.GenericIPAddressField()),
+                (
+                    "category",
+                    models.CharField(
+                        choices=[
+                            ("spam", "Spam"),
+                            ("scanning", "Scanning"),
+                            ("brute_force", "Brute force"),
+                            ("ddos", "DDoS"),
+                            ("other", "Other"),
+                        ],
+                        default="other",
+                        max_length=20,
+                    ),
+                ),
+                ("description", models.TextField(blank=True)),
+                ("report_count", models.PositiveIntegerField(default=1)),
+                (
+                    "first_reported",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "last_reported",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+            options={
+                "verbose_name": "Abuse report",
+                "verbose_name_plural": "Abuse reports",
+                "ordering": ["-last_reported"],
+                "indexes": [
+                    models.Index(
+                        fields=["ip_address", "last_reported"],
+                        name="ip_tracking_ip_addr_3c5e0f_idx",
+                    ),
+                    models.Index(
+                        fields=["last_reported"], name="ip_tracking_last_re_fb4152_idx"
+                    ),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("ip_address", "reporter_ip"),
+                        name="unique_abuse_report_per_reporter",
+                    )
+                ],
+            },
+        ),
+    ]
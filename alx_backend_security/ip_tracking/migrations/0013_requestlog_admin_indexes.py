@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:50
+
+from django.db import migrations, models
+
+OLD_PATH_INDEX = models.Index(fields=["path"], name="ip_tracking_path_65894f_idx")
+PATH_PREFIX_INDEX = models.Index(
+    fields=["path"],
+    name="ip_tracking_path_prefix_idx",
+    opclasses=["varchar_pattern_ops"],
+)
+LOCATION_INDEX = models.Index(
+    fields=["country", "city", "timestamp"], name="ip_tracking_location_idx"
+)
+
+
+def add_admin_indexes(apps, schema_editor):
+    from ip_tracking.partitioning import add_index_online, remove_index_online
+
+    RequestLog = apps.get_model("ip_tracking", "RequestLog")
+    # New indexes first, so path lookups never go without one
+    add_index_online(schema_editor, RequestLog, PATH_PREFIX_INDEX)
+    add_index_online(schema_editor, RequestLog, LOCATION_INDEX)
+    remove_index_online(schema_editor, RequestLog, OLD_PATH_INDEX)
+
+
+def remove_admin_indexes(apps, schema_editor):
+    from ip_tracking.partitioning import add_index_online, remove_index_online
+
+    RequestLog = apps.get_model("ip_tracking", "RequestLog")
+    add_index_online(schema_editor, RequestLog, OLD_PATH_INDEX)
+    remove_index_online(schema_editor, RequestLog, LOCATION_INDEX)
+    remove_index_online(schema_editor, RequestLog, PATH_PREFIX_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    # Indexes are built CONCURRENTLY on PostgreSQL (per partition when
+    # RequestLog is partitioned) so request logging is not blocked, and
+    # CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("ip_tracking", "0012_abusereport"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    add_admin_indexes,
+                    remove_admin_indexes,
+                    hints={"model_name": "requestlog"},
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name="requestlog",
+                    name="ip_tracking_path_65894f_idx",
+                ),
+                migrations.AddIndex(model_name="requestlog", index=PATH_PREFIX_INDEX),
+                migrations.AddIndex(model_name="requestlog", index=LOCATION_INDEX),
+            ],
+        ),
+    ]
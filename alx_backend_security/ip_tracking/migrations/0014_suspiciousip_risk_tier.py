@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:53
+
+from django.db import migrations, models
+from django.db.models import Case, Q, Value, When
+
+
+def backfill_risk_tier(apps, schema_editor):
+    # Same thresholds as classify_risk(), in one UPDATE
+    SuspiciousIP = apps.get_model("ip_tracking", "SuspiciousIP")
+    SuspiciousIP.objects.using(schema_editor.connection.alias).update(
+        risk_tier=Case(
+            When(Q(detection_count__gte=10) | Q(request_count__gte=500), then=Value(3)),
+            When(Q(detection_count__gte=5) | Q(request_count__gte=200), then=Value(2)),
+            default=Value(1),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0013_requestlog_admin_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="suspiciousip",
+            name="risk_tier",
+            field=models.PositiveSmallIntegerField(
+                choices=[(1, "LOW"), (2, "MEDIUM"), (3, "HIGH")], default=1
+            ),
+        ),
+        migrations.RunPython(backfill_risk_tier, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="suspiciousip",
+            index=models.Index(
+                fields=["risk_tier", "last_detected"],
+                name="ip_tracking_risk_ti_07a438_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0014_suspiciousip_risk_tier"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rollupcheckpoint",
+            name="pending_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_ips(apps, schema_editor):
+    # Concurrent get_or_create calls could leave several rows per IP; fold them
+    # into the oldest one before the unique constraint goes on
+    SuspiciousIP = apps.get_model("ip_tracking", "SuspiciousIP")
+    rows = SuspiciousIP.objects.using(schema_editor.connection.alias)
+    duplicated = (rows.values("ip_address").annotate(rows=Count("id"))
+                  .filter(rows__gt=1).values_list("ip_address", flat=True))
+    for ip_address in duplicated:
+        kept, *others = rows.filter(ip_address=ip_address).order_by("id")
+        for other in others:
+            kept.first_detected = min(kept.first_detected, other.first_detected)
+            if other.last_detected > kept.last_detected:
+                kept.last_detected = other.last_detected
+                kept.reason = other.reason
+            kept.request_count = max(kept.request_count, other.request_count)
+            kept.detection_count += other.detection_count
+            kept.is_investigated = kept.is_investigated or other.is_investigated
+        # Same thresholds as classify_risk()
+        if kept.detection_count >= 10 or kept.request_count >= 500:
+            kept.risk_tier = 3
+        elif kept.detection_count >= 5 or kept.request_count >= 200:
+            kept.risk_tier = 2
+        else:
+            kept.risk_tier = 1
+        kept.save()
+        rows.filter(id__in=[other.id for other in others]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0015_rollupcheckpoint_pending_ids"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ips, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="suspiciousip",
+            name="ip_address",
+            field=models.GenericIPAddressField(unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0016_suspiciousip_unique_ip"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="suspiciousip",
+            name="counted_hour",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ip_tracking", "0017_suspiciousip_counted_hour"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="requestlog",
+            name="ip_weight",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
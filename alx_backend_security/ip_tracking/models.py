@@ -1,10 +1,72 @@
 from django.db import models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
 from django.utils import timezone
 
+
+class RequestPath(models.Model):
+    """Dictionary of request paths, referenced by compact RequestLog rows"""
+    path_hash = models.BigIntegerField(unique=True)
+    path = models.CharField(max_length=500)
+    first_seen = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.path
+
+
+def logged_path():
+    """Query expression for a RequestLog row's path in either row format"""
+    return Coalesce(NullIf('path', Value('')), 'path_ref__path')
+
+
+def analytics_path():
+    """Normalized path where one was recorded, else the logged path"""
+    return Coalesce(NullIf('normalized_path', Value('')), logged_path())
+
+
+def request_weight():
+    """Number of requests one RequestLog row stands for: collapsed repeats times the sample weight"""
+    return F('hit_count') * F('sample_weight')
+
+
+def request_total():
+    """Aggregate for the number of requests a set of RequestLog rows stands for"""
+    return Sum(request_weight(), default=0)
+
+
+def ip_request_total():
+    """
+    Aggregate for the requests of one IP. Rows sampled by IP are all of a
+    logged client's requests and count as they are; rows sampled by (IP,
+    path) are a sample of the client's paths and are extrapolated (ip_weight).
+    """
+    return Sum(F('hit_count') * F('ip_weight'), default=0)
+
+
 class RequestLog(models.Model):
     ip_address = models.GenericIPAddressField()
     timestamp = models.DateTimeField(default=timezone.now)
-    path = models.CharField(max_length=500)
+    # Empty on compact rows, which reference RequestPath instead
+    path = models.CharField(max_length=500, blank=True)
+    path_ref = models.ForeignKey(
+        RequestPath,
+        null=True,
+        blank=True,
+        on_delete=models.PROTECT,
+        related_name='+'
+    )
+    # Low-cardinality form of the path used for analytics (see normalization.py)
+    normalized_path = models.CharField(max_length=500, blank=True, default='')
+    # Requests this row stands for when sampling logged 1 in N (see sampling.py)
+    sample_weight = models.PositiveIntegerField(default=1)
+    # Requests of this row's IP it stands for in per-IP counts: 1 when the
+    # sampling rule keeps all of an IP's requests, sample_weight when it
+    # samples (IP, path) pairs (see sampling.py)
+    ip_weight = models.PositiveIntegerField(default=1)
+    # Identical (ip, path) requests merged into this row; timestamp is the first
+    # of them and last_seen the last (see ingestion.CollapsingSink)
+    hit_count = models.PositiveIntegerField(default=1)
+    last_seen = models.DateTimeField(null=True, blank=True)
     country = models.CharField(max_length=100, blank=True, null=True)
     city = models.CharField(max_length=100, blank=True, null=True)
     
@@ -13,12 +75,22 @@ class RequestLog(models.Model):
         indexes = [
             models.Index(fields=['ip_address', 'timestamp']),
             models.Index(fields=['timestamp']),
-            models.Index(fields=['path']),
+            # Pattern ops so admin prefix searches (LIKE 'x%') use it under any collation
+            models.Index(fields=['path'], name='ip_tracking_path_prefix_idx', opclasses=['varchar_pattern_ops']),
+            # Admin country and city filters, which otherwise scan for rare locations
+            models.Index(fields=['country', 'city', 'timestamp'], name='ip_tracking_location_idx'),
+            models.Index(fields=['normalized_path']),
         ]
         
     def __str__(self):
         location = f"{self.city}, {self.country}" if self.city and self.country else "Unknown"
-        return f"{self.ip_address} ({location}) - {self.path} - {self.timestamp}"
+        return f"{self.ip_address} ({location}) - {self.full_path} - {self.timestamp}"
+
+    @property
+    def full_path(self):
+        if self.path or self.path_ref_id is None:
+            return self.path
+        return self.path_ref.path
 
 
 class BlockedIP(models.Model):
@@ -38,14 +110,40 @@ class BlockedIP(models.Model):
         return f"Blocked: {self.ip_address}"
 
 
+def classify_risk(detection_count, request_count):
+    """HIGH, MEDIUM or LOW risk for a suspicious IP's detection and request counts"""
+    if detection_count >= 10 or request_count >= 500:
+        return 'HIGH'
+    elif detection_count >= 5 or request_count >= 200:
+        return 'MEDIUM'
+    else:
+        return 'LOW'
+
+
 class SuspiciousIP(models.Model):
-    ip_address = models.GenericIPAddressField()
+    # Stored as ranks so that sorting by tier sorts by severity
+    RISK_LOW = 1
+    RISK_MEDIUM = 2
+    RISK_HIGH = 3
+    RISK_TIER_CHOICES = [
+        (RISK_LOW, 'LOW'),
+        (RISK_MEDIUM, 'MEDIUM'),
+        (RISK_HIGH, 'HIGH'),
+    ]
+
+    # One row per IP: detectors running side by side update it under a row lock
+    ip_address = models.GenericIPAddressField(unique=True)
     reason = models.TextField()
     request_count = models.PositiveIntegerField(default=0)
     first_detected = models.DateTimeField(default=timezone.now)
     last_detected = models.DateTimeField(default=timezone.now)
     detection_count = models.PositiveIntegerField(default=1)
+    # Clock hour (UTC) of the last detection counted in detection_count; the
+    # real-time and hourly detectors flagging the same hour count once
+    counted_hour = models.DateTimeField(null=True, blank=True)
     is_investigated = models.BooleanField(default=False)
+    # classify_risk() of the counts, kept up to date by save() so the admin can filter and sort on an index
+    risk_tier = models.PositiveSmallIntegerField(choices=RISK_TIER_CHOICES, default=RISK_LOW)
     
     class Meta:
         verbose_name = "Suspicious IP"
@@ -55,20 +153,23 @@ class SuspiciousIP(models.Model):
             models.Index(fields=['ip_address', 'last_detected']),
             models.Index(fields=['last_detected']),
             models.Index(fields=['detection_count']),
+            models.Index(fields=['risk_tier', 'last_detected']),
         ]
     
     def __str__(self):
         return f"Suspicious: {self.ip_address} (detected {self.detection_count} times)"
     
+    def save(self, *args, **kwargs):
+        self.risk_tier = {label: rank for rank, label in self.RISK_TIER_CHOICES}[self.risk_level]
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'detection_count', 'request_count'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'risk_tier'}
+        super().save(*args, **kwargs)
+    
     @property
     def risk_level(self):
         """Determine risk level based on detection count and request count"""
-        if self.detection_count >= 10 or self.request_count >= 500:
-            return 'HIGH'
-        elif self.detection_count >= 5 or self.request_count >= 200:
-            return 'MEDIUM'
-        else:
-            return 'LOW'
+        return classify_risk(self.detection_count, self.request_count)
     
     @property
     def days_since_first_detection(self):
@@ -87,4 +188,164 @@ class SuspiciousIP(models.Model):
         self.last_detected = timezone.now()
         self.detection_count += 1
         self.is_investigated = False  # Reset investigation status
-        self.save()
\ No newline at end of file
+        self.save()
+
+class AbuseReport(models.Model):
+    """Abuse reports against an IP, one row per reporter, written in batches by process_abuse_reports"""
+    CATEGORY_CHOICES = [
+        ('spam', 'Spam'),
+        ('scanning', 'Scanning'),
+        ('brute_force', 'Brute force'),
+        ('ddos', 'DDoS'),
+        ('other', 'Other'),
+    ]
+
+    ip_address = models.GenericIPAddressField()
+    reporter_ip = models.GenericIPAddressField()
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
+    description = models.TextField(blank=True)
+    report_count = models.PositiveIntegerField(default=1)
+    first_reported = models.DateTimeField(default=timezone.now)
+    last_reported = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Abuse report"
+        verbose_name_plural = "Abuse reports"
+        ordering = ['-last_reported']
+        constraints = [
+            models.UniqueConstraint(fields=['ip_address', 'reporter_ip'], name='unique_abuse_report_per_reporter'),
+        ]
+        indexes = [
+            models.Index(fields=['ip_address', 'last_reported']),
+            models.Index(fields=['last_reported']),
+        ]
+
+    def __str__(self):
+        return f"Abuse report: {self.ip_address} by {self.reporter_ip} ({self.report_count} reports)"
+
+
+class HourlyTrafficSummary(models.Model):
+    """Per-hour partial aggregate of RequestLog, merged into daily security reports"""
+    hour = models.DateTimeField(unique=True)
+    total_requests = models.PositiveBigIntegerField(default=0)
+    unique_ips = models.PositiveIntegerField(default=0)
+    ip_sketch = models.BinaryField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Hourly traffic summary"
+        verbose_name_plural = "Hourly traffic summaries"
+        ordering = ['-hour']
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H:00} - {self.total_requests} requests from {self.unique_ips} IPs"
+
+
+class SecurityReport(models.Model):
+    """Materialized output of the generate_security_report task"""
+    generated_at = models.DateTimeField(default=timezone.now)
+    period_start = models.DateTimeField()
+    period_end = models.DateTimeField()
+    total_requests = models.PositiveBigIntegerField(default=0)
+    unique_ips = models.PositiveIntegerField(default=0)
+    new_suspicious_ips = models.PositiveIntegerField(default=0)
+    total_blocked_ips = models.PositiveIntegerField(default=0)
+    top_suspicious_ips = models.JSONField(default=list)
+
+    class Meta:
+        verbose_name = "Security report"
+        verbose_name_plural = "Security reports"
+        ordering = ['-period_end']
+        indexes = [
+            models.Index(fields=['period_end']),
+        ]
+
+    def __str__(self):
+        return f"Security report {self.period_start:%Y-%m-%d %H:%M} - {self.period_end:%Y-%m-%d %H:%M}"
+
+    @property
+    def period_hours(self):
+        return int((self.period_end - self.period_start).total_seconds() // 3600)
+
+    def as_dict(self):
+        """Report in the shape returned by generate_security_report"""
+        return {
+            'report_id': self.pk,
+            'timestamp': self.generated_at.isoformat(),
+            'period': f'{self.period_hours} hours',
+            'period_start': self.period_start.isoformat(),
+            'period_end': self.period_end.isoformat(),
+            'summary': {
+                'total_requests': self.total_requests,
+                'unique_ips': self.unique_ips,
+                'new_suspicious_ips': self.new_suspicious_ips,
+                'total_blocked_ips': self.total_blocked_ips
+            },
+            'top_suspicious_ips': self.top_suspicious_ips
+        }
+
+
+class IPTrafficRollup(models.Model):
+    """Request count per (time bucket, IP), maintained incrementally from RequestLog"""
+    bucket = models.DateTimeField()
+    ip_address = models.GenericIPAddressField()
+    request_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'ip_address'], name='ip_tracking_iprollup_bucket_ip'),
+        ]
+        indexes = [
+            models.Index(fields=['ip_address', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:%M} {self.ip_address}: {self.request_count}"
+
+
+class PathTrafficRollup(models.Model):
+    """Request count per (time bucket, normalized path), maintained incrementally from RequestLog"""
+    bucket = models.DateTimeField()
+    path = models.CharField(max_length=500)
+    request_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'path'], name='ip_tracking_pathrollup_bucket_path'),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:%M} {self.path}: {self.request_count}"
+
+
+class GeoTrafficRollup(models.Model):
+    """Request count per (time bucket, country, city); unknown locations are stored as ''"""
+    bucket = models.DateTimeField()
+    country = models.CharField(max_length=100, blank=True, default='')
+    city = models.CharField(max_length=100, blank=True, default='')
+    request_count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket', 'country', 'city'], name='ip_tracking_georollup_bucket_location'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket:%Y-%m-%d %H:%M} {self.city}, {self.country}: {self.request_count}"
+
+
+class RollupCheckpoint(models.Model):
+    """Progress marker for incremental jobs: the rollup id watermark or a segment byte offset"""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    # [first id, last id, seen at] runs below last_id that had no committed row yet (see rollups)
+    pending_ids = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
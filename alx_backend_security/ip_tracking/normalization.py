@@ -0,0 +1,143 @@
+"""
+Path normalization for analytics.
+
+Raw request paths carry query strings and object ids, so every
+/items/123?page=2 is its own path. The normalizer folds them into a small
+set of shapes (/items/{id}?page) that are stored next to the raw path in
+RequestLog.normalized_path and used as the key of the path rollup.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+DEFAULT_NORMALIZATION_SETTINGS = {
+    'ENABLED': True,
+    'QUERY_STRING': 'keys',
+    'PLACEHOLDERS': True,
+    'ROUTE_NAMES': False,
+    'CACHE_SIZE': 10000,
+}
+
+QUERY_STRING_MODES = ('strip', 'keys', 'hash', 'keep')
+
+# Segment patterns, first match wins
+SEGMENT_PLACEHOLDERS = [
+    (re.compile(r'^\d+$'), '{id}'),
+    (re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$', re.IGNORECASE), '{uuid}'),
+    (re.compile(r'^[0-9a-f]{16,}$', re.IGNORECASE), '{hash}'),
+]
+
+
+def get_normalization_settings():
+    normalization_settings = {
+        **DEFAULT_NORMALIZATION_SETTINGS,
+        **getattr(settings, 'PATH_NORMALIZATION', {}),
+    }
+    if normalization_settings['QUERY_STRING'] not in QUERY_STRING_MODES:
+        raise ValueError(f"PATH_NORMALIZATION['QUERY_STRING'] must be one of {', '.join(QUERY_STRING_MODES)}")
+    return normalization_settings
+
+
+class PathNormalizer:
+    """
+    Normalizes request paths:
+
+    - query strings are dropped ('strip'), reduced to their sorted parameter
+      names ('keys'), replaced by a short hash ('hash') or kept as they are,
+    - numeric, UUID and long hex segments become {id}, {uuid} and {hash},
+    - with ROUTE_NAMES, paths that resolve to a named URL pattern become
+      'route:<namespace:name>' instead.
+
+    Route lookups are memoized per placeholder shape, which has far fewer
+    distinct values than the raw paths.
+    """
+
+    def __init__(self, query_string='keys', placeholders=True, route_names=False, cache_size=10000):
+        self.query_string = query_string
+        self.placeholders = placeholders
+        self.route_names = route_names
+        self.cache_size = cache_size
+        self._routes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def normalize(self, path):
+        path, _, query = path.partition('?')
+        shape = self.shape(path)
+
+        if self.route_names:
+            route = self.route_name(path, shape)
+            if route:
+                return route
+
+        return shape + self.normalize_query(query)
+
+    def shape(self, path):
+        if not self.placeholders:
+            return path
+        return '/'.join(self.normalize_segment(segment) for segment in path.split('/'))
+
+    def normalize_segment(self, segment):
+        for pattern, placeholder in SEGMENT_PLACEHOLDERS:
+            if pattern.match(segment):
+                return placeholder
+        return segment
+
+    def normalize_query(self, query):
+        if not query or self.query_string == 'strip':
+            return ''
+        if self.query_string == 'keys':
+            keys = sorted({parameter.partition('=')[0] for parameter in query.split('&') if parameter})
+            return '?' + '&'.join(keys)
+        if self.query_string == 'hash':
+            return '?' + hashlib.blake2b(query.encode('utf-8'), digest_size=4).hexdigest()
+        return '?' + query
+
+    def route_name(self, path, shape):
+        with self._lock:
+            if shape in self._routes:
+                self._routes.move_to_end(shape)
+                return self._routes[shape]
+
+        try:
+            match = resolve(path)
+            route = f'route:{match.view_name}' if match.url_name else None
+        except Resolver404:
+            route = None
+
+        with self._lock:
+            self._routes[shape] = route
+            while len(self._routes) > self.cache_size:
+                self._routes.popitem(last=False)
+        return route
+
+
+_normalizer = None
+_normalizer_lock = threading.Lock()
+
+
+def get_normalizer():
+    """Process-wide normalizer built from PATH_NORMALIZATION, or None when disabled"""
+    global _normalizer
+    normalization_settings = get_normalization_settings()
+    if not normalization_settings['ENABLED']:
+        return None
+    if _normalizer is None:
+        with _normalizer_lock:
+            if _normalizer is None:
+                _normalizer = PathNormalizer(
+                    query_string=normalization_settings['QUERY_STRING'],
+                    placeholders=normalization_settings['PLACEHOLDERS'],
+                    route_names=normalization_settings['ROUTE_NAMES'],
+                    cache_size=normalization_settings['CACHE_SIZE'],
+                )
+    return _normalizer
+
+
+def normalize_path(path):
+    """Normalized form of path, or '' when normalization is disabled"""
+    normalizer = get_normalizer()
+    return normalizer.normalize(path)[:500] if normalizer else ''
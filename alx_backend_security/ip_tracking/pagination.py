@@ -0,0 +1,146 @@
+"""
+Keyset (seek) pagination over (timestamp, id).
+
+Instead of OFFSET, each page continues from the last row of the previous one
+with WHERE (timestamp, id) < (last_timestamp, last_id), so the database walks
+the timestamp index from that point and a deep page costs the same as the
+first. The comparison is spelled as timestamp <= t AND (timestamp < t OR
+(timestamp = t AND id < i)): the redundant first term gives the planner an
+index range to start from, which the OR alone hides. Cursors are opaque url-safe strings carrying
+that position.
+
+EstimatedCountPaginator is for offset paging (the admin) over tables too
+big to COUNT(*) on every page view.
+"""
+import base64
+import hashlib
+from datetime import datetime
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+def encode_position(timestamp, pk):
+    raw = f'{timestamp.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def encode_cursor(row):
+    return encode_position(row.timestamp, row.pk)
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) from a cursor, or None when it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, rows, next_cursor=None, previous_cursor=None):
+        self.rows = rows
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def keyset_page(queryset, after=None, before=None, page_size=50):
+    """
+    One page of `queryset`, newest first. `after` continues towards older rows
+    from a next_cursor, `before` goes back towards newer rows from a
+    previous_cursor; with neither the newest page is returned. Fetches one
+    extra row to know whether another page exists.
+    """
+    position = decode_cursor(before)
+    if position:
+        timestamp, pk = position
+        rows = list(queryset
+                    .filter(Q(timestamp__gte=timestamp),
+                            Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+                    .order_by('timestamp', 'pk')[:page_size + 1])
+        has_newer = len(rows) > page_size
+        rows = rows[:page_size][::-1]
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(rows[-1]) if rows else None,
+            previous_cursor=encode_cursor(rows[0]) if rows and has_newer else None,
+        )
+
+    position = decode_cursor(after)
+    if position:
+        timestamp, pk = position
+        queryset = queryset.filter(Q(timestamp__lte=timestamp),
+                                   Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+    rows = list(queryset.order_by('-timestamp', '-pk')[:page_size + 1])
+    has_older = len(rows) > page_size
+    rows = rows[:page_size]
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1]) if rows and has_older else None,
+        previous_cursor=encode_cursor(rows[0]) if rows and position else None,
+    )
+
+
+def estimate_row_count(model, using):
+    """
+    Planner estimate of a table's rows from pg_class.reltuples, summed over
+    the partitions of a partitioned table. None off PostgreSQL or before the
+    table was first analyzed.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT SUM(GREATEST(c.reltuples, 0)), BOOL_OR(c.reltuples >= 0)
+            FROM pg_class c
+            WHERE c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)
+               OR (c.oid = %s::regclass AND c.relkind <> 'p')
+            """,
+            [model._meta.db_table, model._meta.db_table]
+        )
+        estimate, analyzed = cursor.fetchone()
+    return int(estimate) if analyzed else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count never scans the whole table: an unfiltered list is
+    counted from the planner's statistics, a filtered one exactly but only up
+    to `count_limit` rows. Counts are cached for `cache_seconds` per query.
+    """
+
+    def __init__(self, object_list, per_page, count_limit=10000, cache_seconds=300, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_limit = count_limit
+        self.cache_seconds = cache_seconds
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        if query.is_empty():
+            return 0
+        digest = hashlib.blake2b(f'{self.object_list.db}|{query}'.encode(), digest_size=16).hexdigest()
+        cache_key = f'ip_tracking:row_count:{digest}'
+        count = cache.get(cache_key)
+        if count is None:
+            if not query.where:
+                count = estimate_row_count(self.object_list.model, self.object_list.db)
+            if count is None:
+                count = self.object_list.order_by()[:self.count_limit].count()
+            cache.set(cache_key, count, self.cache_seconds)
+        return count
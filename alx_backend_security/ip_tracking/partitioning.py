@@ -0,0 +1,363 @@
+"""
+Native PostgreSQL range partitioning of RequestLog on timestamp.
+
+The parent table keeps its name, so the ORM reads and writes it exactly as
+before; PostgreSQL routes rows to day or week partitions and prunes the ones
+outside a query's timestamp range. Retention becomes DROP TABLE on whole
+partitions instead of row deletes. Every entry point is a no-op on other
+database backends.
+
+Partitioning is opt-in: an existing table is converted once with
+`manage.py requestlog_partitions --convert`, which copies every row under
+an exclusive lock and is best run in a maintenance window. Until then the
+partition maintenance task and retention leave the table as it is.
+"""
+import logging
+import re
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.backends.ddl_references import Table
+from django.db.backends.utils import truncate_name
+from django.utils import timezone
+
+from .models import RequestLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITIONING_SETTINGS = {
+    'INTERVAL': 'day',
+    'PREMAKE': 7,
+}
+
+PARTITION_SUFFIX = re.compile(r'_p(\d{8})$')
+
+
+def get_partitioning_settings():
+    partitioning_settings = {
+        **DEFAULT_PARTITIONING_SETTINGS,
+        **getattr(settings, 'REQUESTLOG_PARTITIONING', {}),
+    }
+    if partitioning_settings['INTERVAL'] not in ('day', 'week'):
+        raise ValueError("REQUESTLOG_PARTITIONING['INTERVAL'] must be 'day' or 'week'")
+    return partitioning_settings
+
+
+def get_database():
+    return router.db_for_write(RequestLog)
+
+
+def partitioning_supported(using=None):
+    return connections[using or get_database()].vendor == 'postgresql'
+
+
+def is_partitioned(using=None):
+    using = using or get_database()
+    if not partitioning_supported(using):
+        return False
+    return _is_partitioned_table(connections[using], RequestLog._meta.db_table)
+
+
+def _is_partitioned_table(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))',
+            [table]
+        )
+        return cursor.fetchone()[0]
+
+
+def _index_valid(connection, name):
+    """True or False for an existing index's pg_index.indisvalid, None when there is none"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)', [name])
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _build_index_concurrently(schema_editor, model, index, table, name):
+    """CREATE INDEX CONCURRENTLY `index` on `table` as `name`, replacing an invalid one a failed build left"""
+    connection = schema_editor.connection
+    valid = _index_valid(connection, name)
+    if valid:
+        return
+    if valid is False:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {connection.ops.quote_name(name)}')
+    statement = index.create_sql(model, schema_editor, concurrently=True)
+    statement.parts['table'] = Table(table, connection.ops.quote_name)
+    statement.parts['name'] = connection.ops.quote_name(name)
+    schema_editor.execute(statement, params=None)
+
+
+def add_index_online(schema_editor, model, index):
+    """
+    schema_editor.add_index() without blocking writes, for migrations with
+    atomic = False. PostgreSQL builds the index CONCURRENTLY. A partitioned
+    table cannot be indexed that way, so the index is created on the parent
+    alone (ON ONLY: no data, invalid), built concurrently on every partition
+    and attached; it turns valid once the last partition is attached, and
+    partitions created later get it automatically. Rerunning after a failed
+    build picks up where it stopped. Other backends add the index as usual.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.add_index(model, index)
+        return
+
+    table = model._meta.db_table
+    if not _is_partitioned_table(connection, table):
+        _build_index_concurrently(schema_editor, model, index, table, index.name)
+        return
+
+    quote_name = connection.ops.quote_name
+    if _index_valid(connection, index.name) is None:
+        statement = index.create_sql(model, schema_editor)
+        statement.template = statement.template.replace(' ON ', ' ON ONLY ', 1)
+        schema_editor.execute(statement, params=None)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s) ORDER BY c.relname',
+            [table]
+        )
+        partitions = [row[0] for row in cursor.fetchall()]
+    for partition in partitions:
+        name = truncate_name(f'{partition}_{index.name}', connection.ops.max_name_length())
+        _build_index_concurrently(schema_editor, model, index, partition, name)
+        # A no-op when this partition's index is already attached
+        schema_editor.execute(f'ALTER INDEX {quote_name(index.name)} ATTACH PARTITION {quote_name(name)}')
+
+
+def remove_index_online(schema_editor, model, index):
+    """
+    schema_editor.remove_index() without blocking writes where PostgreSQL
+    allows it: DROP INDEX CONCURRENTLY. A partitioned index cannot be dropped
+    concurrently; dropping it only removes catalog entries, but it does wait
+    for and briefly hold a lock on every partition.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        schema_editor.remove_index(model, index)
+        return
+    partitioned = _is_partitioned_table(connection, model._meta.db_table)
+    schema_editor.remove_index(model, index, concurrently=not partitioned)
+
+
+def interval_start(moment, interval):
+    """Start (UTC midnight) of the day or ISO week containing moment"""
+    day = moment.astimezone(dt_timezone.utc).date()
+    if interval == 'week':
+        day -= timedelta(days=day.weekday())
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def interval_end(start, interval):
+    return start + timedelta(days=7 if interval == 'week' else 1)
+
+
+def partition_name(start):
+    return f"{RequestLog._meta.db_table}_p{start:%Y%m%d}"
+
+
+def default_partition_name():
+    return f"{RequestLog._meta.db_table}_default"
+
+
+def list_partitions(using=None):
+    """(name, start) for every dated partition, oldest first"""
+    using = using or get_database()
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)',
+            [RequestLog._meta.db_table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = []
+    for name in names:
+        match = PARTITION_SUFFIX.search(name)
+        if match:
+            start = datetime.strptime(match.group(1), '%Y%m%d').replace(tzinfo=dt_timezone.utc)
+            partitions.append((name, start))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def create_partition(start, interval, using=None):
+    """
+    Create the partition for [start, start + interval).
+
+    If the default partition already holds rows for that range they are moved
+    into the new table before it is attached, since PostgreSQL refuses to
+    attach a partition whose range overlaps rows in the default partition.
+    """
+    using = using or get_database()
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    end = interval_end(start, interval)
+    parent = quote_name(RequestLog._meta.db_table)
+    name = quote_name(partition_name(start))
+    default = quote_name(default_partition_name())
+    timestamp_column = quote_name(RequestLog._meta.get_field('timestamp').column)
+    bounds = [start, end]
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [partition_name(start)])
+        if cursor.fetchone()[0]:
+            return False
+
+        cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [default_partition_name()])
+        has_default = cursor.fetchone()[0]
+        stray_rows = False
+        if has_default:
+            cursor.execute(
+                f'SELECT EXISTS (SELECT 1 FROM {default} '
+                f'WHERE {timestamp_column} >= %s AND {timestamp_column} < %s)',
+                bounds
+            )
+            stray_rows = cursor.fetchone()[0]
+
+        if not stray_rows:
+            cursor.execute(
+                f'CREATE TABLE {name} PARTITION OF {parent} FOR VALUES FROM (%s) TO (%s)',
+                bounds
+            )
+            return True
+
+        cursor.execute(f'CREATE TABLE {name} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {default} '
+            f'WHERE {timestamp_column} >= %s AND {timestamp_column} < %s RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved',
+            bounds
+        )
+        cursor.execute(f'ALTER TABLE {parent} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+        logger.info(f"Moved {cursor.rowcount} rows from the default partition into {partition_name(start)}")
+        return True
+
+
+def ensure_partitions(now=None, using=None):
+    """Create the current partition plus PREMAKE future ones. Returns the names created."""
+    using = using or get_database()
+    if not is_partitioned(using):
+        return []
+
+    partitioning_settings = get_partitioning_settings()
+    interval = partitioning_settings['INTERVAL']
+    start = interval_start(now or timezone.now(), interval)
+
+    created = []
+    for _ in range(partitioning_settings['PREMAKE'] + 1):
+        if create_partition(start, interval, using=using):
+            created.append(partition_name(start))
+        start = interval_end(start, interval)
+
+    if created:
+        logger.info(f"Created RequestLog partitions: {', '.join(created)}")
+    return created
+
+
+def drop_partitions_before(cutoff, using=None):
+    """
+    Drop every partition whose whole range ends at or before cutoff.
+    Returns (name, estimated_rows) for each dropped partition.
+    """
+    using = using or get_database()
+    if not is_partitioned(using):
+        return []
+
+    interval = get_partitioning_settings()['INTERVAL']
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    dropped = []
+
+    for name, start in list_partitions(using):
+        if interval_end(start, interval) > cutoff:
+            break
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)', [name])
+            estimated_rows = max(cursor.fetchone()[0], 0)
+            cursor.execute(f'DROP TABLE {quote_name(name)}')
+        dropped.append((name, estimated_rows))
+        logger.info(f"Dropped RequestLog partition {name} (~{estimated_rows} rows)")
+
+    return dropped
+
+
+def convert_to_partitioned(using=None, now=None):
+    """
+    One-time conversion of an existing RequestLog table into a partitioned one.
+
+    The old table is renamed, a partitioned parent with the same columns is
+    created, partitions covering the existing data (plus a default partition)
+    are added, rows are copied across and the old indexes and foreign keys are
+    recreated on the parent. Runs in a single transaction.
+    """
+    using = using or get_database()
+    if not partitioning_supported(using) or is_partitioned(using):
+        return False
+
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    table_name = RequestLog._meta.db_table
+    legacy_name = f"{table_name}_unpartitioned"
+    table = quote_name(table_name)
+    legacy = quote_name(legacy_name)
+    pk_column = quote_name(RequestLog._meta.pk.column)
+    timestamp_column = quote_name(RequestLog._meta.get_field('timestamp').column)
+    interval = get_partitioning_settings()['INTERVAL']
+
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT IN ('
+            '  SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = %s)',
+            [table_name, table_name, 'p']
+        )
+        index_definitions = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            'SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+            'WHERE conrelid = to_regclass(%s) AND contype = %s',
+            [table_name, 'f']
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(f'SELECT MIN({timestamp_column}), MAX({pk_column}) FROM {table}')
+        oldest, max_pk = cursor.fetchone()
+
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        cursor.execute(
+            f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS INCLUDING IDENTITY '
+            f'INCLUDING CONSTRAINTS INCLUDING STORAGE) PARTITION BY RANGE ({timestamp_column})'
+        )
+        # Partitioned tables need the partition key in every unique constraint
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY ({pk_column}, {timestamp_column})')
+        cursor.execute(f'CREATE TABLE {quote_name(default_partition_name())} PARTITION OF {table} DEFAULT')
+
+        start = interval_start(oldest or now or timezone.now(), interval)
+        last = interval_start(now or timezone.now(), interval)
+        while start <= last:
+            cursor.execute(
+                f'CREATE TABLE {quote_name(partition_name(start))} PARTITION OF {table} '
+                f'FOR VALUES FROM (%s) TO (%s)',
+                [start, interval_end(start, interval)]
+            )
+            start = interval_end(start, interval)
+
+        cursor.execute(f'INSERT INTO {table} OVERRIDING SYSTEM VALUE SELECT * FROM {legacy}')
+        cursor.execute(f'DROP TABLE {legacy}')
+
+        for definition in index_definitions:
+            # Index names are free again now that the old table is gone
+            cursor.execute(re.sub(r' ON (ONLY )?\S+ ', f' ON {table} ', definition, count=1))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT {quote_name(name)} {definition}')
+
+        if max_pk is not None:
+            cursor.execute(
+                'SELECT setval(pg_get_serial_sequence(%s, %s), %s)',
+                [table_name, RequestLog._meta.pk.column, max_pk]
+            )
+
+    ensure_partitions(now=now, using=using)
+    logger.info(f"Converted {table_name} to a partitioned table")
+    return True
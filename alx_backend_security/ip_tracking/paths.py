@@ -0,0 +1,178 @@
+"""
+Path dictionary for compact RequestLog rows.
+
+Paths are keyed by a 64-bit hash so lookups hit a unique integer index
+instead of a 500 character string, and the path -> id mapping is kept in a
+per-process LRU cache so a busy path costs no query at all after its first
+request. A hash collision (two paths, one hash) leaves the second path
+unencoded: its rows keep the full text in RequestLog.path.
+
+Cached ids expire after PATH_CACHE_TTL seconds. Every cached id was just
+written to a row, and rows outlive the TTL, so retention.purge_unreferenced_paths
+can delete entries no row references without pulling one out from under a
+process that still has it cached.
+
+Only paths are compacted. ip_address stays a GenericIPAddressField: a 16 byte
+binary inet on PostgreSQL, but a text column on SQLite and MySQL, where this
+format saves nothing on IPs.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import RequestPath, request_total
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMAT_SETTINGS = {
+    'COMPACT': False,
+    'PATH_CACHE_SIZE': 10000,
+    'PATH_CACHE_TTL': 3600,
+}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_format_settings():
+    return {**DEFAULT_FORMAT_SETTINGS, **getattr(settings, 'REQUEST_LOG_FORMAT', {})}
+
+
+def compact_enabled():
+    return get_format_settings()['COMPACT']
+
+
+def hash_path(path):
+    """Signed 64-bit BLAKE2 hash, to fit a BigIntegerField"""
+    digest = hashlib.blake2b(path.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+
+def _remember(mapping):
+    cache_size = get_format_settings()['PATH_CACHE_SIZE']
+    now = time.monotonic()
+    with _cache_lock:
+        for path, path_id in mapping.items():
+            _cache[path] = (path_id, now)
+            _cache.move_to_end(path)
+        while len(_cache) > cache_size:
+            _cache.popitem(last=False)
+
+
+def path_ids(paths):
+    """Map each path to its RequestPath id, creating missing entries"""
+    found = {}
+    expired_before = time.monotonic() - get_format_settings()['PATH_CACHE_TTL']
+    with _cache_lock:
+        for path in paths:
+            if path in _cache:
+                path_id, cached_at = _cache[path]
+                if cached_at < expired_before:
+                    del _cache[path]
+                    continue
+                found[path] = path_id
+                _cache.move_to_end(path)
+
+    missing = {hash_path(path): path for path in set(paths) - found.keys()}
+    if missing:
+        RequestPath.objects.bulk_create(
+            [RequestPath(path_hash=path_hash, path=path) for path_hash, path in missing.items()],
+            ignore_conflicts=True
+        )
+        fetched = {}
+        for path_id, path_hash, path in (RequestPath.objects
+                                         .filter(path_hash__in=list(missing))
+                                         .values_list('id', 'path_hash', 'path')):
+            if path == missing[path_hash]:
+                fetched[path] = path_id
+            else:
+                logger.warning(f"Path hash collision between {path!r} and {missing[path_hash]!r}")
+        _remember(fetched)
+        found.update(fetched)
+
+    return found
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def compact_rows(log_model, path_model, using, batch_size=500, progress=None):
+    """
+    Move the path text of existing full-format rows into the dictionary,
+    batch_size distinct paths per transaction. Takes the models as arguments
+    so data migrations can pass their historical versions.
+    """
+    logs = log_model._base_manager.using(using)
+    unencodable = set()
+    converted = 0
+
+    while True:
+        paths = list(logs.exclude(path='')
+                     .exclude(path__in=unencodable)
+                     .order_by()
+                     .values_list('path', flat=True)
+                     .distinct()[:batch_size])
+        if not paths:
+            break
+
+        by_hash = {hash_path(path): path for path in paths}
+        with transaction.atomic(using=using):
+            path_model._base_manager.using(using).bulk_create(
+                [path_model(path_hash=path_hash, path=path) for path_hash, path in by_hash.items()],
+                ignore_conflicts=True
+            )
+            entries = (path_model._base_manager.using(using)
+                       .filter(path_hash__in=list(by_hash))
+                       .values_list('id', 'path_hash', 'path'))
+            encoded = set()
+            for path_id, path_hash, path in entries:
+                if path == by_hash[path_hash]:
+                    converted += logs.filter(path=path).update(path='', path_ref_id=path_id)
+                    encoded.add(path)
+            unencodable.update(set(paths) - encoded)
+
+        if progress:
+            progress(converted)
+
+    return converted
+
+
+def expand_rows(log_model, path_model, using):
+    """Copy dictionary paths back onto compact rows"""
+    logs = log_model._base_manager.using(using)
+    return (logs.filter(path_ref__isnull=False)
+            .update(
+                path=Subquery(path_model._base_manager.using(using)
+                              .filter(pk=OuterRef('path_ref_id'))
+                              .values('path')[:1]),
+                path_ref=None
+            ))
+
+
+def top_logged_paths(logs, top):
+    """
+    Busiest paths of a RequestLog queryset as [{'path', 'count'}]. Groups on the
+    raw columns (the integer reference for compact rows) and only looks up the
+    dictionary entries of the winners, instead of joining every row. While a
+    table holds both formats a path's full and compact rows count separately.
+    """
+    stats = list(logs.order_by()
+                 .values('path', 'path_ref_id')
+                 .annotate(count=request_total())
+                 .order_by('-count')[:top])
+    entries = RequestPath.objects.in_bulk([stat['path_ref_id'] for stat in stats if stat['path_ref_id']])
+    return [
+        {
+            'path': entries[stat['path_ref_id']].path if stat['path_ref_id'] in entries else stat['path'],
+            'count': stat['count'],
+        }
+        for stat in stats
+    ]
@@ -0,0 +1,341 @@
+"""
+GCRA rate limiting in one Redis round trip.
+
+Each rule keeps a single value in Redis, the theoretical arrival time (TAT)
+of the next request. A request is allowed while TAT + emission interval stays
+within one period of now, so a '10/m' rule allows a burst of 10 and then one
+request every 6 seconds; there are no window edges to burst across. All the
+rules of a check are decided by one Lua script: either every rule admits the
+request and all their TATs move forward, or none of them is charged.
+
+When Redis rejects a key, this process remembers until when it stays
+rejected (the TAT only ever moves forward, so that time is exact) and
+rejects further requests for it without a network call.
+
+The decorator takes the same group/key/rate/method/block arguments as
+django_ratelimit's, with keys and rates meaning the same, and raises its
+Ratelimited exception, so it is a drop-in replacement; `rules` adds more
+(key, rate) pairs checked in the same call. Rate parsing and the built-in
+keys are copied here rather than imported from django_ratelimit.core, whose
+underscore names are not part of its API.
+"""
+import functools
+import hashlib
+import ipaddress
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import redis
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from django_ratelimit import ALL, UNSAFE
+from django_ratelimit.exceptions import Ratelimited
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMIT_SETTINGS = {
+    'KEY_PREFIX': 'ip_tracking:rl:',
+    'LOCAL_PRECHECK': True,
+    'LOCAL_MAX_KEYS': 10000,
+    'FAIL_OPEN': True,
+}
+
+# KEYS: one per rule. ARGV[1]: 1 to charge the request, 0 to only look.
+# Then per rule: emission interval, period (both microseconds) and cost.
+# Returns {allowed, {remaining, retry_after_us, reset_after_us} per rule}; when
+# only looking, remaining and reset_after describe the state before the request.
+GCRA_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000000 + tonumber(clock[2])
+local charge = tonumber(ARGV[1]) == 1
+local allowed = 1
+local tats = {}
+local results = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[i * 3 - 1])
+    local period = tonumber(ARGV[i * 3])
+    local cost = tonumber(ARGV[i * 3 + 1])
+    local tat = math.max(tonumber(redis.call('GET', key)) or now, now)
+    local new_tat = tat + interval * cost
+    local excess = new_tat - now - period
+    if excess > 0 then
+        allowed = 0
+    end
+    if excess > 0 or not charge then
+        results[i] = {math.max(math.floor((period - (tat - now)) / interval), 0), math.max(excess, 0), tat - now}
+    else
+        results[i] = {math.floor((period - (new_tat - now)) / interval), 0, new_tat - now}
+    end
+    tats[i] = new_tat
+end
+if allowed == 1 and charge then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, string.format('%.0f', tats[i]), 'PX', math.ceil((tats[i] - now) / 1000) + 1)
+    end
+end
+return {allowed, results}
+"""
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+RATE_RE = re.compile(r'([\d]+)/([\d]*)([smhd])?')
+
+Rule = namedtuple('Rule', ['key', 'rate'])
+RuleUsage = namedtuple('RuleUsage', ['group', 'key', 'value', 'limit', 'period', 'remaining', 'retry_after', 'reset_after'])
+
+
+class Decision:
+    def __init__(self, allowed, usages):
+        self.allowed = allowed
+        self.usages = usages
+
+    @property
+    def retry_after(self):
+        """Seconds until the request would be allowed; 0 when it is"""
+        return max((usage.retry_after for usage in self.usages), default=0)
+
+
+def get_rate_limit_settings():
+    return {**DEFAULT_RATE_LIMIT_SETTINGS, **getattr(settings, 'IP_TRACKING_RATELIMIT', {})}
+
+
+class LocalRejections:
+    """Keys Redis has rejected, with the monotonic time they stay rejected until"""
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self.until = OrderedDict()
+        self.lock = threading.Lock()
+
+    def retry_after(self, keys):
+        now = time.monotonic()
+        with self.lock:
+            return max((self.until.get(key, now) - now for key in keys), default=0)
+
+    def reject(self, key, seconds):
+        with self.lock:
+            self.until[key] = time.monotonic() + seconds
+            self.until.move_to_end(key)
+            while len(self.until) > self.max_keys:
+                self.until.popitem(last=False)
+
+
+_local_rejections = LocalRejections(DEFAULT_RATE_LIMIT_SETTINGS['LOCAL_MAX_KEYS'])
+_script = None
+
+
+def _get_script():
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(GCRA_SCRIPT)
+    return _script
+
+
+def split_rate(rate):
+    """(limit, period seconds) for a rate such as '10/m' or '100/5m', or a (limit, period) tuple"""
+    if isinstance(rate, tuple):
+        return rate
+    match = RATE_RE.match(rate)
+    if match is None:
+        raise ImproperlyConfigured(f'Invalid rate limit: {rate}')
+    count, multiplier, unit = match.groups()
+    return int(count), PERIODS[(unit or 's').lower()] * int(multiplier or 1)
+
+
+def resolve_ip(request):
+    """
+    The client address rate limits apply to: REMOTE_ADDR unless
+    RATELIMIT_IP_META_KEY names another META key or a callable (such as a
+    trusted-proxy resolver), as django_ratelimit resolves it.
+    """
+    ip_meta = getattr(settings, 'RATELIMIT_IP_META_KEY', None)
+    if not ip_meta:
+        ip = request.META['REMOTE_ADDR']
+        if not ip:
+            raise ImproperlyConfigured('REMOTE_ADDR is empty; set RATELIMIT_IP_META_KEY behind a proxy on a Unix socket')
+    elif callable(ip_meta):
+        ip = ip_meta(request)
+    elif '.' in ip_meta:
+        ip = import_string(ip_meta)(request)
+    elif ip_meta in request.META:
+        ip = request.META[ip_meta]
+    else:
+        raise ImproperlyConfigured(f'Could not get IP address from "{ip_meta}"')
+    return ip
+
+
+def get_ip(request):
+    """The 'ip' key: resolve_ip() masked to RATELIMIT_IPV4_MASK / RATELIMIT_IPV6_MASK bits"""
+    ip = resolve_ip(request)
+    if ':' in ip:
+        mask = getattr(settings, 'RATELIMIT_IPV6_MASK', 64)
+    else:
+        mask = getattr(settings, 'RATELIMIT_IPV4_MASK', 32)
+    return str(ipaddress.ip_network(f'{ip}/{mask}', strict=False).network_address)
+
+
+def user_or_ip(request):
+    if request.user.is_authenticated:
+        return str(request.user.pk)
+    return get_ip(request)
+
+
+SIMPLE_KEYS = {
+    'ip': get_ip,
+    'user': lambda request: str(request.user.pk),
+    'user_or_ip': user_or_ip,
+}
+
+ACCESSOR_KEYS = {
+    'get': lambda request, name: request.GET.get(name, ''),
+    'post': lambda request, name: request.POST.get(name, ''),
+    'header': lambda request, name: request.META.get('HTTP_' + name.replace('-', '_').upper(), ''),
+}
+
+
+def method_match(request, method=ALL):
+    if method == ALL:
+        return True
+    if not isinstance(method, (list, tuple)):
+        method = [method]
+    return request.method in [m.upper() for m in method]
+
+
+def get_group(fn):
+    """Default group for a view, as django_ratelimit names it"""
+    if isinstance(fn, functools.partial):
+        fn = fn.func
+    parts = [fn.__module__]
+    if hasattr(fn, '__self__'):
+        parts.append(fn.__self__.__class__.__name__)
+    parts.append(fn.__qualname__)
+    return '.'.join(parts)
+
+
+def resolve_rate(group, request, rate):
+    """(limit, period seconds) for a rate, or None when there is no limit"""
+    if callable(rate):
+        rate = rate(group, request)
+    elif isinstance(rate, str) and '.' in rate:
+        rate = import_string(rate)(group, request)
+    if rate is None:
+        return None
+    limit, period = split_rate(rate)
+    if period <= 0 or limit <= 0:
+        raise ImproperlyConfigured(f'Invalid rate limit: {rate}')
+    return limit, period
+
+
+def resolve_key(group, request, key):
+    if not key:
+        raise ImproperlyConfigured('Ratelimit key must be specified')
+    if callable(key):
+        return key(group, request)
+    if key in SIMPLE_KEYS:
+        return SIMPLE_KEYS[key](request)
+    if ':' in key:
+        accessor, name = key.split(':', 1)
+        if accessor not in ACCESSOR_KEYS:
+            raise ImproperlyConfigured(f'Unknown ratelimit key: {key}')
+        return ACCESSOR_KEYS[accessor](request, name)
+    if '.' in key:
+        return import_string(key)(group, request)
+    raise ImproperlyConfigured(f'Could not understand ratelimit key: {key}')
+
+
+def _redis_key(prefix, group, value, limit, period):
+    digest = hashlib.blake2b(f'{group}|{limit}/{period}|{value}'.encode(), digest_size=16).hexdigest()
+    return f'{prefix}{digest}'
+
+
+def check(request, rules, charge=True, cost=1):
+    """
+    Decide all `rules` ((group, key, rate) triples) for one request in a
+    single script call, charging them only if every rule allows it. Returns
+    a Decision, or None when rate limiting is off or every rate is None.
+    """
+    if not getattr(settings, 'RATELIMIT_ENABLE', True):
+        return None
+    config = get_rate_limit_settings()
+    _local_rejections.max_keys = config['LOCAL_MAX_KEYS']
+
+    resolved = []
+    for group, key, rate in rules:
+        limits = resolve_rate(group, request, rate)
+        if limits is None:
+            continue
+        value = str(resolve_key(group, request, key))
+        resolved.append((group, key, value, *limits, _redis_key(config['KEY_PREFIX'], group, value, *limits)))
+    if not resolved:
+        return None
+    redis_keys = [rule[-1] for rule in resolved]
+
+    if charge and config['LOCAL_PRECHECK']:
+        retry_after = _local_rejections.retry_after(redis_keys)
+        if retry_after > 0:
+            return Decision(False, [
+                RuleUsage(group, key, value, limit, period, 0, retry_after, retry_after)
+                for group, key, value, limit, period, _ in resolved
+            ])
+
+    args = [1 if charge else 0]
+    for _, _, _, limit, period, _ in resolved:
+        args += [period * 1000000 // limit, period * 1000000, cost]
+    try:
+        allowed, results = _get_script()(keys=redis_keys, args=args)
+    except redis.RedisError as e:
+        logger.error(f"Rate limit check failed: {e}")
+        if config['FAIL_OPEN']:
+            return None
+        return Decision(False, [
+            RuleUsage(group, key, value, limit, period, 0, period, period)
+            for group, key, value, limit, period, _ in resolved
+        ])
+
+    usages = []
+    for (group, key, value, limit, period, redis_key), (remaining, retry_after, reset_after) in zip(resolved, results):
+        usages.append(RuleUsage(group, key, value, limit, period, remaining, retry_after / 1000000, reset_after / 1000000))
+        if charge and retry_after > 0:
+            _local_rejections.reject(redis_key, retry_after / 1000000)
+    return Decision(bool(allowed), usages)
+
+
+def ratelimit(group=None, key=None, rate=None, method=ALL, block=True, rules=()):
+    """
+    Rate limit a view, like django_ratelimit.decorators.ratelimit. `rules` is
+    an optional list of extra (key, rate) pairs decided together with
+    key/rate. Sets request.limited and request.ratelimit (the Decision); with
+    block on, a limited request raises Ratelimited carrying retry_after.
+    """
+    rule_list = ([Rule(key, rate)] if key or rate else []) + [Rule(*rule) for rule in rules]
+
+    def decorator(fn):
+        rule_group = group or get_group(fn)
+
+        @functools.wraps(fn)
+        def _wrapped(request, *args, **kwargs):
+            decision = None
+            if method_match(request, method):
+                decision = check(request, [(rule_group, *rule) for rule in rule_list])
+            limited = decision is not None and not decision.allowed
+            request.limited = limited or getattr(request, 'limited', False)
+            request.ratelimit = decision
+            if limited and block:
+                exception_class = getattr(settings, 'RATELIMIT_EXCEPTION_CLASS', Ratelimited)
+                if isinstance(exception_class, str):
+                    exception_class = import_string(exception_class)
+                exception = exception_class()
+                exception.retry_after = max(int(decision.retry_after + 0.999), 1)
+                raise exception
+            return fn(request, *args, **kwargs)
+        return _wrapped
+    return decorator
+
+
+ratelimit.ALL = ALL
+ratelimit.UNSAFE = UNSAFE
@@ -0,0 +1,28 @@
+"""
+Shared Redis client for the features that talk to Redis directly rather
+than through the Django cache API (streams, pub/sub, scripts).
+"""
+import threading
+
+import redis
+from django.conf import settings
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_redis_url():
+    """IP_TRACKING_REDIS_URL, or the default cache's Redis when it is not set"""
+    return getattr(settings, 'IP_TRACKING_REDIS_URL', None) or settings.CACHES['default']['LOCATION']
+
+
+def get_redis(url=None):
+    """Process-wide client per URL; redis-py pools connections underneath"""
+    url = url or get_redis_url()
+    client = _clients.get(url)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(url)
+            if client is None:
+                client = _clients[url] = redis.Redis.from_url(url, decode_responses=True)
+    return client
@@ -0,0 +1,285 @@
+import csv
+import json
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from types import SimpleNamespace
+
+from django.db.models import F
+
+from .models import RequestLog, logged_path
+from .tasks import SENSITIVE_PATHS, count_detection, detection_hour, get_detection_settings
+
+
+class ReplayStore:
+    """
+    Scratch replacement for the SuspiciousIP/BlockedIP tables.
+    Mirrors the fields the detection tasks read and write, kept in memory;
+    suspicious entries have SuspiciousIP's attributes so repeat detections
+    go through the same tasks.count_detection as flag_suspicious_ip.
+    """
+
+    def __init__(self):
+        self.suspicious = {}
+        self.blocked = {}
+        self.total_detections = 0
+
+    def record_detection(self, ip_address, reason, request_count, now, hour=None):
+        """
+        Same create-or-update semantics as flag_suspicious_ip, including
+        counting one detection per clock hour. Returns True for a new IP.
+        """
+        entry = self.suspicious.get(ip_address)
+        if entry is None:
+            self.suspicious[ip_address] = SimpleNamespace(
+                reason=reason,
+                request_count=request_count,
+                first_detected=now,
+                last_detected=now,
+                detection_count=1,
+                counted_hour=hour,
+            )
+            self.total_detections += 1
+            return True
+
+        data = {'reason': reason, 'request_count': request_count}
+        if count_detection(entry, data, hour, now):
+            self.total_detections += 1
+        return False
+
+    def block(self, ip_address, entry, now):
+        self.blocked[ip_address] = {
+            'blocked_at': now,
+            'detection_count': entry.detection_count,
+            'reason': entry.reason[:200],
+        }
+
+    def cleanup(self, cutoff):
+        """Drop suspicious records the daily cleanup task would have deleted"""
+        stale = [ip for ip, entry in self.suspicious.items() if entry.last_detected < cutoff]
+        for ip in stale:
+            del self.suspicious[ip]
+        return len(stale)
+
+
+class DetectionReplayer:
+    """
+    Replay request logs through the detection pipeline in simulated time.
+
+    Rows must arrive ordered by timestamp. They are bucketed into detection
+    windows; when a row crosses a window boundary the window is evaluated the
+    same way the hourly detect_suspicious_ips run would have evaluated it, and
+    the results are written to a ReplayStore instead of the real tables.
+    """
+
+    def __init__(self, start=None, window=timedelta(hours=1), high_frequency_threshold=None,
+                 auto_block_detections=None, auto_block_window=None, retention=None,
+                 sensitive_paths=None):
+        detection_settings = get_detection_settings()
+        self.window = window
+        self.high_frequency_threshold = (
+            high_frequency_threshold
+            if high_frequency_threshold is not None
+            else detection_settings['HIGH_FREQUENCY_THRESHOLD']
+        )
+        self.auto_block_detections = (
+            auto_block_detections
+            if auto_block_detections is not None
+            else detection_settings['AUTO_BLOCK_DETECTIONS']
+        )
+        self.auto_block_window = auto_block_window or timedelta(
+            hours=detection_settings['AUTO_BLOCK_WINDOW_HOURS']
+        )
+        self.retention = retention or timedelta(
+            days=detection_settings['SUSPICIOUS_IP_RETENTION_DAYS']
+        )
+        self.sensitive_pattern = re.compile(
+            '|'.join(re.escape(path) for path in (sensitive_paths or SENSITIVE_PATHS)),
+            re.IGNORECASE
+        )
+        self._sensitive_cache = {}
+
+        self.store = ReplayStore()
+        self.window_start = start
+        self.next_cleanup = start + timedelta(days=1) if start else None
+        self.ticks = 0
+        self.rows = 0
+        self.out_of_order_rows = 0
+        self._reset_window()
+
+    def _reset_window(self):
+        self.request_counts = Counter()
+        self.sensitive_counts = Counter()
+        self.sensitive_paths = defaultdict(set)
+
+    def _is_sensitive(self, path):
+        # Paths repeat heavily, so memoize the match per distinct path
+        matched = self._sensitive_cache.get(path)
+        if matched is None:
+            matched = self.sensitive_pattern.search(path) is not None
+            if len(self._sensitive_cache) < 100000:
+                self._sensitive_cache[path] = matched
+        return matched
+
+    def feed(self, ip_address, timestamp, path, requests=1):
+        if self.window_start is None:
+            self.window_start = timestamp
+            self.next_cleanup = timestamp + timedelta(days=1)
+
+        while timestamp >= self.window_start + self.window:
+            self._tick(self.window_start + self.window)
+
+        if timestamp < self.window_start:
+            self.out_of_order_rows += 1
+
+        self.rows += 1
+        self.request_counts[ip_address] += requests
+        if self._is_sensitive(path):
+            self.sensitive_counts[ip_address] += requests
+            if len(self.sensitive_paths[ip_address]) < 10:
+                self.sensitive_paths[ip_address].add(path)
+
+    def finish(self):
+        """Evaluate the final, partially filled window"""
+        if self.window_start is not None and self.request_counts:
+            self._tick(self.window_start + self.window)
+
+    def _tick(self, now):
+        """Run one simulated detection pass at `now`"""
+        self.ticks += 1
+        detected = {}
+
+        for ip_address, count in self.request_counts.items():
+            if count > self.high_frequency_threshold:
+                detected[ip_address] = {
+                    'reason': f'High frequency requests: {count} requests/hour',
+                    'request_count': count,
+                }
+
+        for ip_address, count in self.sensitive_counts.items():
+            paths_list = sorted(self.sensitive_paths[ip_address])
+            paths_str = ', '.join(paths_list[:5])
+            if len(paths_list) > 5:
+                paths_str += f' (and {len(paths_list) - 5} more)'
+            reason = (f'Accessing sensitive paths: {paths_str} '
+                      f'({count} requests to {len(paths_list)} sensitive endpoints)')
+
+            if ip_address in detected:
+                detected[ip_address]['reason'] += f'; {reason}'
+                detected[ip_address]['request_count'] += count
+            else:
+                detected[ip_address] = {'reason': reason, 'request_count': count}
+
+        block_window_start = now - self.auto_block_window
+        # The hour detect_suspicious_ips would count this window under
+        hour = detection_hour(now - self.window / 2)
+        for ip_address, data in detected.items():
+            self.store.record_detection(ip_address, data['reason'], data['request_count'], now, hour=hour)
+            entry = self.store.suspicious[ip_address]
+            if (ip_address not in self.store.blocked
+                    and entry.detection_count >= self.auto_block_detections
+                    and entry.last_detected >= block_window_start):
+                self.store.block(ip_address, entry, now)
+
+        if now >= self.next_cleanup:
+            self.store.cleanup(now - self.retention)
+            self.next_cleanup = now + timedelta(days=1)
+
+        self.window_start = now
+        self._reset_window()
+
+    def report(self, elapsed, top=10):
+        suspicious = sorted(
+            self.store.suspicious.items(),
+            key=lambda item: (-item[1].detection_count, -item[1].request_count)
+        )
+        blocked = sorted(self.store.blocked.items(), key=lambda item: item[1]['blocked_at'])
+        return {
+            'rows': self.rows,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed > 0 else None,
+            'detection_runs': self.ticks,
+            'out_of_order_rows': self.out_of_order_rows,
+            'total_detections': self.store.total_detections,
+            'flagged_ips': len(self.store.suspicious),
+            'blocked_ips': len(self.store.blocked),
+            'thresholds': {
+                'high_frequency_threshold': self.high_frequency_threshold,
+                'auto_block_detections': self.auto_block_detections,
+                'auto_block_window_hours': self.auto_block_window.total_seconds() / 3600,
+                'window_minutes': self.window.total_seconds() / 60,
+            },
+            'top_flagged': [
+                {
+                    'ip_address': ip,
+                    'detection_count': entry.detection_count,
+                    'request_count': entry.request_count,
+                    'first_detected': entry.first_detected.isoformat(),
+                    'last_detected': entry.last_detected.isoformat(),
+                }
+                for ip, entry in suspicious[:top]
+            ],
+            'blocked': [
+                {
+                    'ip_address': ip,
+                    'blocked_at': entry['blocked_at'].isoformat(),
+                    'detection_count': entry['detection_count'],
+                    'reason': entry['reason'],
+                }
+                for ip, entry in blocked
+            ],
+        }
+
+
+def iter_database_rows(start, end, chunk_size=5000):
+    """
+    Stream (ip_address, timestamp, path, requests) tuples from RequestLog in
+    timestamp order; requests is the number of the IP's requests the row
+    stands for, hit_count times ip_weight (see models.ip_request_total).
+    """
+    queryset = (RequestLog.objects
+                .filter(timestamp__gte=start, timestamp__lt=end)
+                .order_by('timestamp', 'id')
+                .values_list('ip_address', 'timestamp', logged_path(), F('hit_count') * F('ip_weight')))
+    return queryset.iterator(chunk_size=chunk_size)
+
+
+def _parse_timestamp(value):
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=dt_timezone.utc)
+    return timestamp
+
+
+def iter_file_rows(path, start=None, end=None):
+    """
+    Stream (ip_address, timestamp, path, requests) tuples from an exported CSV or
+    NDJSON file. Rows need ip_address, timestamp (ISO 8601) and path; an optional
+    hit_count column, times an optional ip_weight column, sets requests; other
+    columns are ignored.
+    """
+    with open(path, newline='', encoding='utf-8') as handle:
+        if path.endswith('.csv'):
+            records = csv.DictReader(handle)
+        else:
+            records = (json.loads(line) for line in handle if line.strip())
+
+        for record in records:
+            timestamp = _parse_timestamp(record['timestamp'])
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp >= end:
+                continue
+            requests = int(record.get('hit_count') or 1) * int(record.get('ip_weight') or 1)
+            yield record['ip_address'], timestamp, record['path'], requests
+
+
+def run_replay(rows, replayer):
+    """Feed every row into the replayer and return the elapsed wall time"""
+    started = time.perf_counter()
+    feed = replayer.feed
+    for row in rows:
+        feed(*row)
+    replayer.finish()
+    return time.perf_counter() - started
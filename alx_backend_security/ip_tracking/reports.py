@@ -0,0 +1,192 @@
+"""
+Queued processing of abuse reports.
+
+api_report_abuse validates a report and publishes it with one XADD to a
+capped Redis Stream, then answers 202; it never touches the database. The
+process_abuse_reports task drains the stream through a consumer group in
+batches. Each batch is folded to one row per (target IP, reporter), so a
+reporter flooding the endpoint adds to a counter instead of adding rows,
+and written with one select, one bulk_update and one bulk_create.
+
+A reporter is the address the endpoint's 'ip' rate limit keys on
+(ratelimit.get_ip: REMOTE_ADDR or the RATELIMIT_IP_META_KEY resolver, IPv6
+masked to a /64), so neither a forged X-Forwarded-For nor a walk through one
+IPv6 prefix makes one client count as several reporters.
+
+A target reported by REPORT_THRESHOLD distinct reporters within
+WINDOW_HOURS is flagged through flag_suspicious_ip, the same path detection
+uses, so it counts towards SuspiciousIP risk, auto-blocking and the
+reputation-based rate limits.
+"""
+import logging
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import AbuseReport
+from .redis_client import get_redis
+from .streams import StreamConsumer, encode_record
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ABUSE_REPORT_SETTINGS = {
+    'STREAM_KEY': 'ip_tracking:abuse_reports',
+    'STREAM_MAXLEN': 100000,
+    'BATCH_SIZE': 1000,
+    'MAX_BATCHES': 50,
+    'REPORT_THRESHOLD': 3,
+    'WINDOW_HOURS': 24,
+    'MAX_DESCRIPTION_LENGTH': 1000,
+}
+
+REPORT_GROUP = 'reports'
+
+
+def get_abuse_report_settings():
+    return {**DEFAULT_ABUSE_REPORT_SETTINGS, **getattr(settings, 'ABUSE_REPORT_SETTINGS', {})}
+
+
+def enqueue_report(ip_address, reporter_ip, category, description=''):
+    """Publish one report; returns False when the queue is unavailable"""
+    config = get_abuse_report_settings()
+    record = {
+        'ip_address': ip_address,
+        'reporter_ip': reporter_ip,
+        'category': category,
+        'description': description[:config['MAX_DESCRIPTION_LENGTH']],
+        'timestamp': timezone.now(),
+    }
+    try:
+        get_redis().xadd(config['STREAM_KEY'], encode_record(record),
+                         maxlen=config['STREAM_MAXLEN'], approximate=True)
+    except redis.RedisError as e:
+        logger.error(f"Error queueing abuse report against {ip_address}: {e}")
+        return False
+    return True
+
+
+def fold_reports(records):
+    """One entry per (target, reporter): count, latest category and description, time span"""
+    folded = {}
+    for record in records:
+        key = (record['ip_address'], record['reporter_ip'])
+        entry = folded.get(key)
+        if entry is None:
+            folded[key] = {
+                'count': 1,
+                'category': record.get('category') or 'other',
+                'description': record.get('description') or '',
+                'first': record['timestamp'],
+                'last': record['timestamp'],
+            }
+            continue
+        entry['count'] += 1
+        entry['first'] = min(entry['first'], record['timestamp'])
+        if record['timestamp'] >= entry['last']:
+            entry['last'] = record['timestamp']
+            entry['category'] = record.get('category') or entry['category']
+            entry['description'] = record.get('description') or entry['description']
+    return folded
+
+
+def reporter_counts(ip_addresses, since):
+    return dict(AbuseReport.objects
+                .filter(ip_address__in=ip_addresses, last_reported__gte=since)
+                .values_list('ip_address')
+                .annotate(reporters=Count('id'))
+                .order_by())
+
+
+def save_reports(folded):
+    """
+    Upsert folded reports. Returns the targets whose distinct reporters in
+    the window reached REPORT_THRESHOLD with this batch, with their counts.
+    """
+    config = get_abuse_report_settings()
+    since = timezone.now() - timedelta(hours=config['WINDOW_HOURS'])
+    targets = {ip_address for ip_address, _ in folded}
+
+    with transaction.atomic(using=router.db_for_write(AbuseReport)):
+        before = reporter_counts(targets, since)
+
+        # Over-fetches pairs from different reports, but keeps the query a pair of IN lists
+        candidates = (AbuseReport.objects
+                      .select_for_update()
+                      .filter(ip_address__in=targets, reporter_ip__in={reporter for _, reporter in folded}))
+        existing = {
+            (report.ip_address, report.reporter_ip): report
+            for report in candidates if (report.ip_address, report.reporter_ip) in folded
+        }
+
+        updated, created = [], []
+        for key, entry in folded.items():
+            report = existing.get(key)
+            if report is None:
+                created.append(AbuseReport(
+                    ip_address=key[0], reporter_ip=key[1], category=entry['category'],
+                    description=entry['description'], report_count=entry['count'],
+                    first_reported=entry['first'], last_reported=entry['last'],
+                ))
+                continue
+            report.report_count += entry['count']
+            if entry['last'] >= report.last_reported:
+                report.last_reported = entry['last']
+                report.category = entry['category']
+                report.description = entry['description'] or report.description
+            updated.append(report)
+
+        AbuseReport.objects.bulk_update(
+            updated, ['report_count', 'last_reported', 'category', 'description'], batch_size=500
+        )
+        AbuseReport.objects.bulk_create(created, batch_size=500)
+
+        after = reporter_counts(targets, since)
+
+    threshold = config['REPORT_THRESHOLD']
+    return {
+        ip_address: reporters for ip_address, reporters in after.items()
+        if before.get(ip_address, 0) < threshold <= reporters
+    }
+
+
+class AbuseReportConsumer(StreamConsumer):
+    """Drains the abuse report stream into AbuseReport and flags heavily reported IPs"""
+    group = REPORT_GROUP
+
+    def __init__(self, stream, consumer, **kwargs):
+        super().__init__(stream, consumer, **kwargs)
+        self.processed = 0
+        self.flagged = 0
+
+    def handle(self, records):
+        from .reputation import refresh_reputation
+        from .tasks import flag_suspicious_ip
+
+        folded = fold_reports(records)
+        crossed = save_reports(folded)
+        for ip_address, reporters in crossed.items():
+            categories = sorted({entry['category'] for (target, _), entry in folded.items() if target == ip_address})
+            flag_suspicious_ip(ip_address, {
+                'reason': f"Abuse reports from {reporters} reporters ({', '.join(categories)})",
+            })
+        if crossed:
+            refresh_reputation()
+        self.processed += len(records)
+        self.flagged += len(crossed)
+        logger.info(f"Processed {len(records)} abuse reports against {len({ip for ip, _ in folded})} IPs")
+
+
+def process_reports(consumer_name):
+    """Drain queued reports, up to MAX_BATCHES batches; returns (reports, IPs flagged)"""
+    config = get_abuse_report_settings()
+    consumer = AbuseReportConsumer(config['STREAM_KEY'], consumer_name,
+                                   batch_size=config['BATCH_SIZE'], block_ms=None)
+    consumer.ensure_group()
+    for _ in range(config['MAX_BATCHES']):
+        if not consumer.run_once():
+            break
+    return consumer.processed, consumer.flagged
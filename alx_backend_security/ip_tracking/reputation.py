@@ -0,0 +1,114 @@
+"""
+Reputation-adaptive rate limits.
+
+After each detection run the risk tier of every suspicious IP (LOW, MEDIUM
+or HIGH, as stored in SuspiciousIP.risk_tier) is written to the cache as one map with
+a version. Every process keeps the map in memory and looks at the version
+at most once per LOCAL_TTL seconds, rereading the map only when it changed,
+so resolving a rate is a dict lookup: no database query per request and
+usually no cache read either.
+
+reputation_rate() wraps a base rate into a rate callable for ratelimit():
+clean IPs get the base rate, suspicious ones the base rate scaled by their
+tier's factor in REPUTATION_SETTINGS['TIER_FACTORS']. The tier is looked up
+for ratelimit.resolve_ip(), the address the 'ip' key limits, never for a
+client-supplied X-Forwarded-For hop that could borrow a clean IP's rate.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .ratelimit import resolve_ip, split_rate
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REPUTATION_SETTINGS = {
+    'TIER_FACTORS': {'LOW': 0.5, 'MEDIUM': 0.25, 'HIGH': 0.1},
+    'LOCAL_TTL': 30,
+}
+
+MAP_KEY = 'ip_tracking:reputation'
+VERSION_KEY = 'ip_tracking:reputation:version'
+
+_local = {'version': None, 'tiers': {}, 'checked': None}
+_local_lock = threading.Lock()
+
+
+def get_reputation_settings():
+    return {**DEFAULT_REPUTATION_SETTINGS, **getattr(settings, 'REPUTATION_SETTINGS', {})}
+
+
+def build_reputation_map():
+    """ip -> risk tier for every suspicious IP, in one query"""
+    from .models import SuspiciousIP
+
+    labels = dict(SuspiciousIP.RISK_TIER_CHOICES)
+    rows = SuspiciousIP.objects.order_by().values_list('ip_address', 'risk_tier')
+    return {ip_address: labels[tier] for ip_address, tier in rows}
+
+
+def refresh_reputation():
+    """Rebuild the map and publish it to every process through the cache"""
+    tiers = build_reputation_map()
+    version = time.time()
+    cache.set(MAP_KEY, {'version': version, 'tiers': tiers}, None)
+    cache.set(VERSION_KEY, version, None)
+    logger.info(f"Refreshed reputation map: {len(tiers)} suspicious IPs")
+    return tiers
+
+
+def get_reputation_map():
+    """This process's copy of the map, revalidated against the cache every LOCAL_TTL seconds"""
+    now = time.monotonic()
+    if _local['checked'] is not None and now - _local['checked'] < get_reputation_settings()['LOCAL_TTL']:
+        return _local['tiers']
+
+    with _local_lock:
+        if _local['checked'] is not None and now - _local['checked'] < get_reputation_settings()['LOCAL_TTL']:
+            return _local['tiers']
+        _local['checked'] = now
+        try:
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                # Nothing published yet (or the cache was flushed)
+                _local['tiers'] = refresh_reputation()
+                _local['version'] = cache.get(VERSION_KEY)
+            elif version != _local['version']:
+                published = cache.get(MAP_KEY) or {}
+                _local['tiers'] = published.get('tiers', {})
+                _local['version'] = published.get('version')
+        except Exception as e:
+            logger.error(f"Error loading reputation map: {str(e)}")
+    return _local['tiers']
+
+
+def get_risk_tier(ip_address):
+    """LOW, MEDIUM or HIGH for a suspicious IP, None for any other"""
+    return get_reputation_map().get(ip_address)
+
+
+def scale_rate(rate, factor):
+    """
+    (limit, period) for `factor` times `rate`. The limit is rounded down, to
+    at least 1, and the period stretched to keep the scaled rate exact.
+    """
+    limit, period = split_rate(rate)
+    if factor >= 1:
+        return limit, period
+    scaled = limit * factor
+    new_limit = max(int(scaled), 1)
+    return new_limit, math.ceil(period * new_limit / scaled)
+
+
+def reputation_rate(base_rate):
+    """Rate callable giving `base_rate` to clean IPs and a tighter rate to suspicious ones"""
+    def rate(group, request):
+        tier = get_risk_tier(resolve_ip(request))
+        if tier is None:
+            return base_rate
+        return scale_rate(base_rate, get_reputation_settings()['TIER_FACTORS'].get(tier, 1))
+    return rate
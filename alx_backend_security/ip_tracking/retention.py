@@ -0,0 +1,214 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connections, router, transaction
+from django.utils import timezone
+
+from .models import (
+    RequestLog,
+    RequestPath,
+    SuspiciousIP,
+    AbuseReport,
+    HourlyTrafficSummary,
+    SecurityReport,
+    IPTrafficRollup,
+    PathTrafficRollup,
+    GeoTrafficRollup,
+)
+from .partitioning import drop_partitions_before
+from .paths import get_format_settings
+from .reputation import refresh_reputation
+from .tasks import get_detection_settings
+
+logger = logging.getLogger(__name__)
+
+# Field that ages each tracking model out
+RETENTION_FIELDS = {
+    RequestLog: 'timestamp',
+    SuspiciousIP: 'last_detected',
+    AbuseReport: 'last_reported',
+    HourlyTrafficSummary: 'hour',
+    SecurityReport: 'period_end',
+    IPTrafficRollup: 'bucket',
+    PathTrafficRollup: 'bucket',
+    GeoTrafficRollup: 'bucket',
+}
+
+DEFAULT_RETENTION_SETTINGS = {
+    'CHUNK_SIZE': 5000,
+    'SLEEP_BETWEEN_CHUNKS': 0.0,
+    'TTL_DAYS': {
+        'RequestLog': 30,
+        'AbuseReport': 30,
+        'HourlyTrafficSummary': 90,
+        'SecurityReport': 365,
+        'IPTrafficRollup': 30,
+        'PathTrafficRollup': 90,
+        'GeoTrafficRollup': 365,
+    },
+}
+
+
+def get_retention_settings():
+    configured = getattr(settings, 'RETENTION_SETTINGS', {})
+    retention_settings = {**DEFAULT_RETENTION_SETTINGS, **configured}
+    retention_settings['TTL_DAYS'] = {
+        'SuspiciousIP': get_detection_settings()['SUSPICIOUS_IP_RETENTION_DAYS'],
+        **DEFAULT_RETENTION_SETTINGS['TTL_DAYS'],
+        **configured.get('TTL_DAYS', {}),
+    }
+    return retention_settings
+
+
+def purge_before(model, cutoff, chunk_size=5000, sleep=0.0, progress=None):
+    """
+    Delete rows of `model` older than `cutoff` in primary-key-ordered chunks.
+
+    Each chunk looks up the next `chunk_size` expired primary keys, then deletes
+    that key range with a single DELETE in its own short transaction, so locks
+    are only held for one chunk at a time and no model instances are loaded.
+    `progress` is called with (deleted_so_far, last_pk) after every chunk.
+    """
+    field = RETENTION_FIELDS[model]
+    using = router.db_for_write(model)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+
+    table = quote_name(model._meta.db_table)
+    pk_column = quote_name(model._meta.pk.column)
+    age_column = quote_name(model._meta.get_field(field).column)
+    sql = (
+        f'DELETE FROM {table} '
+        f'WHERE {pk_column} >= %s AND {pk_column} <= %s AND {age_column} < %s'
+    )
+    cutoff_param = connection.ops.adapt_datetimefield_value(cutoff)
+
+    expired = model._base_manager.using(using).filter(**{f'{field}__lt': cutoff}).order_by('pk')
+    deleted = 0
+    last_pk = None
+
+    while True:
+        chunk = expired if last_pk is None else expired.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+
+        with transaction.atomic(using=using):
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [pks[0], pks[-1], cutoff_param])
+                deleted += max(cursor.rowcount, 0)
+
+        last_pk = pks[-1]
+        if progress:
+            progress(deleted, last_pk)
+
+        if len(pks) < chunk_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+
+    return deleted
+
+
+def purge_model(model, now=None, progress=None):
+    """Apply the configured TTL to one model. Returns the number of deleted rows."""
+    retention_settings = get_retention_settings()
+    ttl_days = retention_settings['TTL_DAYS'].get(model.__name__)
+    if not ttl_days:
+        return 0
+
+    cutoff = (now or timezone.now()) - timedelta(days=ttl_days)
+    if model is RequestLog:
+        # Whole expired partitions are dropped; only the boundary partition needs row deletes
+        drop_partitions_before(cutoff)
+    deleted = purge_before(
+        model,
+        cutoff,
+        chunk_size=retention_settings['CHUNK_SIZE'],
+        sleep=retention_settings['SLEEP_BETWEEN_CHUNKS'],
+        progress=progress,
+    )
+    if model is SuspiciousIP and deleted:
+        # Purged IPs must stop being throttled by the reputation map
+        transaction.on_commit(refresh_reputation, using=router.db_for_write(SuspiciousIP))
+    return deleted
+
+
+def purge_unreferenced_paths(now=None, chunk_size=5000, sleep=0.0, progress=None):
+    """
+    Delete RequestPath entries that no RequestLog row references any more, in
+    primary-key-ordered chunks. Entries younger than PATH_CACHE_TTL are kept:
+    a writer may have just created one and not inserted its row yet. Each
+    chunk is one DELETE ... NOT EXISTS, so the foreign key check settles a
+    race with a writer; a chunk that loses it is skipped until the next run.
+    """
+    using = router.db_for_write(RequestPath)
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+
+    paths = quote_name(RequestPath._meta.db_table)
+    logs = quote_name(RequestLog._meta.db_table)
+    pk_column = quote_name(RequestPath._meta.pk.column)
+    age_column = quote_name(RequestPath._meta.get_field('first_seen').column)
+    ref_column = quote_name(RequestLog._meta.get_field('path_ref').column)
+    sql = (
+        f'DELETE FROM {paths} '
+        f'WHERE {pk_column} >= %s AND {pk_column} <= %s AND {age_column} < %s '
+        f'AND NOT EXISTS (SELECT 1 FROM {logs} WHERE {logs}.{ref_column} = {paths}.{pk_column})'
+    )
+    cutoff = (now or timezone.now()) - timedelta(seconds=get_format_settings()['PATH_CACHE_TTL'])
+    cutoff_param = connection.ops.adapt_datetimefield_value(cutoff)
+
+    entries = RequestPath.objects.using(using).filter(first_seen__lt=cutoff).order_by('pk')
+    deleted = 0
+    last_pk = None
+
+    while True:
+        chunk = entries if last_pk is None else entries.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+
+        try:
+            with transaction.atomic(using=using):
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, [pks[0], pks[-1], cutoff_param])
+                    deleted += max(cursor.rowcount, 0)
+        except IntegrityError as e:
+            logger.warning(f"Skipped RequestPath entries {pks[0]}-{pks[-1]} referenced by a concurrent write: {e}")
+
+        last_pk = pks[-1]
+        if progress:
+            progress(deleted, last_pk)
+
+        if len(pks) < chunk_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+
+    return deleted
+
+
+def purge_all(now=None, progress=None):
+    """Apply every configured TTL. `progress` gets (model_name, deleted_so_far, last_pk)."""
+    now = now or timezone.now()
+    results = {}
+    for model in RETENTION_FIELDS:
+        model_progress = None
+        if progress:
+            model_progress = lambda deleted, last_pk, name=model.__name__: progress(name, deleted, last_pk)
+        results[model.__name__] = purge_model(model, now=now, progress=model_progress)
+        logger.info(f"Retention purge removed {results[model.__name__]} {model.__name__} rows")
+
+    # With their rows gone, dictionary entries can go too
+    retention_settings = get_retention_settings()
+    results['RequestPath'] = purge_unreferenced_paths(
+        now=now,
+        chunk_size=retention_settings['CHUNK_SIZE'],
+        sleep=retention_settings['SLEEP_BETWEEN_CHUNKS'],
+        progress=(lambda deleted, last_pk: progress('RequestPath', deleted, last_pk)) if progress else None,
+    )
+    logger.info(f"Retention purge removed {results['RequestPath']} unreferenced RequestPath entries")
+    return results
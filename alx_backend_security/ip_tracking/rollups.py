@@ -0,0 +1,355 @@
+"""
+Pre-aggregated traffic rollups.
+
+RequestLog rows are folded, in id order, into three small tables keyed by
+time bucket: (bucket, ip), (bucket, path) and (bucket, country, city). Each
+batch is a single INSERT ... SELECT ... GROUP BY per rollup with an
+upsert-with-increment, so the aggregation runs inside the database and the
+checkpoint moves in the same transaction. Read paths that used to aggregate
+raw logs go through the helpers at the bottom of this module instead.
+"""
+import logging
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce, TruncHour, TruncMinute
+from django.utils import timezone
+
+from .models import (
+    RequestLog,
+    IPTrafficRollup,
+    PathTrafficRollup,
+    GeoTrafficRollup,
+    RollupCheckpoint,
+    analytics_path,
+    ip_request_total,
+    request_total,
+)
+from .paths import top_logged_paths
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROLLUP_SETTINGS = {
+    'ENABLED': True,
+    'BUCKETS': {'ip': 'minute', 'path': 'hour', 'geo': 'hour'},
+    'BATCH_SIZE': 50000,
+    'GAP_SECONDS': 600,
+}
+
+TRUNCATE = {
+    'minute': TruncMinute,
+    'hour': TruncHour,
+}
+
+# rollup name -> (model, {rollup column: source expression}, request count aggregate)
+ROLLUPS = {
+    'ip': (IPTrafficRollup, {'ip_address': F('ip_address')}, ip_request_total),
+    'path': (PathTrafficRollup, {'path': analytics_path()}, request_total),
+    'geo': (GeoTrafficRollup, {
+        'country': Coalesce('country', Value('')),
+        'city': Coalesce('city', Value('')),
+    }, request_total),
+}
+
+CHECKPOINT_NAME = 'request_log'
+
+
+def get_rollup_settings():
+    configured = getattr(settings, 'ROLLUP_SETTINGS', {})
+    return {
+        **DEFAULT_ROLLUP_SETTINGS,
+        **configured,
+        'BUCKETS': {**DEFAULT_ROLLUP_SETTINGS['BUCKETS'], **configured.get('BUCKETS', {})},
+    }
+
+
+def rollups_enabled():
+    return get_rollup_settings()['ENABLED']
+
+
+def bucket_floor(moment, bucket):
+    moment = moment.astimezone(dt_timezone.utc)
+    if bucket == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def _upsert_sql(connection, model, key_columns, select_sql):
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    count_column = quote_name('request_count')
+    columns = ', '.join(quote_name(column) for column in ['bucket', *key_columns, 'request_count'])
+    insert = f'INSERT INTO {table} ({columns}) {select_sql}'
+
+    if connection.vendor == 'mysql':
+        return f'{insert} ON DUPLICATE KEY UPDATE {count_column} = {count_column} + VALUES({count_column})'
+
+    conflict = ', '.join(quote_name(column) for column in ['bucket', *key_columns])
+    return (
+        f'{insert} ON CONFLICT ({conflict}) DO UPDATE '
+        f'SET {count_column} = {table}.{count_column} + EXCLUDED.{count_column}'
+    )
+
+
+def _rollup_rows(using, logs, buckets):
+    """Fold the RequestLog rows of `logs` into every rollup table"""
+    connection = connections[using]
+    logs = logs.order_by()
+
+    with connection.cursor() as cursor:
+        for name, (model, keys, total) in ROLLUPS.items():
+            aliases = {f'rollup_{column}': expression for column, expression in keys.items()}
+            grouped = (logs
+                       .annotate(rollup_bucket=TRUNCATE[buckets[name]]('timestamp', tzinfo=dt_timezone.utc),
+                                 **aliases)
+                       .values('rollup_bucket', *aliases)
+                       .annotate(rollup_count=total()))
+            select_sql, params = grouped.query.sql_with_params()
+            cursor.execute(_upsert_sql(connection, model, list(keys), select_sql), params)
+
+
+def _id_ranges(ids):
+    """Collapse sorted ids into inclusive (first, last) runs"""
+    ranges = []
+    for row_id in ids:
+        if ranges and row_id == ranges[-1][1] + 1:
+            ranges[-1][1] = row_id
+        else:
+            ranges.append([row_id, row_id])
+    return ranges
+
+
+def _missing_ranges(using, first_id, last_id):
+    """Inclusive (first, last) runs of ids in (first_id, last_id] with no committed row"""
+    logs = RequestLog.objects.using(using).filter(id__gt=first_id, id__lte=last_id)
+    if logs.count() == last_id - first_id:
+        return []
+    present = _id_ranges(logs.order_by('id').values_list('id', flat=True).iterator(chunk_size=10000))
+    missing, expected = [], first_id + 1
+    for low, high in present:
+        if low > expected:
+            missing.append([expected, low - 1])
+        expected = high + 1
+    if expected <= last_id:
+        missing.append([expected, last_id])
+    return missing
+
+
+def _recheck_gaps(using, checkpoint, now, buckets, gap_seconds):
+    """
+    Fold rows that were committed into id gaps since they were passed, and
+    forget gaps older than gap_seconds (rolled back or abandoned ids).
+    """
+    still_missing = []
+    folded = 0
+    for low, high, found_at in checkpoint.pending_ids:
+        logs = RequestLog.objects.using(using).filter(id__gte=low, id__lte=high)
+        # Every row in a gap committed after the gap was recorded, so none is folded twice
+        arrived = logs.count()
+        if arrived:
+            _rollup_rows(using, logs, buckets)
+            folded += arrived
+        if arrived < high - low + 1:
+            remaining = _missing_ranges(using, low - 1, high) if arrived else [[low, high]]
+            if now.timestamp() - found_at < gap_seconds:
+                still_missing += [[first, last, found_at] for first, last in remaining]
+            else:
+                logger.info(f"Gave up waiting for RequestLog ids {low}-{high} after {gap_seconds}s")
+    checkpoint.pending_ids = still_missing
+    return folded
+
+
+def update_rollups(now=None, max_batches=None):
+    """
+    Fold new RequestLog rows into the rollup tables, BATCH_SIZE ids at a time.
+
+    Rows are taken in id order up to the newest committed id. Ids below that
+    with no row yet (a concurrent writer's transaction still open) are kept
+    on the checkpoint as gaps and rechecked on every run for GAP_SECONDS, so
+    rows committed out of id order are folded in once they appear. Rows that
+    arrive late with old timestamps get new ids and are folded normally.
+    Returns the number of batches applied.
+    """
+    rollup_settings = get_rollup_settings()
+    if not rollup_settings['ENABLED']:
+        return 0
+
+    using = router.db_for_write(RequestLog)
+    now = now or timezone.now()
+    buckets = rollup_settings['BUCKETS']
+    batch_size = rollup_settings['BATCH_SIZE']
+    RollupCheckpoint.objects.using(using).get_or_create(name=CHECKPOINT_NAME)
+
+    with transaction.atomic(using=using):
+        checkpoint = (RollupCheckpoint.objects.using(using)
+                      .select_for_update()
+                      .get(name=CHECKPOINT_NAME))
+        if checkpoint.pending_ids:
+            folded = _recheck_gaps(using, checkpoint, now, buckets, rollup_settings['GAP_SECONDS'])
+            checkpoint.save(update_fields=['pending_ids'])
+            if folded:
+                logger.info(f"Folded {folded} rows committed out of id order")
+
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic(using=using):
+            checkpoint = (RollupCheckpoint.objects.using(using)
+                          .select_for_update()
+                          .get(name=CHECKPOINT_NAME))
+            first_id = checkpoint.last_id
+            max_id = (RequestLog.objects.using(using)
+                      .filter(id__gt=first_id, id__lte=first_id + batch_size)
+                      .aggregate(max_id=Max('id'))['max_id'])
+
+            if max_id is None:
+                # Nothing in this id window; step over it if newer rows exist
+                next_id = (RequestLog.objects.using(using)
+                           .filter(id__gt=first_id + batch_size)
+                           .aggregate(next_id=Min('id'))['next_id'])
+                if next_id is None:
+                    break
+                last_id = next_id - 1
+            else:
+                last_id = max_id
+
+            _rollup_rows(using, RequestLog.objects.using(using).filter(id__gt=first_id, id__lte=last_id), buckets)
+            checkpoint.pending_ids += [
+                [low, high, now.timestamp()] for low, high in _missing_ranges(using, first_id, last_id)
+            ]
+            checkpoint.last_id = last_id
+            checkpoint.updated_at = timezone.now()
+            checkpoint.save(update_fields=['last_id', 'pending_ids', 'updated_at'])
+            batches += 1
+
+    if batches:
+        logger.info(f"Applied {batches} rollup batch(es)")
+    return batches
+
+
+def _rollup_window(model, name, start, end):
+    """Rollup rows whose bucket overlaps [start, end)"""
+    queryset = model.objects.all()
+    if start is not None:
+        queryset = queryset.filter(bucket__gte=bucket_floor(start, get_rollup_settings()['BUCKETS'][name]))
+    if end is not None:
+        queryset = queryset.filter(bucket__lt=end)
+    return queryset.order_by()
+
+
+def _raw_window(start, end):
+    queryset = RequestLog.objects.all()
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    return queryset.order_by()
+
+
+def total_requests(start=None, end=None):
+    if not rollups_enabled():
+        return _raw_window(start, end).aggregate(total=request_total())['total']
+    total = _rollup_window(GeoTrafficRollup, 'geo', start, end).aggregate(total=Sum('request_count'))['total']
+    return total or 0
+
+
+def hourly_totals(start, end):
+    """{hour start: requests} for the hours in [start, end) that saw traffic"""
+    if not rollups_enabled():
+        rows = (_raw_window(start, end)
+                .annotate(hour=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+                .values_list('hour')
+                .annotate(total=request_total()))
+    else:
+        rows = (_rollup_window(GeoTrafficRollup, 'geo', start, end)
+                .annotate(hour=TruncHour('bucket', tzinfo=dt_timezone.utc))
+                .values_list('hour')
+                .annotate(total=Sum('request_count')))
+    return dict(rows.order_by())
+
+
+def unique_ips(start=None, end=None):
+    if not rollups_enabled():
+        return _raw_window(start, end).values('ip_address').distinct().count()
+    return _rollup_window(IPTrafficRollup, 'ip', start, end).values('ip_address').distinct().count()
+
+
+def top_countries(start, end, top):
+    if not rollups_enabled():
+        return list(_raw_window(start, end)
+                    .values('country')
+                    .annotate(count=request_total())
+                    .order_by('-count')[:top])
+    return list(_rollup_window(GeoTrafficRollup, 'geo', start, end)
+                .values('country')
+                .annotate(count=Sum('request_count'))
+                .order_by('-count')[:top])
+
+
+def top_cities(start, end, top):
+    if not rollups_enabled():
+        return list(_raw_window(start, end)
+                    .values('city', 'country')
+                    .annotate(count=request_total())
+                    .order_by('-count')[:top])
+    return list(_rollup_window(GeoTrafficRollup, 'geo', start, end)
+                .values('city', 'country')
+                .annotate(count=Sum('request_count'))
+                .order_by('-count')[:top])
+
+
+def top_paths(start, end, top):
+    """Busiest normalized paths; rows logged before normalization count under their raw path"""
+    if not rollups_enabled():
+        window = _raw_window(start, end)
+        normalized = [
+            {'path': stat['normalized_path'], 'count': stat['count']}
+            for stat in (window.exclude(normalized_path='')
+                         .values('normalized_path')
+                         .annotate(count=request_total())
+                         .order_by('-count')[:top])
+        ]
+        raw = top_logged_paths(window.filter(normalized_path=''), top)
+        return sorted(normalized + raw, key=lambda stat: stat['count'], reverse=True)[:top]
+    return list(_rollup_window(PathTrafficRollup, 'path', start, end)
+                .values('path')
+                .annotate(count=Sum('request_count'))
+                .order_by('-count')[:top])
+
+
+def top_ips(start, end, top):
+    """Busiest IPs with the location last cached for them by the middleware"""
+    if not rollups_enabled():
+        return list(_raw_window(start, end)
+                    .values('ip_address', 'country', 'city')
+                    .annotate(count=ip_request_total())
+                    .order_by('-count')[:top])
+
+    ip_stats = list(_rollup_window(IPTrafficRollup, 'ip', start, end)
+                    .values('ip_address')
+                    .annotate(count=Sum('request_count'))
+                    .order_by('-count')[:top])
+    locations = cache.get_many([f"geolocation_{stat['ip_address']}" for stat in ip_stats])
+    for stat in ip_stats:
+        location = locations.get(f"geolocation_{stat['ip_address']}") or {}
+        stat['country'] = location.get('country')
+        stat['city'] = location.get('city')
+    return ip_stats
+
+
+def ip_request_counts(start, end, min_count):
+    """IPs with more than min_count requests in [start, end), busiest first"""
+    if not rollups_enabled():
+        return list(_raw_window(start, end)
+                    .values('ip_address')
+                    .annotate(request_count=ip_request_total())
+                    .filter(request_count__gt=min_count)
+                    .order_by('-request_count'))
+    return list(_rollup_window(IPTrafficRollup, 'ip', start, end)
+                .values('ip_address')
+                .annotate(total=Sum('request_count'))
+                .filter(total__gt=min_count)
+                .order_by('-total')
+                .values('ip_address', request_count=F('total')))
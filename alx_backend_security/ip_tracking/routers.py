@@ -0,0 +1,77 @@
+"""
+Database routing for the ip_tracking tables.
+
+When TRACKING_DATABASE['ALIAS'] names a configured database, every
+ip_tracking model lives there, so bursts of RequestLog writes do not compete
+with auth, sessions and the admin on 'default'. Analytics reads (raw logs,
+rollups, summaries and reports) are spread over TRACKING_DATABASE['REPLICAS'];
+state that is read and then written back (blocked and suspicious IPs,
+checkpoints) is always read from the primary. The whole app is routed as one
+group because rollups and retention run SQL that spans several of its tables.
+Without the alias configured everything stays on 'default'.
+"""
+import random
+
+from django.conf import settings
+
+APP_LABEL = 'ip_tracking'
+
+DEFAULT_TRACKING_DATABASE = {
+    'ALIAS': 'tracking',
+    'REPLICAS': [],
+}
+
+# Models whose reads may be served by a replica
+REPLICA_MODELS = {
+    'requestlog',
+    'iptrafficrollup',
+    'pathtrafficrollup',
+    'geotrafficrollup',
+    'hourlytrafficsummary',
+    'securityreport',
+}
+
+
+def get_tracking_database_settings():
+    return {**DEFAULT_TRACKING_DATABASE, **getattr(settings, 'TRACKING_DATABASE', {})}
+
+
+def tracking_alias():
+    """Primary database for the ip_tracking tables"""
+    alias = get_tracking_database_settings()['ALIAS']
+    return alias if alias in settings.DATABASES else 'default'
+
+
+def replica_aliases():
+    return [alias for alias in get_tracking_database_settings()['REPLICAS'] if alias in settings.DATABASES]
+
+
+class TrackingRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        replicas = replica_aliases()
+        if replicas and model._meta.model_name in REPLICA_MODELS and 'instance' not in hints:
+            return random.choice(replicas)
+        return tracking_alias()
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return tracking_alias()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        labels = {obj1._meta.app_label, obj2._meta.app_label}
+        if APP_LABEL in labels and tracking_alias() != 'default':
+            return labels == {APP_LABEL}
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_aliases():
+            return False
+        alias = tracking_alias()
+        if alias == 'default':
+            return None
+        if app_label == APP_LABEL:
+            return db == alias
+        return db != alias
@@ -0,0 +1,168 @@
+"""
+Request sampling and skip rules.
+
+REQUEST_SAMPLING['RULES'] is an ordered list; the first rule matching a
+request decides what happens to it. A rule can match on path prefixes,
+HTTP methods and client networks (all given conditions must hold) and
+carries a sample rate: 0 skips the request, 1 logs it, anything between
+logs one request in round(1 / rate) and stores that factor on the row as
+sample_weight, so summing weights extrapolates the real request count.
+Per-IP counts (detection, the IP rollup, SuspiciousIP.request_count) use
+ip_weight instead. A rule sampling by IP keeps all of a logged client's
+requests, so its rows are already that client's real count (ip_weight 1).
+A rule sampling by (IP, path) keeps only some of a client's paths, so its
+rows carry ip_weight = sample_weight to extrapolate the client's count (see
+models.ip_request_total).
+
+Sampling is deterministic: the decision comes from a hash of the client IP
+(or of IP and path), so every process makes the same choice and a sampled
+client is logged consistently. Rules are compiled once into a path prefix
+trie and per-prefix-length network sets, keeping the per-request decision
+to a few dictionary lookups.
+"""
+import ipaddress
+import threading
+import zlib
+
+from django.conf import settings
+
+DEFAULT_SAMPLING_SETTINGS = {
+    'ENABLED': True,
+    'RULES': [],
+    'DEFAULT_RATE': 1.0,
+}
+
+SAMPLE_KEYS = ('ip', 'ip_path')
+
+
+def get_sampling_settings():
+    return {**DEFAULT_SAMPLING_SETTINGS, **getattr(settings, 'REQUEST_SAMPLING', {})}
+
+
+def sample_weight(rate):
+    """Rates are rounded to 1/N so every logged row stands for a whole number of requests"""
+    if rate <= 0:
+        return 0
+    return max(1, round(1 / min(rate, 1.0)))
+
+
+class NetworkSet:
+    """Membership test for a set of CIDR blocks, one hash lookup per prefix length"""
+
+    def __init__(self, cidrs):
+        self.prefixes = {4: {}, 6: {}}
+        for cidr in cidrs:
+            network = ipaddress.ip_network(cidr, strict=False)
+            bits = network.max_prefixlen
+            by_length = self.prefixes[network.version]
+            by_length.setdefault(network.prefixlen, set()).add(
+                int(network.network_address) >> (bits - network.prefixlen)
+            )
+
+    def __contains__(self, ip):
+        bits = ip.max_prefixlen
+        value = int(ip)
+        for prefix_length, networks in self.prefixes[ip.version].items():
+            if value >> (bits - prefix_length) in networks:
+                return True
+        return False
+
+
+class SamplingRule:
+    def __init__(self, index, name, rate, methods=None, cidrs=None, sample_by='ip'):
+        if sample_by not in SAMPLE_KEYS:
+            raise ValueError(f"Sampling rule {name!r}: sample_by must be one of {', '.join(SAMPLE_KEYS)}")
+        self.index = index
+        self.name = name
+        self.weight = sample_weight(rate)
+        self.methods = frozenset(method.upper() for method in methods) if methods else None
+        self.networks = NetworkSet(cidrs) if cidrs else None
+        self.sample_by = sample_by
+
+    def matches(self, method, ip):
+        if self.methods is not None and method not in self.methods:
+            return False
+        if self.networks is not None and (ip is None or ip not in self.networks):
+            return False
+        return True
+
+
+class RequestSampler:
+    """Compiled form of REQUEST_SAMPLING; decide() returns the sample weight, 0 meaning skip"""
+
+    def __init__(self, rules, default_rate=1.0):
+        self.default_weight = sample_weight(default_rate)
+        self.trie = {}
+        self.any_path = []
+        for index, config in enumerate(rules):
+            rule = SamplingRule(
+                index,
+                config.get('name', f'rule {index}'),
+                config.get('rate', 0.0),
+                methods=config.get('methods'),
+                cidrs=config.get('cidrs'),
+                sample_by=config.get('sample_by', 'ip'),
+            )
+            prefixes = config.get('path_prefixes')
+            if not prefixes:
+                self.any_path.append(rule)
+            for prefix in prefixes or []:
+                node = self.trie
+                for char in prefix:
+                    node = node.setdefault(char, {})
+                node.setdefault(None, []).append(rule)
+
+    def candidates(self, path):
+        """Rules whose path condition matches, in declaration order"""
+        rules = list(self.any_path)
+        node = self.trie
+        for char in path:
+            rules.extend(node.get(None, ()))
+            node = node.get(char)
+            if node is None:
+                break
+        else:
+            rules.extend(node.get(None, ()))
+        return sorted(rules, key=lambda rule: rule.index)
+
+    def decide(self, method, ip_address, path):
+        return self.decision(method, ip_address, path)[0]
+
+    def decision(self, method, ip_address, path):
+        """(sample_weight, ip_weight) for a request, (0, 0) when it is skipped"""
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            ip = None
+
+        weight = self.default_weight
+        sample_by = 'ip'
+        for rule in self.candidates(path):
+            if rule.matches(method, ip):
+                weight = rule.weight
+                sample_by = rule.sample_by
+                break
+
+        if weight <= 1:
+            return weight, weight
+        key = f'{ip_address}' if sample_by == 'ip' else f'{ip_address} {path}'
+        if zlib.crc32(key.encode('utf-8')) % weight:
+            return 0, 0
+        return weight, 1 if sample_by == 'ip' else weight
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Process-wide sampler built from REQUEST_SAMPLING, or None when disabled"""
+    global _sampler
+    sampling_settings = get_sampling_settings()
+    if not sampling_settings['ENABLED']:
+        return None
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = RequestSampler(sampling_settings['RULES'], sampling_settings['DEFAULT_RATE'])
+    return _sampler
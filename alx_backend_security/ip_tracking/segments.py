@@ -0,0 +1,225 @@
+"""
+Append-only segment files for RequestLog records.
+
+The segment sink appends one NDJSON line per request to a per-process file
+opened with O_APPEND, so the request path never waits on the database. Files
+are rotated by size or age: the active file ends in '.open' and is renamed
+to '.ndjson' once sealed, by the next write or, on an idle worker, by a
+timer once it is max_age old. The loader reads sealed segments in batches,
+enriches them with geolocation, writes them through the configured
+ingestion backend and records its byte offset in the same transaction, so a
+crashed load resumes where it stopped. Segments are local files: the loader
+has to run on the same host as the web processes that write them.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from django.db import router, transaction
+
+from .models import RequestLog, RollupCheckpoint
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = '.open'
+SEALED_SUFFIX = '.ndjson'
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class SegmentSink:
+    """Appends records to rotating segment files; enrichment happens in the loader"""
+    defers_enrichment = True
+
+    def __init__(self, directory, max_bytes=16 * 1024 * 1024, max_age=10.0):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._fd = None
+        self._path = None
+        self._pid = None
+        self._size = 0
+        self._opened = 0.0
+        self._counter = 0
+        self._timer = None
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.close)
+
+    def emit(self, record):
+        line = (json.dumps(record, default=_encode, separators=(',', ':')) + '\n').encode()
+        try:
+            with self._lock:
+                if (self._fd is None
+                        or self._pid != os.getpid()
+                        or self._size >= self.max_bytes
+                        or time.monotonic() - self._opened >= self.max_age):
+                    self._rotate()
+                os.write(self._fd, line)
+                self._size += len(line)
+        except OSError as e:
+            logger.error(f"Error appending request to segment: {e}")
+
+    def flush(self):
+        """Seal the active segment so the loader can pick it up"""
+        with self._lock:
+            self._seal()
+
+    def close(self):
+        self.flush()
+
+    def _rotate(self):
+        self._seal()
+        self._counter += 1
+        self._pid = os.getpid()
+        name = f"{int(time.time() * 1000):013d}-{self._pid}-{self._counter}{OPEN_SUFFIX}"
+        self._path = os.path.join(self.directory, name)
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o640)
+        self._size = 0
+        self._opened = time.monotonic()
+        self._timer = threading.Timer(self.max_age, self._seal_if_current, args=(self._path,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _seal_if_current(self, path):
+        """Timer callback: seal the segment it was started for unless it was already rotated"""
+        with self._lock:
+            if self._path == path and self._pid == os.getpid():
+                self._seal()
+
+    def _seal(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._fd is None:
+            return
+        # A forked child inherits the parent's descriptor but not its file
+        if self._pid == os.getpid():
+            os.close(self._fd)
+            try:
+                os.rename(self._path, self._path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+            except FileNotFoundError:
+                pass
+        self._fd = None
+        self._path = None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def seal_orphaned_segments(directory, idle_seconds):
+    """Seal '.open' segments left behind by processes that are gone"""
+    sealed = []
+    now = time.time()
+    for name in os.listdir(directory):
+        if not name.endswith(OPEN_SUFFIX):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            pid = int(name.split('-')[1])
+            idle = now - os.path.getmtime(path)
+        except (IndexError, ValueError, OSError):
+            continue
+        if idle >= idle_seconds and not _pid_alive(pid):
+            os.rename(path, path[:-len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+            sealed.append(name)
+            logger.warning(f"Sealed orphaned request segment {name}")
+    return sealed
+
+
+def sealed_segments(directory):
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(SEALED_SUFFIX)
+    )
+
+
+def _read_batch(segment, batch_size):
+    """Up to batch_size complete lines; a torn last line is left unread"""
+    lines = []
+    for _ in range(batch_size):
+        line = segment.readline()
+        if not line.endswith(b'\n'):
+            break
+        lines.append(line)
+    return lines
+
+
+def _parse(lines, path):
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+            if record.get('last_seen'):
+                record['last_seen'] = datetime.fromisoformat(record['last_seen'])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Skipping malformed record in {os.path.basename(path)}: {e}")
+            continue
+        records.append(record)
+    return records
+
+
+def load_segment(path, backend, batch_size=5000, enrich=None):
+    """
+    Load one sealed segment into RequestLog, checkpointing the byte offset
+    after every batch. The file is removed once fully loaded.
+    Returns the number of records written.
+    """
+    using = router.db_for_write(RequestLog)
+    checkpoint_name = f"segment:{os.path.basename(path)}"
+    checkpoint, _ = RollupCheckpoint.objects.using(using).get_or_create(name=checkpoint_name)
+    loaded = 0
+
+    with open(path, 'rb') as segment:
+        segment.seek(checkpoint.last_id)
+        while True:
+            lines = _read_batch(segment, batch_size)
+            if not lines:
+                break
+            records = _parse(lines, path)
+            if enrich and records:
+                enrich(records)
+
+            with transaction.atomic(using=using):
+                if records:
+                    backend.write(records)
+                checkpoint.last_id = segment.tell()
+                checkpoint.save(update_fields=['last_id'])
+            loaded += len(records)
+
+    os.remove(path)
+    checkpoint.delete()
+    return loaded
+
+
+def load_segments(directory, backend, batch_size=5000, enrich=None, orphan_after=60.0, max_segments=None):
+    """Load every sealed segment, oldest first. Returns (segments, records) loaded."""
+    if not os.path.isdir(directory):
+        return 0, 0
+
+    seal_orphaned_segments(directory, orphan_after)
+    segments = records = 0
+    for path in sealed_segments(directory)[:max_segments]:
+        records += load_segment(path, backend, batch_size=batch_size, enrich=enrich)
+        segments += 1
+
+    if segments:
+        logger.info(f"Loaded {records} requests from {segments} segment(s)")
+    return segments, records
@@ -0,0 +1,92 @@
+"""
+Precomputed snapshot behind the public_stats view.
+
+The counts are computed by the refresh_public_stats task and stored in the
+cache with the time they were taken and an ETag, so serving the page is one
+cache read whatever the size of the tables. A snapshot older than MAX_AGE is
+still served, for up to STALE_WHILE_REVALIDATE more seconds in the
+Cache-Control header and indefinitely from the cache, while a single refresh
+is queued in the background.
+"""
+import hashlib
+import json
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PUBLIC_STATS_SETTINGS = {
+    'MAX_AGE': 60,
+    'STALE_WHILE_REVALIDATE': 300,
+}
+
+SNAPSHOT_KEY = 'ip_tracking:public_stats'
+REFRESH_LOCK_KEY = 'ip_tracking:public_stats:refreshing'
+
+EMPTY_STATS = {'total_requests': 0, 'unique_ips': 0, 'total_blocked': 0}
+
+
+def get_public_stats_settings():
+    return {**DEFAULT_PUBLIC_STATS_SETTINGS, **getattr(settings, 'PUBLIC_STATS', {})}
+
+
+def compute_public_stats():
+    from . import rollups
+    from .models import BlockedIP
+    from .retention import get_retention_settings
+
+    # Same window RequestLog keeps, so the counts agree with the raw table
+    # and the distinct count stays bounded while the rollups outlive it
+    start = timezone.now() - timedelta(days=get_retention_settings()['TTL_DAYS']['RequestLog'])
+    return {
+        'total_requests': rollups.total_requests(start),
+        'unique_ips': rollups.unique_ips(start),
+        'total_blocked': BlockedIP.objects.count(),
+    }
+
+
+def refresh_public_stats():
+    """Recompute the counts and store a new snapshot. Returns the snapshot."""
+    stats = compute_public_stats()
+    snapshot = {
+        'stats': stats,
+        'generated_at': time.time(),
+        'etag': hashlib.blake2b(json.dumps(stats, sort_keys=True).encode(), digest_size=8).hexdigest(),
+    }
+    # Kept without a timeout: an old snapshot is better than recomputing on the request path
+    cache.set(SNAPSHOT_KEY, snapshot, None)
+    cache.delete(REFRESH_LOCK_KEY)
+    return snapshot
+
+
+def request_refresh():
+    """Queue one refresh; concurrent callers within the lock window are coalesced"""
+    from .tasks import refresh_public_stats as refresh_task
+
+    if not cache.add(REFRESH_LOCK_KEY, True, get_public_stats_settings()['MAX_AGE']):
+        return
+    try:
+        refresh_task.delay()
+    except Exception as e:
+        logger.error(f"Error queueing public stats refresh: {e}")
+
+
+def get_public_stats_snapshot():
+    """
+    The current snapshot with its age in seconds. When none exists yet, zero
+    counts with a generated_at of None are returned and a refresh is queued.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        request_refresh()
+        return {'stats': dict(EMPTY_STATS), 'generated_at': None, 'etag': 'empty', 'age': None}
+
+    age = max(time.time() - snapshot['generated_at'], 0)
+    if age >= get_public_stats_settings()['MAX_AGE']:
+        request_refresh()
+    return {**snapshot, 'age': age}
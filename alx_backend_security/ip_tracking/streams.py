@@ -0,0 +1,224 @@
+"""
+Redis Streams pipeline for RequestLog records.
+
+The stream sink publishes each request with a single XADD and returns; the
+stream is capped at STREAM_MAXLEN entries. Consumers read it through Redis
+consumer groups, so any number of them can share the work:
+
+- the 'writers' group enriches entries with geolocation and bulk-inserts
+  them through the configured ingestion backend,
+- the 'detectors' group counts requests per IP per hour in Redis and flags
+  an IP as soon as it crosses HIGH_FREQUENCY_THRESHOLD, instead of waiting
+  for the hourly detection task.
+
+Entries are acknowledged after they are processed, and entries left pending
+by a consumer that died are claimed by the others after STREAM_CLAIM_IDLE_MS,
+so delivery is at-least-once: a consumer that dies between its insert and its
+XACK will see that batch written twice. A batch whose handler raises is logged
+and left pending to be retried the same way; once an entry has been delivered
+STREAM_MAX_DELIVERIES times it is moved to the '<stream>:dead' stream and
+acknowledged, so one poison entry cannot stall the group.
+"""
+import logging
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+import redis
+from django.db import router, transaction
+
+from .models import RequestLog
+from .reputation import refresh_reputation
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+WRITER_GROUP = 'writers'
+DETECTOR_GROUP = 'detectors'
+
+# Per-IP hourly counters kept by the detector group
+REALTIME_COUNTER_KEY = 'ip_tracking:realtime:{hour}'
+REALTIME_COUNTER_TTL = 2 * 60 * 60
+
+# Entries that failed STREAM_MAX_DELIVERIES times, kept for inspection and replay
+DEAD_LETTER_KEY = '{stream}:dead'
+
+
+def encode_record(record):
+    fields = {}
+    for key, value in record.items():
+        if value is None:
+            value = ''
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        fields[key] = str(value)
+    return fields
+
+
+def decode_record(fields):
+    record = {key: value or None for key, value in fields.items()}
+    record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+    if record.get('last_seen'):
+        record['last_seen'] = datetime.fromisoformat(record['last_seen'])
+    return record
+
+
+class RedisStreamSink:
+    """Publishes records to a Redis Stream; enrichment happens in the writer group"""
+    defers_enrichment = True
+
+    def __init__(self, stream, maxlen=1000000):
+        self.stream = stream
+        self.maxlen = maxlen
+
+    def emit(self, record):
+        try:
+            get_redis().xadd(self.stream, encode_record(record), maxlen=self.maxlen, approximate=True)
+        except redis.RedisError as e:
+            logger.error(f"Error publishing request to stream: {e}")
+
+    def flush(self):
+        pass
+
+
+class StreamConsumer:
+    """One member of a consumer group; subclasses implement handle(records)"""
+    group = None
+
+    def __init__(self, stream, consumer, batch_size=1000, block_ms=5000, claim_idle_ms=60000, max_deliveries=5):
+        self.stream = stream
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.client = get_redis()
+
+    def ensure_group(self):
+        try:
+            self.client.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def read_batch(self):
+        """Entries abandoned by dead consumers first, then new ones"""
+        _, entries, *_ = self.client.xautoclaim(
+            self.stream, self.group, self.consumer,
+            min_idle_time=self.claim_idle_ms, start_id='0-0', count=self.batch_size
+        )
+        if entries:
+            return entries
+
+        response = self.client.xreadgroup(
+            self.group, self.consumer, {self.stream: '>'},
+            count=self.batch_size, block=self.block_ms
+        )
+        return response[0][1] if response else []
+
+    def run_once(self):
+        """Process one batch. Returns the number of entries acknowledged."""
+        entries = [(entry_id, fields) for entry_id, fields in self.read_batch() if fields]
+        if not entries:
+            return 0
+
+        records = []
+        for entry_id, fields in entries:
+            try:
+                records.append(decode_record(fields))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping malformed stream entry {entry_id}: {e}")
+
+        try:
+            if records:
+                self.handle(records)
+        except Exception as e:
+            logger.error(f"Error handling {len(entries)} entries from {self.stream} in group {self.group}: {str(e)}")
+            return self.dead_letter(entries)
+        self.client.xack(self.stream, self.group, *[entry_id for entry_id, _ in entries])
+        return len(entries)
+
+    def dead_letter(self, entries):
+        """
+        Move entries of a failed batch that have used up their deliveries to the
+        dead-letter stream; the rest stay pending and are reclaimed after
+        claim_idle_ms. Returns the number of entries acknowledged.
+        """
+        pending = self.client.xpending_range(
+            self.stream, self.group, min=entries[0][0], max=entries[-1][0],
+            count=len(entries), consumername=self.consumer
+        )
+        deliveries = {entry['message_id']: entry['times_delivered'] for entry in pending}
+        dead = [(entry_id, fields) for entry_id, fields in entries
+                if deliveries.get(entry_id, 0) >= self.max_deliveries]
+        if not dead:
+            return 0
+
+        pipeline = self.client.pipeline()
+        for _, fields in dead:
+            pipeline.xadd(DEAD_LETTER_KEY.format(stream=self.stream), fields)
+        pipeline.xack(self.stream, self.group, *[entry_id for entry_id, _ in dead])
+        pipeline.execute()
+        logger.error(f"Moved {len(dead)} entries to the dead-letter stream after {self.max_deliveries} deliveries")
+        return len(dead)
+
+    def run(self, max_batches=None):
+        self.ensure_group()
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            self.run_once()
+            batches += 1
+
+    def handle(self, records):
+        raise NotImplementedError
+
+
+class StreamWriter(StreamConsumer):
+    """Enriches stream entries and bulk-inserts them into RequestLog"""
+    group = WRITER_GROUP
+
+    def __init__(self, stream, consumer, backend, enrich=None, **kwargs):
+        super().__init__(stream, consumer, **kwargs)
+        self.backend = backend
+        self.enrich = enrich
+
+    def handle(self, records):
+        if self.enrich:
+            self.enrich(records)
+        with transaction.atomic(using=router.db_for_write(RequestLog)):
+            self.backend.write(records)
+        logger.info(f"Stream writer {self.consumer} inserted {len(records)} requests")
+
+
+class StreamDetector(StreamConsumer):
+    """Flags IPs the moment their hourly request count crosses the threshold"""
+    group = DETECTOR_GROUP
+
+    def __init__(self, stream, consumer, threshold, **kwargs):
+        super().__init__(stream, consumer, **kwargs)
+        self.threshold = threshold
+
+    def handle(self, records):
+        from .tasks import flag_suspicious_ip
+
+        counts = Counter()
+        for record in records:
+            hour = record['timestamp'].astimezone(dt_timezone.utc).strftime('%Y%m%d%H')
+            # Per-IP count: collapsed repeats times ip_weight (see models.ip_request_total)
+            counts[hour, record['ip_address']] += int(record.get('hit_count') or 1) * int(record.get('ip_weight') or 1)
+        pipeline = self.client.pipeline(transaction=False)
+        for (hour, ip_address), count in counts.items():
+            key = REALTIME_COUNTER_KEY.format(hour=hour)
+            pipeline.hincrby(key, ip_address, count)
+            pipeline.expire(key, REALTIME_COUNTER_TTL)
+        totals = pipeline.execute()[::2]
+
+        flagged = False
+        for ((hour, ip_address), count), total in zip(counts.items(), totals):
+            if total - count <= self.threshold < total:
+                flag_suspicious_ip(ip_address, {
+                    'reason': f'High frequency requests: {total} requests/hour (real-time)',
+                    'request_count': total
+                }, hour=datetime.strptime(hour, '%Y%m%d%H').replace(tzinfo=dt_timezone.utc))
+                flagged = True
+        if flagged:
+            refresh_reputation()
@@ -1,24 +1,80 @@
 from celery import shared_task
+from django.conf import settings
 from django.utils import timezone
+from django.db import router, transaction
 from django.db.models import Count, Q
-from datetime import timedelta
+from datetime import timedelta, timezone as dt_timezone
 import logging
 
-from .models import RequestLog, SuspiciousIP, BlockedIP
+from . import rollups
+from .events import publish_event
+from .locks import single_flight
+from .reputation import refresh_reputation
+from .models import RequestLog, SuspiciousIP, BlockedIP, HourlyTrafficSummary, SecurityReport, ip_request_total, logged_path, request_total
+from .sketches import HyperLogLog
 
 logger = logging.getLogger(__name__)
 
+SENSITIVE_PATHS = [
+    '/admin',
+    '/login',
+    '/wp-admin',
+    '/wp-login',
+    '/.env',
+    '/config',
+    '/api/admin',
+    '/dashboard',
+    '/phpmyadmin',
+    '/xmlrpc.php',
+    '/robots.txt',
+    '/.git',
+    '/backup',
+    '/uploads',
+    '/wp-config.php'
+]
+
+DEFAULT_DETECTION_SETTINGS = {
+    'HIGH_FREQUENCY_THRESHOLD': 100,
+    'AUTO_BLOCK_DETECTIONS': 5,
+    'AUTO_BLOCK_WINDOW_HOURS': 24,
+    'SUSPICIOUS_IP_RETENTION_DAYS': 7,
+}
+
+
+# Shared by the retention tasks so the old cleanup and the full purge never run together
+RETENTION_LOCK = 'ip_tracking.tasks.retention'
+
+# Hours are summarized a few minutes after they close so late writes are included
+HOUR_SETTLE_DELAY = timedelta(minutes=5)
+# Summaries this recent are compared with the rollups and rebuilt when rows
+# arrived after them (buffered sinks, segment catch-up, stream lag)
+RESUMMARIZE_LOOKBACK = timedelta(days=7)
+
+
+def detection_hour(moment):
+    """The UTC clock hour a detection is counted for"""
+    return moment.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def get_detection_settings():
+    """Detection thresholds, with ANOMALY_DETECTION_SETTINGS overriding the defaults"""
+    return {**DEFAULT_DETECTION_SETTINGS, **getattr(settings, 'ANOMALY_DETECTION_SETTINGS', {})}
+
+
 @shared_task(bind=True)
+@single_flight(lease=60 * 10, coalesce=True)
 def detect_suspicious_ips(self):
     """
     Celery task to detect suspicious IP addresses based on:
-    1. High request frequency (>100 requests/hour)
+    1. High request frequency (>HIGH_FREQUENCY_THRESHOLD requests/hour)
     2. Access to sensitive paths (/admin, /login, etc.)
     
-    Runs hourly to analyze recent activity.
+    Runs hourly to analyze recent activity. Overlapping runs are coalesced
+    into one rerun of the active task instead of scanning the logs twice.
     """
     try:
-        one_hour_ago = timezone.now() - timedelta(hours=1)
+        now = timezone.now()
+        one_hour_ago = now - timedelta(hours=1)
         
         logger.info(f"Starting anomaly detection for requests since {one_hour_ago}")
 
@@ -29,9 +85,9 @@ def detect_suspicious_ips(self):
             'total_processed_requests': 0
         }
 
-        high_frequency_ips = detect_high_frequency_ips(one_hour_ago, stats)
+        high_frequency_ips = detect_high_frequency_ips(one_hour_ago, stats, window_end=now)
 
-        sensitive_path_ips = detect_sensitive_path_access(one_hour_ago, stats)
+        sensitive_path_ips = detect_sensitive_path_access(one_hour_ago, stats, window_end=now)
 
         all_suspicious_ips = {}
         all_suspicious_ips.update(high_frequency_ips)
@@ -43,30 +99,15 @@ def detect_suspicious_ips(self):
             else:
                 all_suspicious_ips[ip] = data
 
+        # The clock hour holding most of the window, which is the one the
+        # real-time detector would have flagged the same traffic under
+        hour = detection_hour(one_hour_ago + (now - one_hour_ago) / 2)
         for ip_address, data in all_suspicious_ips.items():
-            suspicious_ip, created = SuspiciousIP.objects.get_or_create(
-                ip_address=ip_address,
-                defaults={
-                    'reason': data['reason'],
-                    'request_count': data['request_count'],
-                    'first_detected': timezone.now(),
-                    'last_detected': timezone.now(),
-                    'detection_count': 1
-                }
-            )
-            
-            if not created:
-                suspicious_ip.reason = data['reason']
-                suspicious_ip.request_count = data['request_count']
-                suspicious_ip.last_detected = timezone.now()
-                suspicious_ip.detection_count += 1
-                suspicious_ip.save()
-                logger.info(f"Updated suspicious IP {ip_address} (detection #{suspicious_ip.detection_count})")
-            else:
+            if flag_suspicious_ip(ip_address, data, hour=hour):
                 stats['new_suspicious_ips'] += 1
-                logger.warning(f"New suspicious IP detected: {ip_address} - {data['reason']}")
 
         auto_block_repeat_offenders()
+        refresh_reputation()
         
         logger.info(f"Anomaly detection completed. Stats: {stats}")
         
@@ -81,16 +122,76 @@ def detect_suspicious_ips(self):
         raise
 
 
-def detect_high_frequency_ips(one_hour_ago, stats):
-    """Detect IPs with more than 100 requests in the last hour"""
+def count_detection(suspicious_ip, data, hour, now):
+    """
+    Fold a repeat detection into an existing SuspiciousIP, or anything with
+    its fields (the replay store). Returns False, leaving only the reason and
+    request count refreshed, when `hour` was already counted; see
+    flag_suspicious_ip.
+    """
+    suspicious_ip.reason = data['reason']
+    if hour is not None and suspicious_ip.counted_hour == hour:
+        suspicious_ip.request_count = max(suspicious_ip.request_count, data.get('request_count', 0))
+        return False
+    # Detections from reports carry no request count; keep the last one seen
+    if 'request_count' in data:
+        suspicious_ip.request_count = data['request_count']
+    suspicious_ip.last_detected = now
+    suspicious_ip.detection_count += 1
+    if hour is not None and (suspicious_ip.counted_hour is None or hour > suspicious_ip.counted_hour):
+        suspicious_ip.counted_hour = hour
+    return True
+
+
+def flag_suspicious_ip(ip_address, data, hour=None):
+    """
+    Record a detection for ip_address; returns True if the IP is newly suspicious.
+
+    The row is read and updated under a row lock, so the stream detector, the
+    hourly task and the report consumer can flag the same IP concurrently.
+    `hour` is the clock hour (detection_hour()) the detection covers. A second
+    detection for the hour already counted is the real-time and hourly
+    detectors seeing the same burst: it refreshes the reason and request
+    count only. Consecutive hours each count.
+    """
+    now = timezone.now()
+    with transaction.atomic(using=router.db_for_write(SuspiciousIP)):
+        suspicious_ip, created = SuspiciousIP.objects.select_for_update().get_or_create(
+            ip_address=ip_address,
+            defaults={
+                'reason': data['reason'],
+                'request_count': data.get('request_count', 0),
+                'first_detected': now,
+                'last_detected': now,
+                'detection_count': 1,
+                'counted_hour': hour,
+            }
+        )
+
+        if not created and not count_detection(suspicious_ip, data, hour, now):
+            suspicious_ip.save(update_fields=['reason', 'request_count'])
+            logger.info(f"Suspicious IP {ip_address} already flagged for this window")
+            return False
+
+        if not created:
+            suspicious_ip.save()
+            logger.info(f"Updated suspicious IP {ip_address} (detection #{suspicious_ip.detection_count})")
+        else:
+            logger.warning(f"New suspicious IP detected: {ip_address} - {data['reason']}")
+    publish_event('detected', ip_address, reason=data['reason'], request_count=suspicious_ip.request_count,
+                  detection_count=suspicious_ip.detection_count, new=created)
+    return created
+
+
+def detect_high_frequency_ips(one_hour_ago, stats, window_end=None):
+    """Detect IPs with more than HIGH_FREQUENCY_THRESHOLD requests in the last hour"""
     high_frequency_ips = {}
+    threshold = get_detection_settings()['HIGH_FREQUENCY_THRESHOLD']
+    window_end = window_end or timezone.now()
 
-    high_freq_data = (RequestLog.objects
-                     .filter(timestamp__gte=one_hour_ago)
-                     .values('ip_address')
-                     .annotate(request_count=Count('id'))
-                     .filter(request_count__gt=100)
-                     .order_by('-request_count'))
+    # Per-IP counts come from the minute rollups, brought up to date first
+    rollups.update_rollups()
+    high_freq_data = rollups.ip_request_counts(one_hour_ago, window_end, threshold)
     
     for data in high_freq_data:
         ip_address = data['ip_address']
@@ -107,39 +208,26 @@ def detect_high_frequency_ips(one_hour_ago, stats):
     logger.info(f"Found {len(high_frequency_ips)} high frequency IPs")
     return high_frequency_ips
 
-def detect_sensitive_path_access(one_hour_ago, stats):
+def detect_sensitive_path_access(one_hour_ago, stats, window_end=None):
     """Detect IPs accessing sensitive paths"""
     sensitive_path_ips = {}
-
-    sensitive_paths = [
-        '/admin',
-        '/login',
-        '/wp-admin',
-        '/wp-login',
-        '/.env',
-        '/config',
-        '/api/admin',
-        '/dashboard',
-        '/phpmyadmin',
-        '/xmlrpc.php',
-        '/robots.txt',
-        '/.git',
-        '/backup',
-        '/uploads',
-        '/wp-config.php'
-    ]
+    window_end = window_end or timezone.now()
 
     path_filter = Q()
-    for path in sensitive_paths:
-        path_filter |= Q(path__icontains=path)
+    for path in SENSITIVE_PATHS:
+        path_filter |= Q(logged_path__icontains=path)
+
+    # Compact rows keep their path in RequestPath, so match on the resolved path
+    sensitive_logs = (RequestLog.objects
+                      .filter(timestamp__gte=one_hour_ago, timestamp__lt=window_end)
+                      .annotate(logged_path=logged_path())
+                      .filter(path_filter))
 
-    sensitive_access_data = (RequestLog.objects
-                           .filter(timestamp__gte=one_hour_ago)
-                           .filter(path_filter)
+    sensitive_access_data = (sensitive_logs
                            .values('ip_address')
                            .annotate(
-                               request_count=Count('id'),
-                               accessed_paths=Count('path', distinct=True)
+                               request_count=ip_request_total(),
+                               accessed_paths=Count('logged_path', distinct=True)
                            )
                            .order_by('-request_count'))
     
@@ -148,13 +236,10 @@ def detect_sensitive_path_access(one_hour_ago, stats):
         request_count = data['request_count']
         path_count = data['accessed_paths']
 
-        paths_accessed = (RequestLog.objects
-                         .filter(
-                             timestamp__gte=one_hour_ago,
-                             ip_address=ip_address
-                         )
-                         .filter(path_filter)
-                         .values_list('path', flat=True)
+        paths_accessed = (sensitive_logs
+                         .filter(ip_address=ip_address)
+                         .values_list('logged_path', flat=True)
+                         .order_by()
                          .distinct()[:10])
         
         paths_list = list(paths_accessed)
@@ -178,11 +263,12 @@ def detect_sensitive_path_access(one_hour_ago, stats):
 def auto_block_repeat_offenders():
     """Automatically block IPs that have been flagged as suspicious multiple times"""
     
-    twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
+    detection_settings = get_detection_settings()
+    window_start = timezone.now() - timedelta(hours=detection_settings['AUTO_BLOCK_WINDOW_HOURS'])
     repeat_offenders = (SuspiciousIP.objects
                        .filter(
-                           last_detected__gte=twenty_four_hours_ago,
-                           detection_count__gte=5
+                           last_detected__gte=window_start,
+                           detection_count__gte=detection_settings['AUTO_BLOCK_DETECTIONS']
                        )
                        .exclude(ip_address__in=BlockedIP.objects.values_list('ip_address', flat=True)))
     blocked_count = 0
@@ -200,24 +286,24 @@ def auto_block_repeat_offenders():
 
             from django.core.cache import cache
             cache.delete(f"blocked_ip_{suspicious_ip.ip_address}")
+            publish_event('blocked', suspicious_ip.ip_address, reason=blocked_ip.reason, source='auto')
     
     if blocked_count > 0:
         logger.info(f"Auto-blocked {blocked_count} repeat offenders")
 
 
 @shared_task(bind=True)
+@single_flight(name=RETENTION_LOCK, lease=60 * 10)
 def cleanup_old_suspicious_ips(self):
     """
     Cleanup task to remove old suspicious IP records.
-    Runs daily to keep the database clean.
+    Deletes in small chunks so the table is never locked for long.
     """
-    try:
+    from .retention import purge_model
 
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        
-        deleted_count, _ = SuspiciousIP.objects.filter(
-            last_detected__lt=seven_days_ago
-        ).delete()
+    try:
+        # purge_model refreshes the reputation map once the deletes commit
+        deleted_count = purge_model(SuspiciousIP)
         
         logger.info(f"Cleaned up {deleted_count} old suspicious IP records")
         
@@ -232,32 +318,310 @@ def cleanup_old_suspicious_ips(self):
 
 
 @shared_task(bind=True)
+@single_flight(name=RETENTION_LOCK, lease=60 * 10)
+def purge_expired_records(self):
+    """
+    Daily retention task: applies RETENTION_SETTINGS TTLs to every tracking table,
+    deleting in primary-key-ordered chunks and reporting progress as it goes,
+    then drops path dictionary entries no remaining row references.
+    """
+    from .retention import purge_all
+
+    def report_progress(model_name, deleted, last_pk):
+        if self.request.id:
+            self.update_state(state='PROGRESS', meta={
+                'model': model_name,
+                'deleted': deleted,
+                'last_pk': last_pk
+            })
+
+    try:
+        deleted = purge_all(progress=report_progress)
+        
+        logger.info(f"Retention purge completed: {deleted}")
+        
+        return {
+            'status': 'success',
+            'deleted': deleted
+        }
+        
+    except Exception as e:
+        logger.error(f"Error in retention purge task: {str(e)}")
+        raise
+
+
+@shared_task(bind=True)
+@single_flight(lease=60 * 5)
+def update_traffic_rollups(self):
+    """
+    Fold newly written RequestLog rows into the IP, path and location rollups.
+    Runs every minute; each run only touches rows added since the last one.
+    Also keeps the admin's RequestLog filter choices fresh.
+    """
+    from .facets import refresh_facets
+
+    try:
+        batches = rollups.update_rollups()
+        facets_refreshed = refresh_facets()
+        
+        return {
+            'status': 'success',
+            'batches': batches,
+            'facets_refreshed': facets_refreshed
+        }
+        
+    except Exception as e:
+        logger.error(f"Error updating traffic rollups: {str(e)}")
+        raise
+
+
+@shared_task(bind=True)
+@single_flight(lease=60 * 5)
+def process_abuse_reports(self):
+    """
+    Drain abuse reports queued by api_report_abuse into AbuseReport in batches,
+    flagging IPs reported by enough distinct reporters as suspicious.
+    """
+    from .reports import process_reports
+
+    try:
+        processed, flagged = process_reports('process_abuse_reports')
+        
+        if processed:
+            logger.info(f"Processed {processed} abuse reports, flagged {flagged} IPs")
+        
+        return {
+            'status': 'success',
+            'processed_reports': processed,
+            'flagged_ips': flagged
+        }
+        
+    except Exception as e:
+        logger.error(f"Error processing abuse reports: {str(e)}")
+        raise
+
+
+@shared_task(bind=True)
+@single_flight(lease=60 * 5)
+def refresh_public_stats(self):
+    """
+    Recompute the snapshot served by the public_stats view.
+    Runs every minute and on demand when a request finds the snapshot stale.
+    """
+    from .stats import refresh_public_stats as refresh_snapshot
+
+    try:
+        snapshot = refresh_snapshot()
+        
+        return {
+            'status': 'success',
+            'stats': snapshot['stats']
+        }
+        
+    except Exception as e:
+        logger.error(f"Error refreshing public stats: {str(e)}")
+        raise
+
+
+@shared_task(bind=True)
+@single_flight(lease=60 * 5)
+def load_request_segments(self):
+    """
+    Load sealed request segment files into RequestLog.
+    Only has work to do when REQUEST_LOG_INGESTION uses the segment sink.
+    """
+    from .ingestion import load_pending_segments
+
+    try:
+        segments, records = load_pending_segments()
+        
+        return {
+            'status': 'success',
+            'segments': segments,
+            'records': records
+        }
+        
+    except Exception as e:
+        logger.error(f"Error loading request segments: {str(e)}")
+        raise
+
+
+@shared_task(bind=True)
+@single_flight(lease=60 * 10)
+def maintain_requestlog_partitions(self):
+    """
+    Daily task that keeps future RequestLog partitions created ahead of time.
+    Does nothing unless RequestLog is a partitioned PostgreSQL table.
+    """
+    from .partitioning import ensure_partitions, is_partitioned
+
+    try:
+        if not is_partitioned():
+            return {'status': 'skipped', 'reason': 'RequestLog is not partitioned'}
+
+        created = ensure_partitions()
+        
+        logger.info(f"Partition maintenance created {len(created)} RequestLog partitions")
+        
+        return {
+            'status': 'success',
+            'created_partitions': created
+        }
+        
+    except Exception as e:
+        logger.error(f"Error maintaining RequestLog partitions: {str(e)}")
+        raise
+
+
+def summarize_hour(hour_start):
+    """
+    Build (or rebuild) the HourlyTrafficSummary for the hour starting at hour_start.
+    Scans only that hour of RequestLog, so the cost is bounded by hourly traffic.
+    """
+    hour_end = hour_start + timedelta(hours=1)
+    hour_logs = RequestLog.objects.filter(timestamp__gte=hour_start, timestamp__lt=hour_end).order_by()
+
+    sketch = HyperLogLog()
+    unique_ips = 0
+    for ip_address in hour_logs.values_list('ip_address', flat=True).distinct().iterator(chunk_size=5000):
+        sketch.add(ip_address)
+        unique_ips += 1
+
+    summary, _ = HourlyTrafficSummary.objects.update_or_create(
+        hour=hour_start,
+        defaults={
+            'total_requests': hour_logs.aggregate(total=request_total())['total'],
+            'unique_ips': unique_ips,
+            'ip_sketch': sketch.to_bytes(),
+            'computed_at': timezone.now()
+        }
+    )
+    return summary
+
+
+def closed_hours(end, hours):
+    """Start times of the `hours` full hours before end, oldest first"""
+    last_hour = end.replace(minute=0, second=0, microsecond=0)
+    return [last_hour - timedelta(hours=offset) for offset in range(hours, 0, -1)]
+
+
+def ensure_hourly_summaries(hours):
+    """Summarize any of the given hours that do not have a summary yet"""
+    existing = set(HourlyTrafficSummary.objects.filter(hour__in=hours).values_list('hour', flat=True))
+    missing = [hour for hour in hours if hour not in existing]
+    for hour in missing:
+        summarize_hour(hour)
+    return missing
+
+
+def stale_summary_hours(start, end):
+    """Summarized hours in [start, end) whose request total no longer matches the rollups"""
+    totals = rollups.hourly_totals(start, end)
+    summaries = (HourlyTrafficSummary.objects
+                 .filter(hour__gte=start, hour__lt=end)
+                 .values_list('hour', 'total_requests'))
+    return [hour for hour, total in summaries if totals.get(hour, 0) != total]
+
+
+def merge_hourly_summaries(hours):
+    """(total requests, estimated unique IPs) over the summaries of the given hours"""
+    summaries = HourlyTrafficSummary.objects.filter(hour__in=hours).only('total_requests', 'ip_sketch')
+    total_requests = 0
+    ip_sketch = HyperLogLog()
+    for summary in summaries:
+        total_requests += summary.total_requests
+        ip_sketch.merge(HyperLogLog.from_bytes(summary.ip_sketch))
+    return total_requests, ip_sketch.count()
+
+
+def refresh_report_totals(hours):
+    """Recompute the traffic totals of stored reports whose period covers any of the given hours"""
+    if not hours:
+        return 0
+    reports = SecurityReport.objects.filter(period_start__lte=max(hours), period_end__gt=min(hours))
+    refreshed = 0
+    for report in reports:
+        if not any(report.period_start <= hour < report.period_end for hour in hours):
+            continue
+        period_hours = int((report.period_end - report.period_start) / timedelta(hours=1))
+        report.total_requests, report.unique_ips = merge_hourly_summaries(
+            [report.period_start + timedelta(hours=offset) for offset in range(period_hours)]
+        )
+        report.save(update_fields=['total_requests', 'unique_ips'])
+        refreshed += 1
+    return refreshed
+
+
+@shared_task(bind=True)
+@single_flight(lease=60 * 10)
+def summarize_traffic_hours(self):
+    """
+    Hourly task that materializes the partial aggregates for recently closed hours.
+    Missing hours within the report window are backfilled, and summaries of the
+    last RESUMMARIZE_LOOKBACK that rows arrived for after they were built are
+    rebuilt, along with the totals of the reports covering them.
+    """
+    try:
+        settled = timezone.now() - HOUR_SETTLE_DELAY
+        hours = closed_hours(settled, 24)
+        missing = ensure_hourly_summaries(hours)
+
+        # Late rows are found through the rollups, which fold rows in insert order
+        rollups.update_rollups()
+        stale = stale_summary_hours(settled - RESUMMARIZE_LOOKBACK, hours[-1] + timedelta(hours=1))
+        for hour in stale:
+            summarize_hour(hour)
+        refreshed_reports = refresh_report_totals(stale)
+
+        logger.info(f"Summarized {len(missing)} traffic hours, rebuilt {len(stale)} with late rows")
+
+        return {
+            'status': 'success',
+            'summarized_hours': [hour.isoformat() for hour in missing],
+            'resummarized_hours': [hour.isoformat() for hour in stale],
+            'refreshed_reports': refreshed_reports
+        }
+
+    except Exception as e:
+        logger.error(f"Error summarizing traffic hours: {str(e)}")
+        raise
+
+
+@shared_task(bind=True)
+@single_flight(lease=60 * 10)
 def generate_security_report(self):
     """
     Generate a daily security report with suspicious activity summary.
+
+    Request totals and unique IPs are merged from the 24 hourly summaries
+    instead of scanning the raw logs, and the report is stored as a
+    SecurityReport row for trend views.
     """
     try:
-        twenty_four_hours_ago = timezone.now() - timedelta(hours=24)
+        now = timezone.now()
+        hours = closed_hours(now - HOUR_SETTLE_DELAY, 24)
+        period_start = hours[0]
+        period_end = hours[-1] + timedelta(hours=1)
 
-        total_requests = RequestLog.objects.filter(timestamp__gte=twenty_four_hours_ago).count()
-        unique_ips = RequestLog.objects.filter(timestamp__gte=twenty_four_hours_ago).values('ip_address').distinct().count()
-        new_suspicious_ips = SuspiciousIP.objects.filter(first_detected__gte=twenty_four_hours_ago).count()
+        ensure_hourly_summaries(hours)
+        total_requests, unique_ips = merge_hourly_summaries(hours)
+
+        new_suspicious_ips = SuspiciousIP.objects.filter(first_detected__gte=period_start).count()
         total_blocked = BlockedIP.objects.count()
         
         top_suspicious = (SuspiciousIP.objects
-                         .filter(last_detected__gte=twenty_four_hours_ago)
+                         .filter(last_detected__gte=period_start)
                          .order_by('-detection_count', '-request_count')[:10])
         
-        report = {
-            'timestamp': timezone.now().isoformat(),
-            'period': '24 hours',
-            'summary': {
-                'total_requests': total_requests,
-                'unique_ips': unique_ips,
-                'new_suspicious_ips': new_suspicious_ips,
-                'total_blocked_ips': total_blocked
-            },
-            'top_suspicious_ips': [
+        report = SecurityReport.objects.create(
+            generated_at=now,
+            period_start=period_start,
+            period_end=period_end,
+            total_requests=total_requests,
+            unique_ips=unique_ips,
+            new_suspicious_ips=new_suspicious_ips,
+            total_blocked_ips=total_blocked,
+            top_suspicious_ips=[
                 {
                     'ip_address': ip.ip_address,
                     'detection_count': ip.detection_count,
@@ -266,12 +630,13 @@ def generate_security_report(self):
                 }
                 for ip in top_suspicious
             ]
-        }
+        )
         
-        logger.info(f"Generated security report: {report['summary']}")
+        report_data = report.as_dict()
+        logger.info(f"Generated security report: {report_data['summary']}")
         
-        return report
+        return report_data
         
     except Exception as e:
         logger.error(f"Error generating security report: {str(e)}")
-        raise
\ No newline at end of file
+        raise
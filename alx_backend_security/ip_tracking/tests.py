@@ -1,3 +1,1229 @@
-from django.test import TestCase
+import asyncio
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from importlib import import_module
+from io import StringIO
+from unittest import skipUnless
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, events, export, pagination, partitioning, ratelimit, redis_client, reputation, rollups, stats, tasks
+from .admin import SuspiciousIPAdmin
+from .decorators import QueryBudgetExceeded, query_budget
+from .ingestion import CollapsingSink, DatabaseSink, ORMBackend
+from .routers import TrackingRouter
+from .sampling import RequestSampler
+from .segments import SegmentSink, load_segments, sealed_segments
+from .streams import RedisStreamSink, StreamDetector, StreamWriter, decode_record
+from .locks import TaskLock, get_lock_stats, single_flight
+from .models import (
+    BlockedIP,
+    GeoTrafficRollup,
+    HourlyTrafficSummary,
+    IPTrafficRollup,
+    RequestLog,
+    RequestPath,
+    RollupCheckpoint,
+    SecurityReport,
+    SuspiciousIP,
+    request_total,
+)
+from .normalization import PathNormalizer
+from .reputation import refresh_reputation
+from .stats import compute_public_stats
+
+try:
+    import fakeredis
+    import fakeredis.aioredis
+    import redis
+except ImportError:
+    fakeredis = None
+
+PAGE_SIZE = 500
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                             'OPTIONS': {'MAX_ENTRIES': 10000}}}
+
+
+@skipUnless(fakeredis, 'fakeredis[lua] is not installed')
+@override_settings(CACHES=LOCMEM_CACHES)
+class FakeRedisTestCase(TestCase):
+    """Runs get_redis() against an in-process fakeredis server and the cache in memory"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=self.server, decode_responses=True)
+        patcher = patch.dict(redis_client._clients, {redis_client.get_redis_url(): self.redis})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class TaskLockTests(FakeRedisTestCase):
+    def test_second_acquire_fails_until_release(self):
+        first, second = TaskLock('test.lock', lease=60), TaskLock('test.lock', lease=60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+
+    def test_expired_owner_cannot_extend_or_release(self):
+        stale = TaskLock('test.lock', lease=60)
+        self.assertTrue(stale.acquire())
+        stale._stop.set()
+        # The lease runs out and another run takes the lock
+        self.redis.delete(stale.key)
+        current = TaskLock('test.lock', lease=60)
+        self.assertTrue(current.acquire())
+
+        self.assertFalse(stale.extend())
+        stale.release()
+        self.assertEqual(self.redis.get(current.key), current.token)
+        self.assertTrue(current.extend())
+        current.release()
+        self.assertIsNone(self.redis.get(current.key))
+
+    def test_overlapping_triggers_coalesce_into_one_rerun(self):
+        calls = []
+
+        @single_flight(name='test.coalesce', lease=60, coalesce=True)
+        def task():
+            calls.append(len(calls))
+            if len(calls) == 1:
+                # Two triggers arrive while the first run holds the lock
+                self.assertEqual(task()['status'], 'coalesced')
+                self.assertEqual(task()['status'], 'coalesced')
+
+        task()
+        self.assertEqual(calls, [0, 1])
+        self.assertEqual(get_lock_stats('test.coalesce')['coalesced'], 2)
+        self.assertIsNone(self.redis.get('task_lock:test.coalesce'))
+
+    def test_trigger_between_last_check_and_release_is_rerun(self):
+        calls = []
+        release = TaskLock.release
+
+        @single_flight(name='test.late', lease=60, coalesce=True)
+        def task():
+            calls.append(len(calls))
+
+        def late_trigger_release(lock):
+            # Arrives after the run found no marker, while it still holds the lock
+            if len(calls) == 1 and lock.acquired:
+                self.assertEqual(task()['status'], 'coalesced')
+            release(lock)
+
+        with patch.object(TaskLock, 'release', late_trigger_release):
+            task()
+        self.assertEqual(calls, [0, 1])
+        self.assertIsNone(cache.get('task_lock:test.late:pending'))
+        self.assertIsNone(self.redis.get('task_lock:test.late'))
+
+    def test_trigger_runs_itself_when_the_holder_finished_meanwhile(self):
+        calls = []
+
+        @single_flight(name='test.handover', lease=60, coalesce=True)
+        def task():
+            calls.append(len(calls))
+            return 'ran'
+
+        # The holder releases between the trigger's first attempt and its retry
+        with patch.object(TaskLock, 'acquire', side_effect=[False, True]):
+            self.assertEqual(task(), 'ran')
+        self.assertEqual(calls, [0])
+        self.assertIsNone(cache.get('task_lock:test.handover:pending'))
+        self.assertEqual(get_lock_stats('test.handover')['coalesced'], 0)
+
+    def test_held_lock_skips_without_coalesce(self):
+        @single_flight(name='test.skip', lease=60)
+        def task():
+            return 'ran'
+
+        holder = TaskLock('test.skip', lease=60)
+        holder.acquire()
+        self.assertEqual(task()['status'], 'skipped')
+        holder.release()
+        self.assertEqual(task(), 'ran')
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    MIDDLEWARE=[m for m in settings.MIDDLEWARE if m != 'ip_tracking.middleware.IPTrackingMiddleware'],
+)
+@patch.object(SuspiciousIPAdmin, 'list_per_page', PAGE_SIZE)
+class SuspiciousIPAdminQueryTests(TestCase):
+    """The changelist and its actions cost the same number of queries for 1 row or a full page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.changelist_url = reverse('admin:ip_tracking_suspiciousip_changelist')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        cache.clear()
+
+    def create_suspicious_ips(self, count, blocked_every=2):
+        SuspiciousIP.objects.bulk_create([
+            SuspiciousIP(ip_address=f'10.0.{i // 256}.{i % 256}', reason=f'Test detection {i}',
+                         detection_count=i % 12 + 1, request_count=i,
+                         risk_tier=SuspiciousIP.RISK_LOW)
+            for i in range(count)
+        ])
+        BlockedIP.objects.bulk_create([
+            BlockedIP(ip_address=f'10.0.{i // 256}.{i % 256}', reason='Blocked earlier')
+            for i in range(0, count, blocked_every)
+        ])
+
+    def clear(self):
+        BlockedIP.objects.all().delete()
+        SuspiciousIP.objects.all().delete()
+
+    def capture_queries(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = method(*args, **kwargs)
+        self.assertEqual(response.status_code, 200 if method == self.client.get else 302)
+        return [query['sql'] for query in queries], response
+
+    def test_changelist_queries_do_not_grow_with_the_page(self):
+        self.create_suspicious_ips(1)
+        single, _ = self.capture_queries(self.client.get, self.changelist_url)
+
+        self.clear()
+        self.create_suspicious_ips(PAGE_SIZE)
+        full, response = self.capture_queries(self.client.get, self.changelist_url)
+
+        self.assertEqual(len(full), len(single))
+        self.assertEqual(len(response.context['cl'].result_list), PAGE_SIZE)
+        self.assertContains(response, 'Already Blocked', count=PAGE_SIZE // 2)
+
+    def test_changelist_filters_and_sorts_on_the_stored_tier(self):
+        self.create_suspicious_ips(PAGE_SIZE)
+        for suspicious_ip in SuspiciousIP.objects.all():
+            suspicious_ip.save()
+
+        response = self.client.get(self.changelist_url, {'risk_level': 'MEDIUM', 'o': '-2'})
+        rows = response.context['cl'].result_list
+        self.assertEqual(len(rows), sum(1 for row in SuspiciousIP.objects.all() if row.risk_level == 'MEDIUM'))
+        self.assertTrue(all(row.risk_level == 'MEDIUM' for row in rows))
+
+        response = self.client.get(self.changelist_url, {'o': '-2'})
+        tiers = [row.risk_tier for row in response.context['cl'].result_list]
+        self.assertEqual(tiers, sorted(tiers, reverse=True))
+
+    def test_block_selected_ips_is_set_based(self):
+        self.create_suspicious_ips(2)
+        ids = list(SuspiciousIP.objects.values_list('pk', flat=True))
+        single, _ = self.capture_queries(self.client.post, self.changelist_url, {
+            'action': 'block_selected_ips', '_selected_action': ids,
+        })
+
+        self.clear()
+        self.create_suspicious_ips(PAGE_SIZE, blocked_every=5)
+        cache.set_many({f"blocked_ip_{ip}": False for ip in SuspiciousIP.objects.values_list('ip_address', flat=True)})
+        ids = list(SuspiciousIP.objects.values_list('pk', flat=True))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            full, _ = self.capture_queries(self.client.post, self.changelist_url, {
+                'action': 'block_selected_ips', '_selected_action': ids,
+            })
+
+        # Only the bulk INSERT grows, by the backend's batch size (SQLite caps parameters per query)
+        new_blocks = PAGE_SIZE - len(range(0, PAGE_SIZE, 5))
+        batch_size = min(500, connection.ops.bulk_batch_size(['ip_address', 'created_at', 'reason'], [None] * new_blocks))
+        inserts = [sql for sql in full if sql.startswith('INSERT')]
+        self.assertEqual(len(inserts), math.ceil(new_blocks / batch_size))
+        self.assertEqual(len(full) - len(inserts), len(single) - 1)
+        self.assertEqual(BlockedIP.objects.count(), PAGE_SIZE)
+        self.assertEqual(cache.get_many([f"blocked_ip_{ip}" for ip in
+                                         SuspiciousIP.objects.values_list('ip_address', flat=True)]),
+                         {f"blocked_ip_10.0.{i // 256}.{i % 256}": False for i in range(0, PAGE_SIZE, 5)})
+        # All the newly blocked IPs go out as one batch of events
+        self.assertEqual(len(callbacks), 1)
+
+
+class SuspiciousIPRiskTierTests(TestCase):
+    def test_save_stores_the_risk_tier(self):
+        suspicious_ip = SuspiciousIP.objects.create(ip_address='10.1.0.1', reason='Test', detection_count=1)
+        self.assertEqual(suspicious_ip.risk_tier, SuspiciousIP.RISK_LOW)
+
+        suspicious_ip.detection_count = 10
+        suspicious_ip.save(update_fields=['detection_count'])
+        suspicious_ip.refresh_from_db()
+        self.assertEqual(suspicious_ip.risk_tier, SuspiciousIP.RISK_HIGH)
+        self.assertEqual(suspicious_ip.get_risk_tier_display(), suspicious_ip.risk_level)
+
+
+class HourlySummaryTests(FakeRedisTestCase):
+    def log_requests(self, hour, count, ip_address='192.0.2.1'):
+        RequestLog.objects.bulk_create([
+            RequestLog(ip_address=ip_address, path='/', timestamp=hour + timedelta(minutes=10))
+            for _ in range(count)
+        ])
+
+    def test_rows_arriving_after_the_summary_are_folded_in(self):
+        hour = tasks.closed_hours(timezone.now() - tasks.HOUR_SETTLE_DELAY, 24)[-2]
+        self.log_requests(hour, 3)
+        tasks.summarize_traffic_hours()
+        tasks.generate_security_report()
+        self.assertEqual(HourlyTrafficSummary.objects.get(hour=hour).total_requests, 3)
+
+        # A buffered or replayed sink writes rows for the hour after it was summarized
+        self.log_requests(hour, 2, ip_address='192.0.2.2')
+        result = tasks.summarize_traffic_hours()
+
+        self.assertEqual(result['resummarized_hours'], [hour.isoformat()])
+        summary = HourlyTrafficSummary.objects.get(hour=hour)
+        self.assertEqual((summary.total_requests, summary.unique_ips), (5, 2))
+        report = SecurityReport.objects.get()
+        self.assertEqual((report.total_requests, report.unique_ips), (5, 2))
+
+        self.assertEqual(tasks.summarize_traffic_hours()['resummarized_hours'], [])
+
+
+class RetentionTests(FakeRedisTestCase):
+    def test_purged_suspicious_ips_leave_the_reputation_map(self):
+        SuspiciousIP.objects.create(ip_address='192.0.2.10', reason='Old', detection_count=12,
+                                    last_detected=timezone.now() - timedelta(days=30))
+        SuspiciousIP.objects.create(ip_address='192.0.2.11', reason='Recent', detection_count=12)
+        self.assertEqual(set(refresh_reputation()), {'192.0.2.10', '192.0.2.11'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tasks.purge_expired_records()
+
+        self.assertEqual(set(cache.get(reputation.MAP_KEY)['tiers']), {'192.0.2.11'})
+
+    def test_purge_drops_paths_no_row_references(self):
+        old = timezone.now() - timedelta(days=60)
+        expired, live = RequestPath.objects.bulk_create([
+            RequestPath(path_hash=1, path='/expired', first_seen=old),
+            RequestPath(path_hash=2, path='/live', first_seen=old),
+        ])
+        # Just created by a writer that has not inserted its row yet
+        fresh = RequestPath.objects.create(path_hash=3, path='/fresh')
+        RequestLog.objects.create(ip_address='192.0.2.1', path_ref=expired, timestamp=old)
+        RequestLog.objects.create(ip_address='192.0.2.1', path_ref=live)
+
+        self.assertEqual(tasks.purge_expired_records()['deleted']['RequestPath'], 1)
+        self.assertEqual(set(RequestPath.objects.values_list('pk', flat=True)), {live.pk, fresh.pk})
+
+    def test_purge_command_reports_paths_separately(self):
+        RequestPath.objects.create(path_hash=1, path='/expired', first_seen=timezone.now() - timedelta(days=60))
+        output = StringIO()
+        call_command('purge_expired_records', stdout=output)
+
+        self.assertIn('RequestPath: removed 1 unreferenced path entries', output.getvalue())
+        self.assertNotIn('RequestPath: no TTL configured', output.getvalue())
+
+    def test_retention_tasks_share_one_lock(self):
+        holder = TaskLock(tasks.RETENTION_LOCK, lease=60)
+        holder.acquire()
+        try:
+            self.assertEqual(tasks.cleanup_old_suspicious_ips()['status'], 'skipped')
+            self.assertEqual(tasks.purge_expired_records()['status'], 'skipped')
+        finally:
+            holder.release()
+
+
+class PartitioningTests(TestCase):
+    def test_migrate_leaves_conversion_to_the_command(self):
+        migration = import_module('ip_tracking.migrations.0005_partition_requestlog').Migration
+        self.assertEqual(migration.operations, [])
+
+    def test_partitioning_is_a_no_op_off_postgresql(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('only meaningful on other backends')
+        self.assertFalse(partitioning.convert_to_partitioned())
+        self.assertEqual(partitioning.ensure_partitions(), [])
+        out = StringIO()
+        call_command('requestlog_partitions', '--convert', stdout=out)
+        self.assertIn('only available on PostgreSQL', out.getvalue())
+
+    def test_admin_indexes_are_built_outside_a_transaction(self):
+        migration = import_module('ip_tracking.migrations.0013_requestlog_admin_indexes').Migration
+        self.assertFalse(migration.atomic)
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, RequestLog._meta.db_table)
+        self.assertIn('ip_tracking_path_prefix_idx', constraints)
+        self.assertIn('ip_tracking_location_idx', constraints)
+        self.assertNotIn('ip_tracking_path_65894f_idx', constraints)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RollupTests(TestCase):
+    def log(self, row_id, minutes_ago=5, ip_address='192.0.2.1'):
+        RequestLog.objects.create(id=row_id, ip_address=ip_address, path='/',
+                                  timestamp=timezone.now() - timedelta(minutes=minutes_ago))
+
+    def test_rows_committed_out_of_id_order_are_folded(self):
+        self.log(1)
+        self.log(2)
+        # Ids 3 and 4 belong to a writer whose transaction has not committed yet
+        self.log(5)
+        rollups.update_rollups()
+        self.assertEqual(rollups.total_requests(), 3)
+        self.assertEqual(RollupCheckpoint.objects.get(name=rollups.CHECKPOINT_NAME).pending_ids[0][:2], [3, 4])
+
+        self.log(3)
+        self.log(4, minutes_ago=60 * 24)
+        rollups.update_rollups()
+        self.assertEqual(rollups.total_requests(), 5)
+        self.assertEqual(RollupCheckpoint.objects.get(name=rollups.CHECKPOINT_NAME).pending_ids, [])
+
+        # Nothing is counted twice on later runs
+        self.log(6, minutes_ago=60 * 48)
+        rollups.update_rollups()
+        self.assertEqual(rollups.total_requests(), 6)
+
+    def test_abandoned_gaps_are_forgotten(self):
+        self.log(1)
+        self.log(3)
+        rollups.update_rollups()
+        rollups.update_rollups(now=timezone.now() + timedelta(seconds=rollups.get_rollup_settings()['GAP_SECONDS'] + 1))
+        self.assertEqual(RollupCheckpoint.objects.get(name=rollups.CHECKPOINT_NAME).pending_ids, [])
+
+    def test_public_stats_cover_the_request_log_retention_window(self):
+        old = timezone.now() - timedelta(days=60)
+        GeoTrafficRollup.objects.create(bucket=old, request_count=100)
+        IPTrafficRollup.objects.create(bucket=old, ip_address='192.0.2.99', request_count=100)
+        self.log(1)
+        rollups.update_rollups()
+
+        stats = compute_public_stats()
+        self.assertEqual((stats['total_requests'], stats['unique_ips']), (1, 1))
+
+
+class RecordingBackend:
+    def __init__(self):
+        self.batches = []
+        self.written = threading.Event()
+
+    def write(self, records):
+        self.batches.append(list(records))
+        self.written.set()
+        return len(records)
+
+
+class DatabaseSinkTests(SimpleTestCase):
+    def record(self, path='/'):
+        return {'ip_address': '192.0.2.1', 'timestamp': timezone.now(), 'path': path}
+
+    def test_idle_worker_flushes_a_partial_batch_on_a_timer(self):
+        backend = RecordingBackend()
+        sink = DatabaseSink(backend, batch_size=100, flush_interval=0.05)
+        sink.emit(self.record('/a'))
+        sink.emit(self.record('/b'))
+
+        # No further request arrives, yet the buffer is written
+        self.assertTrue(backend.written.wait(2))
+        self.assertEqual([[record['path'] for record in batch] for batch in backend.batches], [['/a', '/b']])
+        self.assertIsNone(sink._timer)
+
+    def test_full_batch_cancels_the_timer(self):
+        backend = RecordingBackend()
+        sink = DatabaseSink(backend, batch_size=2, flush_interval=60)
+        sink.emit(self.record())
+        self.assertIsNotNone(sink._timer)
+        sink.emit(self.record())
+        self.assertEqual(len(backend.batches), 1)
+        self.assertIsNone(sink._timer)
+
+
+class SegmentSinkTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def record(self, path='/'):
+        return {'ip_address': '192.0.2.1', 'timestamp': timezone.now(), 'path': path}
+
+    def wait_for_sealed(self, timeout=2):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if sealed_segments(self.directory):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_idle_segment_is_sealed_and_loaded(self):
+        sink = SegmentSink(self.directory, max_age=0.05)
+        sink.emit(self.record('/a'))
+        sink.emit(self.record('/b'))
+
+        # No further write arrives, yet the segment is sealed for the loader
+        self.assertTrue(self.wait_for_sealed())
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.open')])
+
+        backend = RecordingBackend()
+        self.assertEqual(load_segments(self.directory, backend), (1, 2))
+        self.assertEqual([record['path'] for record in backend.batches[0]], ['/a', '/b'])
+        self.assertEqual(os.listdir(self.directory), [])
+
+        # The next write opens a fresh segment
+        sink.emit(self.record('/c'))
+        sink.flush()
+        self.assertEqual(load_segments(self.directory, backend), (1, 1))
+
+
+class FailingWriter(StreamWriter):
+    def handle(self, records):
+        raise ValueError('poison batch')
+
+
+class StreamTests(FakeRedisTestCase):
+    stream = 'test:requests'
+
+    def publish(self, count, ip_address='192.0.2.1'):
+        sink = RedisStreamSink(self.stream)
+        for i in range(count):
+            sink.emit({'ip_address': ip_address, 'timestamp': timezone.now(), 'path': f'/{i}'})
+
+    def pending(self, group):
+        return self.redis.xpending(self.stream, group)['pending']
+
+    def test_writer_inserts_and_acknowledges(self):
+        backend = RecordingBackend()
+        writer = StreamWriter(self.stream, 'w1', backend, block_ms=None)
+        writer.ensure_group()
+        self.publish(3)
+
+        self.assertEqual(writer.run_once(), 3)
+        self.assertEqual([record['path'] for record in backend.batches[0]], ['/0', '/1', '/2'])
+        self.assertEqual(self.pending(writer.group), 0)
+
+    def test_entries_of_a_dead_consumer_are_reclaimed(self):
+        backend = RecordingBackend()
+        writer = StreamWriter(self.stream, 'w1', backend, block_ms=None, claim_idle_ms=0)
+        writer.ensure_group()
+        self.publish(2)
+        # Another consumer reads the entries and dies before its XACK
+        self.redis.xreadgroup(writer.group, 'dead', {self.stream: '>'})
+
+        self.assertEqual(writer.run_once(), 2)
+        self.assertEqual(len(backend.batches[0]), 2)
+        self.assertEqual(self.pending(writer.group), 0)
+
+    def test_failing_batch_is_retried_then_dead_lettered(self):
+        writer = FailingWriter(self.stream, 'w1', RecordingBackend(), block_ms=None,
+                               claim_idle_ms=0, max_deliveries=2)
+        writer.ensure_group()
+        self.publish(1)
+
+        # The error is logged, not raised, and the entry stays pending for a retry
+        with self.assertLogs('ip_tracking.streams', 'ERROR'):
+            self.assertEqual(writer.run_once(), 0)
+        self.assertEqual(self.pending(writer.group), 1)
+
+        with self.assertLogs('ip_tracking.streams', 'ERROR'):
+            self.assertEqual(writer.run_once(), 1)
+        self.assertEqual(self.pending(writer.group), 0)
+        self.assertEqual(self.redis.xlen(f'{self.stream}:dead'), 1)
+
+    def burst(self, at, count=3):
+        sink = RedisStreamSink(self.stream)
+        for i in range(count):
+            sink.emit({'ip_address': '192.0.2.1', 'timestamp': at, 'path': f'/{i}'})
+        RequestLog.objects.bulk_create([RequestLog(ip_address='192.0.2.1', path=f'/{i}', timestamp=at) for i in range(count)])
+
+    def hourly_run(self, at):
+        with patch('django.utils.timezone.now', return_value=at):
+            tasks.detect_suspicious_ips()
+
+    @override_settings(ANOMALY_DETECTION_SETTINGS={'HIGH_FREQUENCY_THRESHOLD': 2})
+    def test_realtime_and_hourly_detection_count_a_burst_once(self):
+        detector = StreamDetector(self.stream, 'd1', threshold=2, block_ms=None)
+        detector.ensure_group()
+        hour = tasks.detection_hour(timezone.now()) - timedelta(hours=2)
+        self.burst(hour + timedelta(minutes=20))
+
+        detector.run_once()
+        self.assertEqual(SuspiciousIP.objects.get(ip_address='192.0.2.1').detection_count, 1)
+
+        # The hourly task after that hour sees the same burst in its window
+        self.hourly_run(hour + timedelta(hours=1, minutes=5))
+        suspicious_ip = SuspiciousIP.objects.get(ip_address='192.0.2.1')
+        self.assertEqual(suspicious_ip.detection_count, 1)
+        self.assertEqual(suspicious_ip.request_count, 3)
+
+    @override_settings(ANOMALY_DETECTION_SETTINGS={'HIGH_FREQUENCY_THRESHOLD': 2})
+    def test_consecutive_hourly_detections_both_count(self):
+        hour = tasks.detection_hour(timezone.now()) - timedelta(hours=3)
+        self.burst(hour + timedelta(minutes=20))
+        self.burst(hour + timedelta(hours=1, minutes=20))
+
+        # The second run starts a little less than an hour after the first
+        self.hourly_run(hour + timedelta(hours=1, minutes=2))
+        self.hourly_run(hour + timedelta(hours=2, minutes=1))
+        self.assertEqual(SuspiciousIP.objects.get(ip_address='192.0.2.1').detection_count, 2)
+
+    def test_repeat_flags_update_one_row(self):
+        tasks.flag_suspicious_ip('192.0.2.9', {'reason': 'Reported'})
+        tasks.flag_suspicious_ip('192.0.2.9', {'reason': 'Reported again'})
+        self.assertEqual(SuspiciousIP.objects.filter(ip_address='192.0.2.9').count(), 1)
+        self.assertEqual(SuspiciousIP.objects.get(ip_address='192.0.2.9').detection_count, 2)
+
+
+class BenchmarkCommandTests(TransactionTestCase):
+    def test_benchmark_leaves_request_logs_alone(self):
+        RequestLog.objects.create(ip_address='198.51.100.1', path='/real')
+        call_command('benchmark_tracking_db', writers=1, rows=5, session_ops=2, stdout=StringIO())
+
+        self.assertEqual(list(RequestLog.objects.values_list('path', flat=True)), ['/real'])
+        self.assertNotIn('ip_tracking_requestlog_benchmark', connection.introspection.table_names())
+
+    def test_ingestion_benchmark_leaves_request_logs_alone(self):
+        RequestLog.objects.create(ip_address='198.51.100.1', path='/real')
+        output = StringIO()
+        call_command('benchmark_ingestion', rows=5, batch_size=2, methods='create,bulk_create', stdout=output)
+
+        self.assertIn('bulk_create', output.getvalue())
+        self.assertEqual(list(RequestLog.objects.values_list('path', flat=True)), ['/real'])
+        self.assertNotIn('ip_tracking_requestlog_benchmark', connection.introspection.table_names())
+
+
+@override_settings(ANOMALY_DETECTION_SETTINGS={'HIGH_FREQUENCY_THRESHOLD': 100})
+class SampledIPDetectionTests(FakeRedisTestCase):
+    stream = 'test:sampled'
+
+    def setUp(self):
+        super().setUp()
+        sampler = RequestSampler([{'name': 'internal', 'cidrs': ['10.0.0.0/8'], 'rate': 0.01}])
+        # The first client the 1% rule logs; all of its requests are logged with weight 100
+        self.ip_address = next(f'10.0.0.{i}' for i in range(256) if sampler.decide('GET', f'10.0.0.{i}', '/'))
+        self.assertEqual(sampler.decision('GET', self.ip_address, '/'), (100, 1))
+
+    def test_two_sampled_requests_do_not_flag_the_ip(self):
+        RequestLog.objects.bulk_create([
+            RequestLog(ip_address=self.ip_address, path='/', sample_weight=100) for _ in range(2)
+        ])
+        tasks.detect_suspicious_ips()
+
+        self.assertFalse(SuspiciousIP.objects.exists())
+        self.assertEqual(rollups.top_ips(None, None, 1)[0]['count'], 2)
+        self.assertEqual(rollups.total_requests(), 200)
+
+    def test_ip_path_sampled_client_is_extrapolated(self):
+        sampler = RequestSampler([{'name': 'spread', 'rate': 0.1, 'sample_by': 'ip_path'}])
+        paths = [f'/item/{i}' for i in range(300)]
+        kept = [path for path in paths if sampler.decide('GET', '192.0.2.7', path)]
+        self.assertEqual(sampler.decision('GET', '192.0.2.7', kept[0]), (10, 10))
+        # 300 requests, about 30 of them logged: the logged rows alone stay under the threshold
+        self.assertLess(len(kept), 100)
+        RequestLog.objects.bulk_create([
+            RequestLog(ip_address='192.0.2.7', path=path, sample_weight=10, ip_weight=10) for path in kept
+        ])
+        tasks.detect_suspicious_ips()
+
+        self.assertEqual(SuspiciousIP.objects.get(ip_address='192.0.2.7').request_count, 10 * len(kept))
+
+    def test_stream_detector_ignores_the_sample_weight(self):
+        detector = StreamDetector(self.stream, 'd1', threshold=100, block_ms=None)
+        detector.ensure_group()
+        sink = RedisStreamSink(self.stream)
+        for _ in range(2):
+            sink.emit({'ip_address': self.ip_address, 'timestamp': timezone.now(), 'path': '/', 'sample_weight': 100})
+
+        detector.run_once()
+        self.assertFalse(SuspiciousIP.objects.exists())
+
+
+class RecordingSink:
+    defers_enrichment = False
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        pass
+
+
+class CollapsingSinkTests(SimpleTestCase):
+    def record(self, path='/', **extra):
+        return {'ip_address': '192.0.2.1', 'timestamp': timezone.now(), 'path': path, **extra}
+
+    def test_repeats_within_the_window_become_one_counted_record(self):
+        inner = RecordingSink()
+        sink = CollapsingSink(inner, window=60)
+        first = self.record('/a')
+        sink.emit(first)
+        sink.emit(self.record('/a'))
+        last = self.record('/a')
+        sink.emit(last)
+        sink.emit(self.record('/b'))
+        # A different sample weight is a different group
+        sink.emit(self.record('/a', sample_weight=10))
+        self.assertEqual(inner.records, [])
+
+        sink.flush()
+        collapsed = {(record['path'], record.get('sample_weight')): record for record in inner.records}
+        self.assertEqual({key: record['hit_count'] for key, record in collapsed.items()},
+                         {('/a', None): 3, ('/b', None): 1, ('/a', 10): 1})
+        self.assertEqual(collapsed['/a', None]['timestamp'], first['timestamp'])
+        self.assertEqual(collapsed['/a', None]['last_seen'], last['timestamp'])
+
+    def test_groups_pass_on_when_their_window_ends_or_too_many_are_open(self):
+        inner = RecordingSink()
+        sink = CollapsingSink(inner, window=0.05, max_keys=2)
+        sink.emit(self.record('/a'))
+        time.sleep(0.06)
+        sink.emit(self.record('/b'))
+        self.assertEqual([record['path'] for record in inner.records], ['/a'])
+
+        sink.emit(self.record('/c'))
+        sink.emit(self.record('/d'))
+        self.assertEqual([record['path'] for record in inner.records], ['/a', '/b'])
+
+    def test_idle_group_is_passed_on_by_the_timer(self):
+        inner = RecordingSink()
+        sink = CollapsingSink(inner, window=0.05)
+        sink.emit(self.record('/a'))
+        sink.emit(self.record('/a'))
+
+        # No further emit(): the timer hands the group on
+        deadline = time.monotonic() + 2
+        while not inner.records and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([(record['path'], record['hit_count']) for record in inner.records], [('/a', 2)])
+        self.assertIsNone(sink._timer)
+
+
+class CollapsedStreamTests(FakeRedisTestCase):
+    stream = 'test:collapsed'
+
+    def setUp(self):
+        super().setUp()
+        sink = CollapsingSink(RedisStreamSink(self.stream), window=60)
+        self.writer = StreamWriter(self.stream, 'w1', ORMBackend(), block_ms=None, claim_idle_ms=0)
+        self.writer.ensure_group()
+        for _ in range(3):
+            sink.emit({'ip_address': '192.0.2.1', 'timestamp': timezone.now(), 'path': '/items/7?page=2'})
+        sink.flush()
+
+    def test_collapsed_entry_is_written_as_one_counted_row(self):
+        self.assertEqual(self.writer.run_once(), 1)
+
+        row = RequestLog.objects.get()
+        self.assertEqual((row.hit_count, row.normalized_path), (3, '/items/{id}?page'))
+        self.assertIsNotNone(row.last_seen)
+        self.assertEqual(RequestLog.objects.aggregate(total=request_total())['total'], 3)
+
+    def test_redelivery_after_a_crash_writes_the_batch_again(self):
+        # w1 inserts the batch and dies before its XACK
+        self.writer.handle([decode_record(fields) for _, fields in self.writer.read_batch()])
+        self.assertEqual(self.redis.xpending(self.stream, self.writer.group)['pending'], 1)
+
+        survivor = StreamWriter(self.stream, 'w2', ORMBackend(), block_ms=None, claim_idle_ms=0)
+        self.assertEqual(survivor.run_once(), 1)
+        self.assertEqual(self.redis.xpending(self.stream, self.writer.group)['pending'], 0)
+        # Delivery is at-least-once: the collapsed row, hit_count included, is there twice
+        self.assertEqual(list(RequestLog.objects.values_list('hit_count', flat=True)), [3, 3])
+
+
+class PathNormalizationTests(TestCase):
+    def test_ids_and_query_strings_fold_into_one_shape(self):
+        normalizer = PathNormalizer()
+        self.assertEqual(normalizer.normalize('/items/123/?b=2&a=1'), '/items/{id}/?a&b')
+        self.assertEqual(normalizer.normalize('/items/124/?a=9&b=8'), '/items/{id}/?a&b')
+        self.assertEqual(normalizer.normalize('/files/0123456789abcdef0123/'), '/files/{hash}/')
+        self.assertEqual(
+            normalizer.normalize('/users/123e4567-e89b-12d3-a456-426614174000'), '/users/{uuid}'
+        )
+        self.assertEqual(PathNormalizer(query_string='strip').normalize('/items/1?a=1'), '/items/{id}')
+
+    def test_route_names(self):
+        normalizer = PathNormalizer(route_names=True)
+        self.assertEqual(normalizer.normalize(reverse('public_stats') + '?x=1'), 'route:public_stats')
+        self.assertEqual(normalizer.normalize('/no/such/page/1'), '/no/such/page/{id}')
+
+    def test_path_rollup_groups_normalized_paths(self):
+        ORMBackend().write([
+            {'ip_address': '192.0.2.1', 'timestamp': timezone.now(), 'path': f'/items/{i}?page={i}'}
+            for i in range(3)
+        ])
+        rollups.update_rollups()
+        self.assertEqual(rollups.top_paths(None, None, 5), [{'path': '/items/{id}?page', 'count': 3}])
+
+
+TRACKING_DATABASES = {
+    alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}
+    for alias in ('tracking', 'replica')
+}
+
+
+class TrackingRouterTests(SimpleTestCase):
+    router = TrackingRouter()
+
+    @patch.dict(settings.DATABASES, TRACKING_DATABASES)
+    @override_settings(TRACKING_DATABASE={'ALIAS': 'tracking', 'REPLICAS': ['replica']})
+    def test_tracking_tables_live_on_their_own_database(self):
+        self.assertEqual(self.router.db_for_read(RequestLog), 'replica')
+        # State that is read and written back stays on the primary
+        self.assertEqual(self.router.db_for_read(SuspiciousIP), 'tracking')
+        self.assertEqual(self.router.db_for_read(RequestLog, instance=RequestLog()), 'tracking')
+        self.assertEqual(self.router.db_for_write(RequestLog), 'tracking')
+        self.assertIsNone(self.router.db_for_write(get_user_model()))
+
+        self.assertTrue(self.router.allow_migrate('tracking', 'ip_tracking'))
+        self.assertFalse(self.router.allow_migrate('default', 'ip_tracking'))
+        self.assertFalse(self.router.allow_migrate('tracking', 'auth'))
+        self.assertFalse(self.router.allow_migrate('replica', 'ip_tracking'))
+
+    @override_settings(TRACKING_DATABASE={'ALIAS': 'tracking', 'REPLICAS': ['replica']})
+    def test_unconfigured_alias_falls_back_to_default(self):
+        self.assertEqual(self.router.db_for_read(RequestLog), 'default')
+        self.assertEqual(self.router.db_for_write(RequestLog), 'default')
+        self.assertIsNone(self.router.allow_migrate('default', 'ip_tracking'))
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.day = archive.day_floor(timezone.now() - timedelta(days=10))
+
+    def log(self, pk, ip_address='192.0.2.1', hit_count=1):
+        return RequestLog.objects.create(id=pk, ip_address=ip_address, path=f'/{pk}', hit_count=hit_count,
+                                         timestamp=self.day + timedelta(hours=1, seconds=pk))
+
+    def archive(self, compression='zlib'):
+        with override_settings(REQUEST_ARCHIVE={'COMPRESSION': compression}):
+            return archive.archive_before(self.day + timedelta(days=1), directory=self.directory)
+
+    def test_export_read_delete_round_trip(self):
+        self.log(10, hit_count=3)
+        self.log(12, ip_address='192.0.2.2')
+
+        self.assertEqual(self.archive(compression='none'), 2)
+        self.assertFalse(RequestLog.objects.exists())
+
+        with archive.ArchiveAnalytics(self.directory) as analytics:
+            self.assertEqual(analytics.total_requests(), 4)
+            self.assertEqual([(stat['ip_address'], stat['count']) for stat in analytics.top_ips(None, None, 2)],
+                             [('192.0.2.1', 3), ('192.0.2.2', 1)])
+            (opened,) = list(analytics.archives(None, None))
+            self.assertEqual(opened.ids(), [10, 12])
+        self.assertTrue(opened._map.closed)
+
+    def test_row_committed_late_is_not_deleted_unarchived(self):
+        self.log(10)
+        self.log(12)
+        export_day = archive.export_day
+
+        def export_then_commit_late(*args, **kwargs):
+            exported = export_day(*args, **kwargs)
+            # Id 11 was allocated before the export but commits after it
+            self.log(11)
+            return exported
+
+        with patch('ip_tracking.archive.export_day', side_effect=export_then_commit_late):
+            self.archive()
+        self.assertEqual(list(RequestLog.objects.values_list('id', flat=True)), [11])
+
+        # The next run archives it into a second part
+        self.assertEqual(self.archive(), 1)
+        self.assertFalse(RequestLog.objects.exists())
+        with archive.ArchiveAnalytics(self.directory) as analytics:
+            self.assertEqual(analytics.total_requests(), 3)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        RequestLog.objects.create(ip_address='192.0.2.1', path='/old', timestamp=now - timedelta(minutes=10))
+        RequestLog.objects.create(ip_address='192.0.2.1', path='/recent', timestamp=now - timedelta(minutes=2))
+
+    def exported_paths(self):
+        return [row[4] for row in export.export_rows()]
+
+    @override_settings(REQUEST_LOG_INGESTION={'SINK': 'segments', 'SEGMENT_MAX_AGE': 10.0})
+    def test_hold_back_follows_the_segment_sink(self):
+        self.assertEqual(export.settle_seconds(), 10.0 + 15.0 + 60)
+        self.assertEqual(self.exported_paths(), ['/old', '/recent'])
+
+    @override_settings(REQUEST_LOG_INGESTION={'SINK': 'stream'})
+    def test_hold_back_covers_stream_redeliveries(self):
+        # Five deliveries one claim interval apart, plus the block time and the margin
+        self.assertEqual(export.settle_seconds(), 5 + 5 * 60 + 60)
+        self.assertEqual(self.exported_paths(), ['/old'])
+
+    @override_settings(REQUEST_LOG_EXPORT={'SETTLE_SECONDS': 0})
+    def test_command_writes_to_its_stdout(self):
+        output = StringIO()
+        call_command('export_request_logs', format='ndjson', start='2000-01-01T00:00:00', stdout=output)
+        self.assertEqual([json.loads(line)['path'] for line in output.getvalue().splitlines()], ['/old', '/recent'])
+
+
+class RequestLogAPITests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        # Filtered to one client so the middleware logging these API calls does not change the list
+        self.url = reverse('api_request_logs') + '?ip=192.0.2.1'
+        RequestLog.objects.create(ip_address='192.0.2.1', path='/a')
+
+    def test_late_row_changes_the_validator(self):
+        first = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', first.headers)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # Logged late: a new id behind the newest timestamp
+        RequestLog.objects.create(ip_address='192.0.2.1', path='/late', timestamp=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_rate_limited_request_gets_429_with_retry_after(self):
+        with patch('ip_tracking.ratelimit.check', return_value=SimpleNamespace(allowed=False, retry_after=2.5)):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '3')
+
+
+class PublicStatsTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('public_stats')
+        delay = patch.object(tasks.refresh_public_stats, 'delay')
+        self.delay = delay.start()
+        self.addCleanup(delay.stop)
+        # More requests than the anonymous rate allows
+        limiter = patch('ip_tracking.ratelimit.check', return_value=SimpleNamespace(allowed=True))
+        limiter.start()
+        self.addCleanup(limiter.stop)
+
+    def get(self, **headers):
+        return self.client.get(self.url, HTTP_ACCEPT='application/json', **headers)
+
+    def age_snapshot(self, seconds):
+        snapshot = cache.get(stats.SNAPSHOT_KEY)
+        snapshot['generated_at'] -= seconds
+        cache.set(stats.SNAPSHOT_KEY, snapshot, None)
+
+    def test_unchanged_snapshot_is_a_304_until_a_refresh(self):
+        stats.refresh_public_stats()
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+        BlockedIP.objects.create(ip_address='203.0.113.9', reason='Test')
+        stats.refresh_public_stats()
+        response = self.get(HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.json()['total_blocked'], 1)
+
+    def test_fresh_snapshot_headers(self):
+        stats.refresh_public_stats()
+        response = self.get()
+        cache_control = response['Cache-Control']
+
+        self.assertIn('public', cache_control)
+        self.assertRegex(cache_control, r'max-age=(60|59)\b')
+        self.assertIn('stale-while-revalidate=300', cache_control)
+        self.assertIn('Accept', response['Vary'])
+        self.assertIn('Last-Modified', response.headers)
+        # HTML and JSON renderings have their own validators
+        self.assertNotEqual(self.client.get(self.url)['ETag'], response['ETag'])
+        self.delay.assert_not_called()
+
+    def test_stale_snapshot_is_served_while_one_refresh_is_queued(self):
+        stats.refresh_public_stats()
+        self.age_snapshot(120)
+        for _ in range(2):
+            response = self.get()
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('max-age=0', response['Cache-Control'])
+            self.assertIn('stale-while-revalidate=300', response['Cache-Control'])
+        self.delay.assert_called_once_with()
+
+        # The queued task stores a fresh snapshot and lets the next stale one queue again
+        self.assertEqual(tasks.refresh_public_stats()['status'], 'success')
+        self.assertRegex(self.get()['Cache-Control'], r'max-age=(60|59)\b')
+        self.age_snapshot(120)
+        self.get()
+        self.assertEqual(self.delay.call_count, 2)
+
+    def test_missing_snapshot_is_not_cached(self):
+        response = self.get()
+
+        self.assertEqual(response.json(), stats.EMPTY_STATS)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('Last-Modified', response.headers)
+        self.delay.assert_called_once_with()
+
+
+@override_settings(DASHBOARD_SETTINGS={'PAGE_SIZE': 2, 'QUERY_BUDGET': 6})
+class DashboardTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(get_user_model().objects.create_user('viewer', 'viewer@example.com', 'pw'))
+        for patcher in (patch('ip_tracking.ratelimit.check', return_value=SimpleNamespace(allowed=True)),
+                        patch.object(tasks.refresh_public_stats, 'delay')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # Five rows sharing one timestamp: only the id orders them
+        at = timezone.now() - timedelta(minutes=5)
+        RequestLog.objects.bulk_create([RequestLog(ip_address='192.0.2.1', path=f'/{i}', timestamp=at) for i in range(5)])
+        self.ids = list(RequestLog.objects.filter(ip_address='192.0.2.1').order_by('-pk').values_list('pk', flat=True))
+
+    def page(self, **params):
+        response = self.client.get(reverse('dashboard'), {'ip': '192.0.2.1', **params})
+        self.assertEqual(response.status_code, 200)
+        return response.context['page']
+
+    def test_cursors_walk_equal_timestamps_both_ways(self):
+        first = self.page()
+        self.assertEqual([row.pk for row in first], self.ids[:2])
+        self.assertIsNone(first.previous_cursor)
+
+        second = self.page(after=first.next_cursor)
+        self.assertEqual([row.pk for row in second], self.ids[2:4])
+        last = self.page(after=second.next_cursor)
+        self.assertEqual([row.pk for row in last], self.ids[4:])
+        self.assertIsNone(last.next_cursor)
+
+        back = self.page(before=last.previous_cursor)
+        self.assertEqual([row.pk for row in back], self.ids[2:4])
+        newest = self.page(before=back.previous_cursor)
+        self.assertEqual([row.pk for row in newest], self.ids[:2])
+        self.assertIsNone(newest.previous_cursor)
+
+    def test_invalid_input(self):
+        response = self.client.get(reverse('dashboard'), {'ip': 'not-an-ip'})
+        self.assertEqual(response.context['filter_error'], "'not-an-ip' is not a valid IP address")
+        self.assertEqual(len(response.context['page']), 0)
+
+        # A malformed cursor falls back to the newest page
+        for cursor in ('garbage', '!!', pagination.encode_position(timezone.now(), 1)[:-3]):
+            self.assertEqual([row.pk for row in self.page(after=cursor)], self.ids[:2])
+            self.assertEqual([row.pk for row in self.page(before=cursor)], self.ids[:2])
+
+    @override_settings(DEBUG=True)
+    def test_dashboard_stays_within_its_query_budget(self):
+        self.assertEqual(len(self.page(after=self.page().next_cursor)), 2)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+
+        @query_budget(1)
+        def view(request):
+            list(RequestLog.objects.all())
+            list(BlockedIP.objects.all())
+            return 'response'
+        self.view = view
+
+    @override_settings(DEBUG=True)
+    def test_exceeding_the_budget_raises_under_debug(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'view ran 2 queries, budget is 1'):
+            self.view(self.request)
+
+    def test_exceeding_the_budget_only_logs_without_debug(self):
+        with self.assertLogs('ip_tracking.decorators', 'WARNING'):
+            self.assertEqual(self.view(self.request), 'response')
+
+
+class EventStreamTests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch('ip_tracking.events.aioredis.Redis.from_url',
+                        lambda *args, **kwargs: fakeredis.aioredis.FakeRedis(server=self.server, decode_responses=True))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_wsgi_request_gets_501(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.assertEqual(self.client.get(reverse('event_stream')).status_code, 501)
+
+    def test_event_published_after_the_history_read_is_relayed(self):
+        async def next_frames():
+            frames = events.event_frames(last_event_id=0)
+            try:
+                first = await frames.__anext__()
+                # History already read: only the confirmed subscription can deliver this one
+                events._publish([events.make_event('blocked', '192.0.2.1')])
+                return first, await asyncio.wait_for(frames.__anext__(), timeout=2)
+            finally:
+                await frames.aclose()
+
+        first, frame = asyncio.run(next_frames())
+        self.assertTrue(first.startswith('retry: '))
+        self.assertIn('event: blocked', frame)
+        self.assertIn('"ip_address":"192.0.2.1"', frame)
+
+
+class GCRATests(FakeRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        # Both clocks: TIME inside the script and the local rejection expiry
+        self.now = 1_000_000.0
+        for target in ('time.time', 'time.monotonic'):
+            patcher = patch(target, side_effect=lambda: self.now)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name, value in (('_script', None), ('_local_rejections', ratelimit.LocalRejections(100))):
+            patcher = patch.object(ratelimit, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.request = RequestFactory().get('/', REMOTE_ADDR='192.0.2.1')
+
+    def check(self, *rates, **kwargs):
+        return ratelimit.check(self.request, [('test', 'ip', rate) for rate in rates], **kwargs)
+
+    def test_burst_then_one_request_per_interval(self):
+        self.assertTrue(all(self.check('5/m').allowed for _ in range(5)))
+        rejected = self.check('5/m')
+        self.assertFalse(rejected.allowed)
+        self.assertAlmostEqual(rejected.retry_after, 12, places=3)
+
+        for _ in range(3):
+            self.now += 12
+            self.assertTrue(self.check('5/m').allowed)
+            self.assertFalse(self.check('5/m').allowed)
+
+    def test_rejected_request_charges_no_rule(self):
+        self.assertTrue(self.check('100/m', '1/m').allowed)
+        self.assertFalse(self.check('100/m', '1/m').allowed)
+        loose, tight = self.check('100/m', '1/m', charge=False).usages
+        self.assertEqual(loose.remaining, 99)
+        self.assertEqual(tight.remaining, 0)
+
+    def test_rejected_key_is_rejected_locally_until_its_retry_time(self):
+        self.check('1/m')
+        self.assertFalse(self.check('1/m').allowed)
+        self.redis.flushall()
+        self.assertFalse(self.check('1/m').allowed)
+        self.now += 60
+        self.assertTrue(self.check('1/m').allowed)
+
+    def test_redis_failure_fails_open_unless_configured(self):
+        failing = patch.object(ratelimit, '_get_script', return_value=Mock(side_effect=redis.ConnectionError()))
+        with failing, self.assertLogs('ip_tracking.ratelimit', 'ERROR'):
+            self.assertIsNone(self.check('1/m'))
+        with failing, override_settings(IP_TRACKING_RATELIMIT={'FAIL_OPEN': False}), self.assertLogs('ip_tracking.ratelimit', 'ERROR'):
+            self.assertFalse(self.check('1/m').allowed)
+
+    def test_vendored_rate_parsing(self):
+        self.assertEqual(ratelimit.split_rate('10/m'), (10, 60))
+        self.assertEqual(ratelimit.split_rate('100/5m'), (100, 300))
+        self.assertEqual(ratelimit.split_rate('3/s'), (3, 1))
+        with self.assertRaises(ImproperlyConfigured):
+            ratelimit.split_rate('fast')
+        self.assertEqual(ratelimit.split_rate((7, 30)), (7, 30))
+
+
+class ReputationRateTests(SimpleTestCase):
+    def setUp(self):
+        patcher = patch.dict(reputation._local, {'checked': time.monotonic(), 'tiers': {'192.0.2.66': 'HIGH'}})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rate = reputation.reputation_rate('10/m')
+
+    def test_tier_follows_the_limited_address(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='192.0.2.66', HTTP_X_FORWARDED_FOR='198.51.100.1')
+        self.assertEqual(self.rate('test', request), (1, 60))
+
+    def test_forwarded_for_header_cannot_pick_the_tier(self):
+        clean = RequestFactory().get('/', REMOTE_ADDR='198.51.100.1', HTTP_X_FORWARDED_FOR='192.0.2.66')
+        self.assertEqual(self.rate('test', clean), '10/m')
+
+    def test_tier_follows_the_configured_resolver(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.1', HTTP_X_REAL_IP='192.0.2.66')
+        with override_settings(RATELIMIT_IP_META_KEY='HTTP_X_REAL_IP'):
+            self.assertEqual(self.rate('test', request), (1, 60))
+
+
+class AbuseReporterTests(FakeRedisTestCase):
+    def report(self, remote_addr, forwarded_for):
+        with patch('ip_tracking.views.enqueue_report', return_value=True) as enqueue:
+            response = self.client.post(reverse('api_report_abuse'), {'ip_address': '192.0.2.66', 'category': 'spam'},
+                                        REMOTE_ADDR=remote_addr, HTTP_X_FORWARDED_FOR=forwarded_for)
+        self.assertEqual(response.status_code, 202)
+        return enqueue.call_args.args[1]
+
+    def test_forged_forwarded_for_does_not_add_reporters(self):
+        reporters = {self.report('198.51.100.7', f'203.0.113.{n}') for n in range(3)}
+        self.assertEqual(reporters, {'198.51.100.7'})
+
+    def test_one_ipv6_prefix_is_one_reporter(self):
+        self.assertEqual(self.report('2001:db8::1', ''), self.report('2001:db8::2', ''))
+
+
+class ReplayDetectionTests(TestCase):
+    def setUp(self):
+        self.base = tasks.detection_hour(timezone.now()) - timedelta(hours=5)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def replay(self, *args, **options):
+        report_path = os.path.join(self.directory, 'report.json')
+        call_command('replay_detection', *args, json=report_path, stdout=StringIO(), **options)
+        with open(report_path, encoding='utf-8') as handle:
+            report = json.load(handle)
+        return report, {entry['ip_address']: entry for entry in report['top_flagged']}
+
+    def log(self, ip_address, hour, count):
+        RequestLog.objects.bulk_create([
+            RequestLog(ip_address=ip_address, path='/', timestamp=self.base + timedelta(hours=hour, minutes=10 + i))
+            for i in range(count)
+        ])
+
+    def test_threshold_hits_are_counted_and_repeat_offenders_blocked(self):
+        for hour in range(3):
+            self.log('192.0.2.1', hour, 5)
+            self.log('192.0.2.2', hour, 2)
+
+        report, flagged = self.replay(start=self.base.isoformat(), end=(self.base + timedelta(hours=3)).isoformat(),
+                                      threshold=3, block_after=3)
+        self.assertEqual(set(flagged), {'192.0.2.1'})
+        self.assertEqual(flagged['192.0.2.1']['detection_count'], 3)
+        self.assertEqual([entry['ip_address'] for entry in report['blocked']], ['192.0.2.1'])
+        # Nothing real is touched
+        self.assertFalse(SuspiciousIP.objects.exists())
+        self.assertFalse(BlockedIP.objects.exists())
+
+    def test_detections_in_one_clock_hour_count_once(self):
+        self.log('192.0.2.1', 0, 5)
+        self.log('192.0.2.1', 0, 5)
+
+        # Two half-hour runs inside one hour: flag_suspicious_ip would count one detection
+        _, flagged = self.replay(start=self.base.isoformat(), end=(self.base + timedelta(hours=1)).isoformat(),
+                                 threshold=3, window_minutes=30)
+        self.assertEqual(flagged['192.0.2.1']['detection_count'], 1)
+
+    def test_file_source_counts_collapsed_and_sampled_rows(self):
+        path = os.path.join(self.directory, 'logs.ndjson')
+        with open(path, 'w', encoding='utf-8') as handle:
+            for minute in range(2):
+                handle.write(json.dumps({
+                    'ip_address': '192.0.2.3', 'path': '/a', 'hit_count': 2, 'ip_weight': 5,
+                    'timestamp': (self.base + timedelta(minutes=minute)).isoformat(),
+                }) + '\n')
+
+        report, flagged = self.replay(file=path, threshold=15)
+        self.assertEqual(report['rows'], 2)
+        self.assertEqual(flagged['192.0.2.3']['request_count'], 20)
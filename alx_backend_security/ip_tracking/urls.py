@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('login/', views.login_view, name='login'),
@@ -7,6 +7,12 @@ urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('stats/', views.public_stats, name='public_stats'),
     
+    path('api/reports/', views.security_reports, name='security_reports'),
+    path('api/events/', views.event_stream, name='event_stream'),
+    path('api/export/', views.export_request_logs, name='export_request_logs'),
+    path('api/request-logs/', api.RequestLogList.as_view(), name='api_request_logs'),
+    path('api/blocked-ips/', api.BlockedIPList.as_view(), name='api_blocked_ips'),
+    path('api/suspicious-ips/', api.SuspiciousIPList.as_view(), name='api_suspicious_ips'),
     path('api/report-abuse/', views.api_report_abuse, name='api_report_abuse'),
     path('api/protected/', views.protected_resource, name='protected_resource'),
     
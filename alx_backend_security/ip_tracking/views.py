@@ -1,19 +1,47 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag, urlencode
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
-from django_ratelimit.decorators import ratelimit
-from django_ratelimit.core import is_ratelimited
 from django.core.cache import cache
-from .models import RequestLog, BlockedIP
+from django.db.models import Q
+from .decorators import query_budget
+from .events import EVENT_TYPES, event_frames
+from .export import (
+    CONTENT_TYPES,
+    FORMATS as EXPORT_FORMATS,
+    export_rows,
+    gzip_chunks,
+    iter_export,
+    parse_export_time,
+)
+from .pagination import keyset_page
+from .ratelimit import check as check_rate_limits, get_group, get_ip, ratelimit, resolve_ip
+from .reports import enqueue_report
+from .reputation import get_risk_tier, reputation_rate
+from .paths import hash_path
+from .stats import get_public_stats_settings, get_public_stats_snapshot
+from .models import AbuseReport, RequestLog, RequestPath, BlockedIP, SecurityReport
+from datetime import datetime, timezone as dt_timezone
+import ipaddress
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Anonymous rates, tightened for IPs flagged as suspicious
+ANONYMOUS_RATE = reputation_rate(settings.RATELIMIT_SETTINGS['ANONYMOUS_USER_RATE'])
+LOGIN_RATE = reputation_rate(settings.RATELIMIT_SETTINGS['LOGIN_RATE'])
+SENSITIVE_ACTION_RATE = reputation_rate(settings.RATELIMIT_SETTINGS['SENSITIVE_ACTION_RATE'])
+
+ABUSE_CATEGORIES = [choice for choice, _ in AbuseReport.CATEGORY_CHOICES]
+
 def get_client_ip(request):
     """Get client IP address from request"""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -39,7 +67,7 @@ def rate_limit_exceeded(request, exception):
         'retry_after': getattr(exception, 'retry_after', 60)
     }, status=429)
 
-@ratelimit(key='ip', rate=settings.RATELIMIT_SETTINGS['LOGIN_RATE'], method='POST', block=True)
+@ratelimit(key='ip', rate=LOGIN_RATE, method='POST', block=True)
 def login_view(request):
     """Login view with rate limiting"""
     if request.method == 'POST':
@@ -64,50 +92,232 @@ def logout_view(request):
     messages.success(request, 'Logged out successfully!')
     return redirect('login')
 
+DASHBOARD_FILTERS = ('ip', 'country', 'path')
+
+
+def filter_request_logs(logs, filters):
+    """
+    Apply the dashboard filters. Each one maps onto an existing index: ip onto
+    (ip_address, timestamp), path onto the path, normalized_path and path_ref
+    indexes; country is checked while walking the timestamp index.
+    Returns (queryset, error message or None).
+    """
+    if filters['ip']:
+        try:
+            ipaddress.ip_address(filters['ip'])
+        except ValueError:
+            return logs.none(), f"'{filters['ip']}' is not a valid IP address"
+        logs = logs.filter(ip_address=filters['ip'])
+    if filters['country']:
+        logs = logs.filter(country=filters['country'])
+    if filters['path']:
+        path = filters['path']
+        matches = Q(path=path) | Q(normalized_path=path)
+        path_ref_id = RequestPath.objects.filter(path_hash=hash_path(path)).values_list('id', flat=True).first()
+        if path_ref_id is not None:
+            matches |= Q(path_ref_id=path_ref_id)
+        logs = logs.filter(matches)
+    return logs, None
+
 @login_required
 @ratelimit(key='user', rate=settings.RATELIMIT_SETTINGS['AUTHENTICATED_USER_RATE'], method='GET', block=True)
+@query_budget(settings.DASHBOARD_SETTINGS['QUERY_BUDGET'])
 def dashboard(request):
-    """Dashboard view for authenticated users"""
-    recent_logs = RequestLog.objects.all()[:10]
-    blocked_ips = BlockedIP.objects.all()[:5]
+    """
+    Dashboard view for authenticated users: filterable request logs paged by
+    (timestamp, id) keyset, with totals taken from the cached stats snapshot
+    """
+    filters = {name: request.GET.get(name, '').strip() for name in DASHBOARD_FILTERS}
+    logs, filter_error = filter_request_logs(RequestLog.objects.select_related('path_ref'), filters)
+    page = keyset_page(
+        logs,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page_size=settings.DASHBOARD_SETTINGS['PAGE_SIZE'],
+    )
+    snapshot = get_public_stats_snapshot()
     
     context = {
-        'recent_logs': recent_logs,
-        'blocked_ips': blocked_ips,
-        'total_requests': RequestLog.objects.count(),
-        'total_blocked': BlockedIP.objects.count(),
+        'recent_logs': page,
+        'page': page,
+        'filters': filters,
+        'filter_error': filter_error,
+        'filter_query': urlencode({name: value for name, value in filters.items() if value}),
+        'blocked_ips': BlockedIP.objects.all()[:5],
+        'total_requests': snapshot['stats']['total_requests'],
+        'total_blocked': snapshot['stats']['total_blocked'],
     }
     return render(request, 'ip_tracking/dashboard.html', context)
 
-@ratelimit(key='ip', rate=settings.RATELIMIT_SETTINGS['ANONYMOUS_USER_RATE'], method='GET', block=True)
+@login_required
+@ratelimit(key='user', rate=settings.RATELIMIT_SETTINGS['AUTHENTICATED_USER_RATE'], method='GET', block=True)
+def security_reports(request):
+    """Stored security reports, newest first, for trend views"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 30)), 1), 365)
+    except ValueError:
+        limit = 30
+
+    reports = (SecurityReport.objects
+               .order_by('-period_end')
+               .values('id', 'generated_at', 'period_start', 'period_end', 'total_requests',
+                       'unique_ips', 'new_suspicious_ips', 'total_blocked_ips')[:limit])
+    
+    return JsonResponse({'reports': list(reports)})
+
+@ratelimit(key='ip', rate=ANONYMOUS_RATE, method='GET', block=True)
 def public_stats(request):
-    """Public statistics view with rate limiting for anonymous users"""
-    stats = {
-        'total_requests': RequestLog.objects.count(),
-        'unique_ips': RequestLog.objects.values('ip_address').distinct().count(),
-        'total_blocked': BlockedIP.objects.count(),
-    }
+    """
+    Public statistics view with rate limiting for anonymous users.
+    Serves the precomputed snapshot from ip_tracking.stats with validators and
+    Cache-Control, so repeat visits are 304s and proxies can absorb the load.
+    """
+    snapshot = get_public_stats_snapshot()
+    wants_json = request.headers.get('Accept') == 'application/json'
+    etag = quote_etag(f"{snapshot['etag']}-{'json' if wants_json else 'html'}")
+    last_modified = int(snapshot['generated_at']) if snapshot['generated_at'] else None
     
-    if request.headers.get('Accept') == 'application/json':
-        return JsonResponse(stats)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if wants_json:
+            response = JsonResponse(snapshot['stats'])
+        else:
+            response = render(request, 'ip_tracking/public_stats.html', {
+                'stats': snapshot['stats'],
+                'last_updated': (datetime.fromtimestamp(snapshot['generated_at'], tz=dt_timezone.utc)
+                                 if snapshot['generated_at'] else None),
+            })
     
-    return render(request, 'ip_tracking/public_stats.html', {'stats': stats})
+    response.headers['ETag'] = etag
+    patch_vary_headers(response, ['Accept'])
+    if snapshot['generated_at'] is None:
+        # Nothing computed yet: don't let anyone cache the placeholder
+        patch_cache_control(response, no_cache=True)
+        return response
+    
+    stats_settings = get_public_stats_settings()
+    response.headers['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(
+        response,
+        public=True,
+        max_age=max(int(stats_settings['MAX_AGE'] - snapshot['age']), 0),
+        stale_while_revalidate=stats_settings['STALE_WHILE_REVALIDATE'],
+    )
+    return response
+
+@login_required
+@permission_required('ip_tracking.view_requestlog', raise_exception=True)
+@ratelimit(key='user', rate=settings.RATELIMIT_SETTINGS['AUTHENTICATED_USER_RATE'], method='GET', block=True)
+def export_request_logs(request):
+    """
+    Stream request logs as CSV or NDJSON, oldest first.
+    Query parameters: format, start, end, ip (repeatable), after (cursor of
+    the last row received), limit and gzip=1.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+    
+    try:
+        start = parse_export_time(request.GET.get('start'), 'start')
+        end = parse_export_time(request.GET.get('end'), 'end')
+        ips = request.GET.getlist('ip')
+        for ip in ips:
+            ipaddress.ip_address(ip)
+        limit = int(request.GET['limit']) if request.GET.get('limit') else None
+        rows = export_rows(start=start, end=end, ips=ips, after=request.GET.get('after'))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    chunks = iter_export(rows, export_format, limit=limit)
+    filename = f'request_logs.{export_format}'
+    content_type = CONTENT_TYPES[export_format]
+    if request.GET.get('gzip') == '1':
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    
+    logger.info(f"Request log export ({export_format}) started by {request.user}")
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@login_required
+@permission_required('ip_tracking.view_blockedip', raise_exception=True)
+@require_http_methods(["GET"])
+async def event_stream(request):
+    """
+    Server-sent events for blocks, unblocks and detections. Async, so under
+    ASGI an idle stream holds no worker thread; under WSGI each stream would
+    hold one for as long as the browser stays connected, so it answers 501
+    there. Query parameter: type (repeatable) to receive only some event types.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'error': 'The event stream requires an ASGI server'}, status=501)
+    
+    event_types = request.GET.getlist('type')
+    unknown = [event_type for event_type in event_types if event_type not in EVENT_TYPES]
+    if unknown:
+        return JsonResponse({'error': f"type must be one of {', '.join(EVENT_TYPES)}"}, status=400)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    response = StreamingHttpResponse(event_frames(last_event_id, event_types), content_type='text/event-stream')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @csrf_exempt
 @require_http_methods(["POST"])
-@ratelimit(key='ip', rate=settings.RATELIMIT_SETTINGS['SENSITIVE_ACTION_RATE'], method='POST', block=True)
+@ratelimit(key='ip', rate=SENSITIVE_ACTION_RATE, method='POST', block=True)
 def api_report_abuse(request):
-    """API endpoint for reporting abuse - heavily rate limited"""
+    """
+    API endpoint for reporting abuse - heavily rate limited.
+    Takes ip_address, category and description as JSON or form fields,
+    queues the report for process_abuse_reports and answers 202. The
+    reporter is the address this view's rate limit keys on, not the
+    client-supplied X-Forwarded-For, so one client cannot pose as several.
+    """
     try:
-        client_ip = get_client_ip(request)
+        reporter_ip = get_ip(request)
         
-        logger.info(f"Abuse report received from IP: {client_ip}")
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError:
+                return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+            if not isinstance(data, dict):
+                return JsonResponse({'success': False, 'message': 'Expected a JSON object'}, status=400)
+        else:
+            data = request.POST
+        
+        ip_address = str(data.get('ip_address') or '').strip()
+        category = str(data.get('category') or 'other')
+        description = str(data.get('description') or '')
+        try:
+            ipaddress.ip_address(ip_address)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'ip_address must be a valid IP address'}, status=400)
+        if category not in ABUSE_CATEGORIES:
+            return JsonResponse({
+                'success': False,
+                'message': f"category must be one of {', '.join(ABUSE_CATEGORIES)}"
+            }, status=400)
+        
+        if not enqueue_report(ip_address, reporter_ip, category, description):
+            return JsonResponse({'success': False, 'message': 'Reports are not being accepted right now'}, status=503)
         
+        logger.info(f"Abuse report against {ip_address} queued from IP: {reporter_ip}")
         
         return JsonResponse({
             'success': True,
-            'message': 'Abuse report submitted successfully'
-        })
+            'message': 'Abuse report accepted for processing'
+        }, status=202)
     except Exception as e:
         logger.error(f"Error processing abuse report: {str(e)}")
         return JsonResponse({
@@ -123,36 +333,31 @@ def check_rate_limit_status(request):
     client_ip = get_client_ip(request)
     user = request.user if request.user.is_authenticated else None
     
-    limits = {}
+    rules = [
+        (get_group(public_stats), 'ip', ANONYMOUS_RATE),
+        (get_group(login_view), 'ip', LOGIN_RATE),
+    ]
+    if user:
+        rules.append((get_group(dashboard), 'user', settings.RATELIMIT_SETTINGS['AUTHENTICATED_USER_RATE']))
     
-
-    limits['ip_anonymous'] = is_ratelimited(
-        request, 
-        key='ip', 
-        rate=settings.RATELIMIT_SETTINGS['ANONYMOUS_USER_RATE'],
-        method='GET'
-    )
-    
-    if user and user.is_authenticated:
-        limits['user_authenticated'] = is_ratelimited(
-            request,
-            key='user',
-            rate=settings.RATELIMIT_SETTINGS['AUTHENTICATED_USER_RATE'],
-            method='GET'
-        )
-    
-    limits['login_attempts'] = is_ratelimited(
-        request,
-        key='ip',
-        rate=settings.RATELIMIT_SETTINGS['LOGIN_RATE'],
-        method='POST'
-    )
+    # Looks at every rule in one round trip without charging any of them
+    decision = check_rate_limits(request, rules, charge=False)
+    limits = {}
+    for usage in decision.usages if decision else []:
+        limits[usage.group.rsplit('.', 1)[-1]] = {
+            'key': usage.key,
+            'limit': f'{usage.limit}/{usage.period}s',
+            'limited': usage.retry_after > 0,
+            'remaining': usage.remaining,
+            'retry_after': round(usage.retry_after, 3),
+            'reset_after': round(usage.reset_after, 3),
+        }
     
     return JsonResponse({
         'client_ip': client_ip,
         'user': str(user) if user else 'Anonymous',
+        'risk_tier': get_risk_tier(resolve_ip(request)),
         'rate_limits': limits,
-        'cache_key_prefix': f'rl:{client_ip}' if not user else f'rl:{user.id}'
     })
 
 def user_or_ip(group, request):